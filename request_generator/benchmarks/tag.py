@@ -0,0 +1,801 @@
+"""
+Benchmarks for the Tag tree.
+
+Run as,
+    python -m request_generator.benchmarks.tag [benchmark_name ...]
+
+Runs all the benchmarks when no name is given.
+"""
+
+import gc
+import os
+import sys
+import timeit
+from itertools import chain, islice
+
+from ..dom.array_tree import ArrayTree, TagHandle
+from ..dom.tag import EMPTY_ATTRS, Fragment, Mount, Tag
+from ..html.dom import simple_html_elements as HTMLDocument
+from ..utils.utils import get_abs_path
+
+SIZES = [1000, 2000, 4000, 8000]
+
+def build_form_DOM(inputs=1000):
+    """
+    Builds an HTML DOM with a form holding inputs number of
+    hidden inputs, each followed by a label.
+    """
+
+    html_dom = HTMLDocument.HTML()
+    HTMLDocument.Head(parent=html_dom)
+    body = HTMLDocument.Body(parent=html_dom)
+    form = HTMLDocument.Form(attrs={'id': 0})
+    body.append(form)
+    for index in range(inputs):
+        form.append(HTMLDocument.Input(name='param{}'.format(index),
+                                       _type=HTMLDocument.Input.Type.hidden,
+                                       value='value{}'.format(index)))
+        form.append(HTMLDocument.Label(text='label{}'.format(index)))
+    return html_dom
+
+def parse_requests(requests=1000):
+    """
+    Returns a list of requests number of HttpRequests parsed in turn from
+    the raw HTTP requests of the HTML builder tests.
+    """
+
+    from request_parser.http.request import HttpRequest
+
+    requests_dir = get_abs_path("html/tests/raw_http_requests")
+    file_names = sorted(os.listdir(requests_dir))
+    parsed = []
+    for index in range(requests):
+        with open(os.path.join(requests_dir, file_names[index % len(file_names)])) as stream:
+            request = HttpRequest(request_stream=stream)
+            request.parse_request_header()
+            request.parse_request_body()
+        parsed.append(request)
+    return parsed
+
+def build_XHR_PoC(requests=1000, **build_kwargs):
+    """
+    Builds an XHR PoC for requests number of requests, see parse_requests,
+    or for the given list of parsed requests.
+
+    Returns the HtmlRequestBuilder.
+    """
+
+    from ..builders import Type
+    from ..html.html_request_builder import HtmlRequestBuilder
+
+    if not isinstance(requests, list):
+        requests = parse_requests(requests)
+    builder = HtmlRequestBuilder(requests=requests)
+    build_kwargs.setdefault('type', Type.xhr_request)
+    builder.build(**build_kwargs)
+    return builder
+
+def parse_file_request(size):
+    """
+    Returns an HttpRequest for a multipart request uploading a file of
+    size bytes.
+    """
+
+    from StringIO import StringIO
+    from request_parser.http.request import HttpRequest
+
+    line = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ+/\r\n"
+    content = (line * (size // len(line) + 1))[:size]
+    body = ("--BOUNDARY\r\n"
+            "Content-Disposition: form-data; name=\"file\"; filename=\"file.bin\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+            "{}\r\n--BOUNDARY--\r\n").format(content)
+    raw = ("POST http://example.com/upload HTTP/1.1\r\n"
+           "Host: example.com\r\n"
+           "Content-Type: multipart/form-data; boundary=BOUNDARY\r\n"
+           "Content-Length: {}\r\n\r\n{}").format(len(body), body)
+    request = HttpRequest(request_stream=StringIO(raw))
+    request.parse_request_header()
+    request.parse_request_body()
+    return request
+
+def report(title, rows, per_node=True):
+    """
+    Prints rows of (tree size, seconds) along with the time per node
+    if per_node is True.
+    """
+
+    print title
+    for size, seconds in rows:
+        if per_node:
+            print "  {:>8} nodes  {:>10.6f}s  {:>8.3f}us/node".format(size, seconds,
+                                                                    seconds * 1e6 / size)
+        else:
+            print "  {:>8} nodes  {:>10.6f}s".format(size, seconds)
+
+def timed(function, repeat=3):
+    """
+    Returns the best of repeat runs of function.
+    """
+
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+def bench_find_all():
+    """
+    find_all by name, _type and text on growing trees.
+
+    The time per node should stay flat as the tree grows.
+    """
+
+    for query in ({'name': 'form'}, {'_type': 'html'}, {'text': 'label1'}):
+        rows = []
+        for size in SIZES:
+            html_dom = build_form_DOM(inputs=size)
+            nodes = len(list(html_dom.descendants))
+            rows.append((nodes, timed(lambda: html_dom.find_all(**query))))
+        report("find_all({})".format(query), rows)
+
+def bench_find():
+    """
+    find and iter_find for tags near the start of growing trees.
+
+    The search stops at the first match, so the time should stay flat
+    as the tree grows.
+    """
+
+    queries = [('find', lambda dom: dom.find(text='label1')),
+               ('find attrs', lambda dom: dom.find(attrs={'name': 'param1'})),
+               ('iter_find first 10', lambda dom: list(islice(dom.iter_find(_type='html_text'), 10)))]
+    for title, query in queries:
+        rows = []
+        for size in SIZES:
+            html_dom = build_form_DOM(inputs=size)
+            nodes = len(list(html_dom.descendants))
+            rows.append((nodes, timed(lambda: query(html_dom))))
+        report(title, rows, per_node=False)
+
+def bench_select():
+    """
+    Finds the hidden inputs of the first form with select and with the
+    chain of find_all calls it replaces, on growing trees.
+    """
+
+    def chained(html_dom):
+        inputs = []
+        for body in html_dom.find_all('body', recursive=False):
+            for form in body.find_all('form', recursive=False):
+                if str(form.get('id')) == '0':
+                    inputs.extend(tag for tag in form.find_all('input')
+                                  if tag.get('type') == 'hidden')
+        return inputs
+
+    queries = [('find_all chain', chained),
+               ('select', lambda dom: dom.select('body > form#0 input[type=hidden]'))]
+    for title, query in queries:
+        rows = []
+        for size in SIZES:
+            html_dom = build_form_DOM(inputs=size)
+            nodes = len(list(html_dom.descendants))
+            rows.append((nodes, timed(lambda: query(html_dom))))
+        report(title, rows)
+
+def bench_hash():
+    """
+    Hashes and compares growing trees: the first hash, which computes
+    the digests, a hash of the unchanged tree, a hash after changing one
+    input, and == between equal and unequal trees.
+
+    A hash of an unchanged tree should take the same time at every size.
+    """
+
+    rows = {'first hash': [], 'hash': [], 'hash after a change': [], '== equal': [],
+            '== unequal': []}
+    for size in SIZES:
+        html_dom, other = build_form_DOM(inputs=size), build_form_DOM(inputs=size)
+        nodes = len(list(html_dom.descendants))
+        rows['first hash'].append((nodes, timed(lambda: hash(build_form_DOM(inputs=size))) -
+                                   timed(lambda: build_form_DOM(inputs=size))))
+        hash(html_dom)
+        rows['hash'].append((nodes, timed(lambda: hash(html_dom))))
+        form_input = html_dom.find('input')
+        def change():
+            form_input['value'] = form_input['value'] + '1'
+            hash(html_dom)
+        rows['hash after a change'].append((nodes, timed(change)))
+        form_input['value'] = 'value0'
+        rows['== equal'].append((nodes, timed(lambda: html_dom == other)))
+        form_input['value'] = 'value'
+        rows['== unequal'].append((nodes, timed(lambda: html_dom == other)))
+    for name in ['first hash', 'hash', 'hash after a change', '== equal', '== unequal']:
+        report(name, rows[name], per_node=name not in ['hash', 'hash after a change',
+                                                         '== unequal'])
+
+def bench_insert():
+    """
+    Builds a body with 10k children, one at a time and all at once, and
+    then moves, looks up and unwraps children in the middle of it, and
+    inserts the children of a fragment there.
+
+    index() is O(1) so the time per node should stay flat.
+    """
+
+    rows = {'append': [], 'extend': [], 'index': [], 'insert_after': [], 'unwrap': [],
+            'fragment': []}
+    for size in [2500, 5000, 10000]:
+        def build():
+            body = HTMLDocument.Body()
+            for index in range(size):
+                body.append(HTMLDocument.Text(text='statement{};'.format(index)))
+            return body
+        rows['append'].append((size, timed(build)))
+
+        def extend():
+            body = HTMLDocument.Body()
+            body.extend(HTMLDocument.Text(text='statement{};'.format(index))
+                        for index in range(size))
+            return body
+        rows['extend'].append((size, timed(extend)))
+
+        body = build()
+        children = body.contents[:]
+        def index():
+            for child in children:
+                body.index(child)
+        rows['index'].append((size, timed(index)))
+
+        def insert_after():
+            middle = children[size // 2]
+            for child in children[:size // 4]:
+                middle.insert_after(child)
+        rows['insert_after'].append((size // 4, timed(insert_after, repeat=1)))
+
+        def unwrap():
+            holder = HTMLDocument.Script()
+            for index in range(size):
+                holder.append(HTMLDocument.Text(text='statement{};'.format(index)))
+            body.insert(holder, size // 2)
+            holder.unwrap()
+        rows['unwrap'].append((size, timed(unwrap, repeat=1)))
+
+        def fragment():
+            holder = Fragment()
+            for index in range(size):
+                holder.append(HTMLDocument.Text(text='statement{};'.format(index)))
+            body.insert(holder, size // 2)
+        rows['fragment'].append((size, timed(fragment, repeat=1)))
+
+    for name in ['append', 'extend', 'index', 'insert_after', 'unwrap', 'fragment']:
+        report(name, rows[name])
+
+def bench_teardown():
+    """
+    Tears growing trees down with decompose, clear_children and
+    clear_children(decompose=True), with the name index of the root built.
+
+    The time per node should stay flat as the tree grows.
+    """
+
+    teardowns = [('decompose', lambda dom: dom.body[0].decompose()),
+                 ('clear_children', lambda dom: dom.body[0].form[0].clear_children()),
+                 ('clear_children(decompose=True)',
+                  lambda dom: dom.body[0].form[0].clear_children(decompose=True))]
+    for title, teardown in teardowns:
+        rows = []
+        for size in SIZES:
+            doms = []
+            def setup():
+                html_dom = build_form_DOM(inputs=size)
+                html_dom.find_all('label')
+                doms.append(html_dom)
+            nodes = len(list(build_form_DOM(inputs=size).descendants))
+            rows.append((nodes, min(timeit.repeat(lambda: teardown(doms.pop()), setup=setup,
+                                                  number=1, repeat=3))))
+        report(title, rows)
+
+def bench_clone():
+    """
+    Compares building trees from scratch with cloning prebuilt ones: the
+    template DOM of the builders 1000 times, and form DOMs of growing
+    sizes.
+    """
+
+    from ..html.html_request_builder import HtmlRequestBuilder
+
+    build = HtmlRequestBuilder.build_template_DOM.__func__.build
+    template_dom = HtmlRequestBuilder.build_template_DOM()
+    rows = [('rebuilt', timed(lambda: [build(HtmlRequestBuilder) for index in range(1000)])),
+            ('cloned', timed(lambda: [template_dom.clone() for index in range(1000)]))]
+    print "1000 template DOMs"
+    for title, seconds in rows:
+        print "  {:<10} {:>10.6f}s".format(title, seconds)
+
+    rows = {'rebuilt': [], 'cloned': []}
+    for size in SIZES:
+        html_dom = build_form_DOM(inputs=size)
+        nodes = len(list(html_dom.descendants))
+        rows['rebuilt'].append((nodes, timed(lambda: build_form_DOM(inputs=size))))
+        rows['cloned'].append((nodes, timed(html_dom.clone)))
+    for title in ['rebuilt', 'cloned']:
+        report("form DOM {}".format(title), rows[title])
+
+def bench_shared():
+    """
+    Compares building the static script helpers of the builders for every
+    DOM with mounting the shared ones, 1000 times each.
+    """
+
+    from ..html.html_request_builder import HtmlRequestBuilder, TargetType
+    from ..html.jquery.jquery_request_builder import JQueryRequestBuilder
+
+    helpers = [(HtmlRequestBuilder, '_build_get_file_JS_function', {}),
+               (HtmlRequestBuilder, '_build_create_XHR_function', {}),
+               (HtmlRequestBuilder, '_build_XHR_load_in_new_tab_function', {}),
+               (HtmlRequestBuilder, '_build_create_onreadystatechange_function',
+                {'target_type': TargetType.iframe}),
+               (JQueryRequestBuilder, '_build_submit_ajax_request_function', {})]
+    print "{:<42} {:>6} {:>10} {:>10}".format("1000 helpers", "tags", "built", "mounted")
+    for builder, name, kwargs in helpers:
+        helper = getattr(builder, name)
+        build = helper.__func__.build
+        tags = len(list(build(builder, **kwargs).walk()))
+        built = timed(lambda: [build(builder, **kwargs) for index in range(1000)])
+        mounted = timed(lambda: [helper(**kwargs) for index in range(1000)])
+        print "{:<42} {:>6} {:>9.6f}s {:>9.6f}s".format(name, tags, built, mounted)
+
+def bench_lookup():
+    """
+    Appends 1000 forms to the body of growing trees, looking up
+    html_dom.body and html_dom.iframe before every append the way the
+    request builders do.
+
+    Lookups go through the name index so the time per lookup should stay
+    flat as the tree grows.
+    """
+
+    rows = []
+    for size in SIZES:
+        html_dom = build_form_DOM(inputs=size)
+        nodes = len(list(html_dom.descendants))
+        #the first lookup builds the index
+        html_dom.body
+        def lookup():
+            for index in range(1000):
+                body = html_dom.body[0]
+                html_dom.iframe
+                body.append(HTMLDocument.Form(attrs={'id': index + 1}))
+        rows.append((nodes, timed(lookup, repeat=1) / 1000))
+    report("body[0].append(form) per lookup", rows, per_node=False)
+
+def bench_walk():
+    """
+    Walks wide and deep trees in pre-order and post-order.
+
+    The walk follows the sibling and parent links, so the time per node
+    should stay flat however deep the tree is.
+    """
+
+    for shape in ['wide', 'deep']:
+        rows = {'pre-order': [], 'post-order': []}
+        for size in SIZES:
+            if shape == 'wide':
+                root = build_form_DOM(inputs=size)
+            else:
+                root = HTMLDocument.Body()
+                for index in range(size * 3):
+                    root = HTMLDocument.Body(child=root)
+            nodes = len(list(root.descendants))
+            rows['pre-order'].append((nodes, timed(lambda: list(root.walk()))))
+            rows['post-order'].append((nodes, timed(lambda: list(root.walk(post_order=True)))))
+        for order in ['pre-order', 'post-order']:
+            report("{} walk of a {} tree".format(order, shape), rows[order])
+
+def bench_memory():
+    """
+    Counts the objects and bytes that the nodes of a 1000 request XHR PoC
+    keep alive, and the objects allocated to build it.
+    """
+
+    gc.collect()
+    before = set(id(obj) for obj in gc.get_objects())
+    gc.disable()
+    try:
+        builder = build_XHR_PoC(requests=1000)
+    finally:
+        gc.enable()
+    allocated = [obj for obj in gc.get_objects() if id(obj) not in before]
+    gc.collect()
+
+    nodes = [builder.request_dom] + list(builder.request_dom.descendants)
+    #a node's own objects are the node and the attrs dict and contents list
+    #it doesn't share, if any
+    owned = {}
+    for node in nodes:
+        for obj in [node, node._attrs, node._contents]:
+            if obj is not None and obj is not EMPTY_ATTRS:
+                owned[id(obj)] = obj
+    size = sum(sys.getsizeof(obj) for obj in owned.values())
+
+    print "1000 request XHR PoC"
+    print "  {:>8} nodes".format(len(nodes))
+    print "  {:>8.1f} bytes/node".format(float(size) / len(nodes))
+    print "  {:>8.2f} objects/node kept by the nodes".format(float(len(owned)) / len(nodes))
+    print "  {:>8.2f} gc tracked objects allocated/node while building".format(
+        float(len(allocated)) / len(nodes))
+
+def bench_release():
+    """
+    Builds ten 200 request XHR PoCs in a row with the cyclic garbage
+    collector disabled, dropping each one either by releasing it or by
+    dropping the last reference to it. The requests are parsed once, the
+    parsed headers hold reference cycles of their own.
+
+    With release() the number of live objects should stay flat.
+    """
+
+    requests = parse_requests(200)
+    rows = {'dropped': [], 'released': []}
+    for title in ['dropped', 'released']:
+        gc.collect()
+        gc.disable()
+        try:
+            for batch in range(10):
+                builder = build_XHR_PoC(requests=requests)
+                if title == 'released':
+                    builder.release()
+                del builder
+                rows[title].append((batch + 1, len(gc.get_objects())))
+        finally:
+            gc.enable()
+        print "{}: live objects after each batch".format(title)
+        print "  " + " ".join("{:>8}".format(count) for batch, count in rows[title])
+        start = timeit.default_timer()
+        gc.collect()
+        print "  gc.collect() afterwards {:.6f}s".format(timeit.default_timer() - start)
+
+def bench_text_pool():
+    """
+    Creates Text tags with Text() and with a TextPool whose tags are
+    recycled in between, then builds and releases ten 200 request XHR
+    PoCs, printing the counters of the builders' pool after each.
+    """
+
+    pool = HTMLDocument.TextPool()
+    def recycled(size):
+        script = HTMLDocument.Script()
+        for index in range(size):
+            script.append(pool.text('var a;'))
+        pool.recycle(script)
+    def constructed(size):
+        script = HTMLDocument.Script()
+        for index in range(size):
+            script.append(HTMLDocument.Text(text='var a;'))
+        script.dispose()
+    rows = {'Text()': [], 'TextPool': []}
+    for size in [1000, 2000, 4000]:
+        rows['Text()'].append((size, timed(lambda: constructed(size))))
+        rows['TextPool'].append((size, timed(lambda: recycled(size))))
+    for title in ['Text()', 'TextPool']:
+        report("{} texts appended and torn down".format(title), rows[title])
+
+    requests = parse_requests(200)
+    text_pool = HTMLDocument.TEXT_POOL
+    text_pool.clear()
+    print "XHR PoCs  created   reused   pooled"
+    for batch in range(10):
+        created, reused = text_pool.created, text_pool.reused
+        build_XHR_PoC(requests=requests).release()
+        print "  {:>6}  {:>7}  {:>7}  {:>7}".format(batch + 1, text_pool.created - created,
+                                                   text_pool.reused - reused, len(text_pool))
+
+def bench_serialize():
+    """
+    Compares Tag.dumps() and Tag.loads() with cPickle, at its highest
+    protocol, on XHR PoCs of growing numbers of requests.
+    """
+
+    import cPickle
+
+    print "{:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "requests", "nodes", "format", "bytes", "dump", "load", "loaded ==")
+    for requests in [10, 20, 40]:
+        html_dom = build_XHR_PoC(requests=requests).request_dom
+        nodes = len(list(html_dom.descendants)) + 1
+        for title, dumps, loads in [('dumps', Tag.dumps, Tag.loads),
+                                    ('pickle', lambda tree: cPickle.dumps(tree, cPickle.HIGHEST_PROTOCOL),
+                                     cPickle.loads)]:
+            try:
+                data = dumps(html_dom)
+                seconds = timed(lambda: dumps(html_dom))
+                loaded = loads(data)
+                print "{:>8} {:>8} {:>10} {:>10} {:>9.6f}s {:>9.6f}s {:>10}".format(
+                    requests, nodes, title, len(data), seconds, timed(lambda: loads(data)),
+                    str(loaded == html_dom))
+            except RuntimeError as error:
+                print "{:>8} {:>8} {:>10} {}".format(requests, nodes, title, error)
+
+def forget_output(root):
+    """
+    Drops the code kept on the tree rooted at root, see Tag.write.
+    """
+
+    for tag in chain([root], root.walk()):
+        tag._output = None
+
+def generate_cold(root):
+    """
+    Returns a function that generates the tree rooted at root without
+    the code kept by the last generation.
+    """
+
+    def generate():
+        forget_output(root)
+        return root.generate()
+    return generate
+
+def bench_generate():
+    """
+    Generates form and XHR PoCs of a request uploading files of growing
+    sizes, and form DOMs of growing sizes nested in growing depths of
+    divs, and scripts of deeply nested blocks, without the code kept by
+    the last generation.
+
+    The time per megabyte should stay flat, and shouldn't grow with the
+    depth. The nested blocks are indented a space per level, so the time
+    per level grows with the length of the indents.
+    """
+
+    from ..builders import Type
+    from ..html.html_request_builder import HtmlRequestBuilder
+
+    megabyte = 1024 * 1024
+    for title, type in [('form', Type.form_request), ('XHR', Type.xhr_request)]:
+        print "{} PoC of a file upload".format(title)
+        for size in [1, 2, 4, 8]:
+            builder = HtmlRequestBuilder(requests=[parse_file_request(size * megabyte)])
+            builder.build(type=type)
+            output = len(builder.generate())
+            seconds = timed(generate_cold(builder.request_dom))
+            print "  {:>6}MB file {:>10} chars {:>10.6f}s {:>8.6f}s/MB".format(
+                size, output, seconds, seconds * megabyte / output)
+
+    html_dom = build_form_DOM(inputs=1000)
+    print "form DOM of {} nodes in nested divs".format(len(list(html_dom.descendants)))
+    for depth in [0, 10, 50, 100]:
+        body = html_dom.body[0]
+        holder = body
+        for level in range(depth):
+            holder = HTMLDocument.Element('div', parent=holder)
+        holder.append(body.form[0])
+        output = len(html_dom.generate())
+        seconds = timed(generate_cold(html_dom))
+        print "  depth {:>4} {:>10} chars {:>10.6f}s {:>8.6f}s/MB".format(
+            depth, output, seconds, seconds * megabyte / output)
+        form = body.form[0]
+        if depth:
+            body.contents[-1].extract()
+            body.append(form)
+
+    print "script of nested blocks"
+    for depth in [100, 1000, 5000]:
+        script = HTMLDocument.Script()
+        block = script
+        for level in range(depth):
+            text = HTMLDocument.Text(text='{')
+            block.append(text)
+            block = text
+        seconds = timed(generate_cold(script))
+        print "  depth {:>5} {:>10.6f}s {:>8.3f}us/level".format(depth, seconds,
+                                                                 seconds * 1e6 / depth)
+
+def bench_regenerate():
+    """
+    Generates form DOMs of growing sizes, then again, then again after
+    changing the value of a single input.
+
+    Generating again should take a small part of the time, and so should
+    generating after the change, whatever the size of the DOM.
+    """
+
+    rows = []
+    for inputs in [100, 1000, 10000]:
+        html_dom = build_form_DOM(inputs=inputs)
+        size = len(list(html_dom.descendants))
+        first = timed(generate_cold(html_dom))
+        html_dom.generate()
+        again = timed(html_dom.generate)
+        form_input = html_dom.find_all('input', limit=1)[0]
+        def change():
+            form_input['value'] = form_input['value'] + '1'
+            return html_dom.generate()
+        rows.append((size, first, again, timed(change)))
+    print "form DOM generated, again, and after a change"
+    for size, first, again, changed in rows:
+        print "  {:>8} nodes  {:>10.6f}s  {:>10.6f}s  {:>10.6f}s".format(size, first, again,
+                                                                       changed)
+
+def bench_generate_bytes():
+    """
+    Generates form and XHR PoCs of a request uploading files of growing
+    sizes as UTF-8, by encoding what generate() returns and with
+    generate_bytes, without the code kept by the last generation.
+    """
+
+    from ..builders import Type
+    from ..html.html_request_builder import HtmlRequestBuilder
+
+    for title, type in [('form', Type.form_request), ('XHR', Type.xhr_request)]:
+        print "{} PoC of a file upload encoded".format(title)
+        for size in [1, 4, 16]:
+            builder = HtmlRequestBuilder(requests=[parse_file_request(size * 1024 * 1024)])
+            builder.build(type=type)
+            html_dom = builder.request_dom
+            encoded = timed(lambda: generate_cold(html_dom)().encode('utf-8'))
+            def generate_bytes():
+                forget_output(html_dom)
+                return html_dom.generate_bytes()
+            direct = timed(generate_bytes)
+            print "  {:>6}MB file  encoded {:>10.6f}s  generate_bytes {:>10.6f}s".format(
+                size, encoded, direct)
+            builder.release()
+
+class NullSink(object):
+    """
+    A sink that only keeps the size of the largest write.
+    """
+
+    def __init__(self):
+        self.largest = 0
+
+    def write(self, data):
+        self.largest = max(self.largest, len(data))
+
+def bench_generate_to():
+    """
+    Writes XHR PoCs of a request uploading files of growing sizes to a
+    sink, as one string from generate and in chunks from generate_to.
+
+    The largest write of generate_to should stay at about the chunk size
+    however large the PoC.
+    """
+
+    from ..builders import Type
+    from ..html.html_request_builder import HtmlRequestBuilder
+
+    megabyte = 1024 * 1024
+    print "XHR PoC of a file upload written to a sink"
+    for size in [1, 4, 16]:
+        builder = HtmlRequestBuilder(requests=[parse_file_request(size * megabyte)])
+        builder.build(type=Type.xhr_request)
+        for name, write in [('generate', lambda sink: sink.write(builder.generate().encode('utf-8'))),
+                            ('generate_to', builder.generate_to)]:
+            sink = NullSink()
+            seconds = timed(lambda: write(sink))
+            print "  {:>6}MB file {:>12} {:>10.6f}s largest write {:>10} bytes".format(
+                size, name, seconds, sink.largest)
+        builder.release()
+
+def tree_size(root):
+    """
+    Returns the bytes held by the tree rooted at the Tag or TagHandle root
+    as (structure, text). The structure is the nodes, or the arrays, with
+    the attrs dicts and contents lists; the text is the values.
+    """
+
+    objects = {}
+    def add(obj):
+        if obj is not None and obj is not EMPTY_ATTRS:
+            objects[id(obj)] = obj
+
+    texts = {}
+    if isinstance(root, TagHandle):
+        tree = root._tree
+        for name in ['_parent', '_first_child', '_last_child', '_next_sibling',
+                     '_previous_sibling', '_child_count', '_name', '_kind',
+                     '_text_offset', '_text_length', '_attrs', '_other_values',
+                     '_interned', '_intern_ids']:
+            add(getattr(tree, name))
+        for attrs in tree._attrs.values():
+            add(attrs)
+        for text in tree._texts:
+            #reading the end of the buffer joins what's pending
+            text.get(0, text._size)
+            add(text._starts)
+            for chunk in text._chunks:
+                texts[id(chunk)] = chunk
+    else:
+        #the trees of mounts are counted once, like the attrs they share
+        trees = [root]
+        while trees:
+            tree = trees.pop()
+            for node in [tree] + list(tree.descendants):
+                add(node)
+                add(node._attrs)
+                add(node._contents)
+                if type(node) is Mount:
+                    if id(node.value) not in objects:
+                        trees.append(node.value)
+                else:
+                    texts[id(node.value)] = node.value
+    return (sum(sys.getsizeof(obj) for obj in objects.values()),
+            sum(sys.getsizeof(text) for text in texts.values()))
+
+def bench_intern():
+    """
+    Compares the bytes held by 1000 request form and XHR PoCs built with
+    and without interning identical subtrees, per node of the PoC built
+    without, and the time to build them and to generate their code.
+    """
+
+    from ..builders import Type
+
+    print "1000 request PoCs"
+    print "  {:<26} {:>16} {:>16} {:>10} {:>10}".format('', 'structure/node', 'text/node',
+                                                       'build', 'generate')
+    for type, title in [(Type.form_request, 'form'), (Type.xhr_request, 'XHR')]:
+        for intern_subtrees in [False, True]:
+            start = timeit.default_timer()
+            html_dom = build_XHR_PoC(requests=1000, type=type,
+                                     intern_subtrees=intern_subtrees).request_dom
+            seconds = timeit.default_timer() - start
+            if not intern_subtrees:
+                nodes = len(list(html_dom.descendants)) + 1
+            structure, text = tree_size(html_dom)
+            print "  {:<26} {:>10.1f} bytes {:>10.1f} bytes {:>9.3f}s {:>9.3f}s".format(
+                "{}{}".format(title, ', interned' if intern_subtrees else ''),
+                float(structure) / nodes, float(text) / nodes, seconds,
+                timed(html_dom.generate, repeat=1))
+
+def bench_array_tree():
+    """
+    Compares a 1000 request XHR PoC kept as Tag objects and in an
+    ArrayTree: bytes per node and the time of a full garbage collection
+    while the tree is alive.
+    """
+
+    html_dom = build_XHR_PoC(requests=1000).request_dom
+    nodes = len(list(html_dom.descendants)) + 1
+    gc.collect()
+
+    print "1000 request XHR PoC, {} nodes".format(nodes)
+    print "  {:<10} {:>16} {:>16} {:>12}".format('', 'structure/node', 'text/node',
+                                                 'gc.collect()')
+    for title in ['Tag', 'ArrayTree']:
+        if title == 'ArrayTree':
+            html_dom = ArrayTree.from_tag(html_dom)
+            #the Tag tree is left for the collector
+            gc.collect()
+        structure, text = tree_size(html_dom)
+        print "  {:<10} {:>10.1f} bytes {:>10.1f} bytes {:>11.6f}s".format(
+            title, float(structure) / nodes, float(text) / nodes, timed(gc.collect))
+
+BENCHMARKS = [
+    bench_find_all,
+    bench_find,
+    bench_select,
+    bench_hash,
+    bench_insert,
+    bench_teardown,
+    bench_clone,
+    bench_shared,
+    bench_lookup,
+    bench_walk,
+    bench_memory,
+    bench_release,
+    bench_text_pool,
+    bench_serialize,
+    bench_generate,
+    bench_regenerate,
+    bench_generate_to,
+    bench_generate_bytes,
+    bench_intern,
+    bench_array_tree,
+]
+
+def main(names=None):
+    for benchmark in BENCHMARKS:
+        if names and benchmark.__name__[len('bench_'):] not in names:
+            continue
+        benchmark()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,727 @@
+"""
+An array backed store for very large trees.
+
+A tree of Tag objects costs an object, with its parent, sibling and child
+links, for every tag. An ArrayTree keeps the same tree in a few parallel
+arrays of integers instead, and hands out lightweight TagHandle objects
+that offer the navigation, search and generation API of a Tag.
+
+A DOM built with Tag objects is moved into an ArrayTree with,
+    html_dom = ArrayTree.from_tag(html_dom)
+"""
+
+from array import array
+from bisect import bisect_right
+
+from .tag import (Tag, Fragment, EMPTY_ATTRS, SharedAttrs, CHUNK_SIZE,
+                  DEFAULT_OUTPUT_ENCODING, _matching, _limited)
+
+#index of an absent tag
+NONE = -1
+
+#_text_length of a tag whose value isn't a string
+_NO_TEXT = -1
+_OTHER_VALUE = -2
+
+class _TextBuffer(object):
+    """
+    Append only buffer of strings of one type, str or unicode.
+
+    What was appended since the last read is joined into a chunk of its
+    own by the next read, so reads between appends don't join the whole
+    buffer again. A value is never split between chunks.
+    """
+
+    __slots__ = ('_empty', '_chunks', '_starts', '_joined', '_pending', '_size')
+
+    def __init__(self, empty):
+        self._empty = empty
+        self._chunks = []
+        #offset of the start of each chunk
+        self._starts = array('l')
+        #size of the chunks
+        self._joined = 0
+        self._pending = []
+        self._size = 0
+
+    def append(self, value):
+        """
+        Appends value and returns its offset in the buffer.
+        """
+
+        offset = self._size
+        if value:
+            self._pending.append(value)
+            self._size += len(value)
+        return offset
+
+    def get(self, offset, length):
+        if not length:
+            return self._empty
+        if offset + length > self._joined:
+            #join what was appended since the last read
+            self._chunks.append(self._empty.join(self._pending))
+            self._starts.append(self._joined)
+            self._joined = self._size
+            self._pending = []
+        index = bisect_right(self._starts, offset) - 1
+        offset -= self._starts[index]
+        return self._chunks[index][offset:offset + length]
+
+class ArrayTree(object):
+    """
+    A forest of tags kept in parallel arrays.
+
+    Tag i is described by the i-th entry of each array,
+        _parent, _first_child, _last_child,
+        _next_sibling, _previous_sibling    - indices of tags, NONE if absent
+        _child_count                        - number of children
+        _name                               - index of the name in _interned
+        _kind                               - index in _interned of the
+                                              (class, _type, encoder, self_closing,
+                                              namespace, unicode value) of the tag
+        _text_offset, _text_length          - the value in the text buffer
+
+    The attributes of the tags that have some are kept in _attrs. The
+    attrs dicts are shared with the tags they were copied from.
+
+    Tags are copied in from Tag trees and read through TagHandle objects.
+    Extracted tags stay in the arrays, the space isn't reclaimed.
+    """
+
+    def __init__(self):
+        self._parent = array('i')
+        self._first_child = array('i')
+        self._last_child = array('i')
+        self._next_sibling = array('i')
+        self._previous_sibling = array('i')
+        self._child_count = array('i')
+        self._name = array('i')
+        self._kind = array('i')
+        self._text_offset = array('i')
+        self._text_length = array('i')
+
+        #index -> attrs dict, for the tags that have attributes
+        self._attrs = {}
+        #index -> value, for the tags whose value isn't a string
+        self._other_values = {}
+        #str and unicode values
+        self._texts = (_TextBuffer(''), _TextBuffer(u''))
+
+        #names and kinds are stored once
+        self._interned = []
+        self._intern_ids = {}
+
+    @classmethod
+    def from_tag(cls, tag):
+        """
+        Returns the handle of the root of a new ArrayTree holding a copy
+        of the tree rooted at tag.
+        """
+
+        tree = cls()
+        return tree.handle(tree.add_tree(tag))
+
+    def __len__(self):
+        """
+        The number of tags stored, extracted ones included.
+        """
+        return len(self._parent)
+
+    def handle(self, index):
+        """
+        Returns a handle to the tag at index.
+        """
+        return TagHandle(self, index)
+
+    def _intern(self, value):
+        try:
+            return self._intern_ids[value]
+        except KeyError:
+            self._interned.append(value)
+            self._intern_ids[value] = len(self._interned) - 1
+            return len(self._interned) - 1
+
+    def _kind_of(self, index):
+        return self._interned[self._kind[index]]
+
+    #Adding tags
+    def add_tree(self, tag, parent=NONE, successor=NONE):
+        """
+        Copies the tree rooted at tag into self.
+
+        The copy of tag becomes a child of the tag at index parent just
+        before successor, or the last one if successor is NONE. If parent
+        is NONE, the copy is a new root.
+
+        Returns the index of the copy of tag.
+        """
+
+        root = self._add(tag)
+        if parent != NONE:
+            self._link(root, parent, successor)
+        indices = {id(tag): root}
+        for descendant in tag.descendants:
+            index = self._add(descendant)
+            indices[id(descendant)] = index
+            self._link(index, indices[id(descendant._parent)])
+        return root
+
+    def _add(self, tag):
+        """
+        Appends a parentless copy of tag's own data and returns its index.
+        """
+
+        index = len(self._parent)
+        for links in (self._parent, self._first_child, self._last_child,
+                      self._next_sibling, self._previous_sibling):
+            links.append(NONE)
+        self._child_count.append(0)
+        self._name.append(self._intern(tag.name))
+
+        #a Tag without a value would search for 'value' tags instead
+        value = tag.value if hasattr(type(tag), 'value') else None
+        is_unicode = isinstance(value, unicode)
+        if value is None:
+            self._text_offset.append(0)
+            self._text_length.append(_NO_TEXT)
+        elif isinstance(value, basestring):
+            self._text_offset.append(self._texts[is_unicode].append(value))
+            self._text_length.append(len(value))
+        else:
+            self._other_values[index] = value
+            self._text_offset.append(0)
+            self._text_length.append(_OTHER_VALUE)
+
+        self._kind.append(self._intern((tag.__class__, tag._type, tag._encoder,
+                                        tag._self_closing, tag.namespace, is_unicode)))
+        if tag._attrs:
+            #shared like Tag.copy() does, a copy could change the order
+            #the attributes are generated in
+            self._attrs[index] = tag._attrs
+        return index
+
+    #Tree manipulation
+    def _link(self, index, parent, successor=NONE):
+        """
+        Links the parentless tag at index into parent's children just
+        before successor, or last if successor is NONE.
+        """
+
+        self._parent[index] = parent
+        self._next_sibling[index] = successor
+        if successor == NONE:
+            predecessor = self._last_child[parent]
+            self._last_child[parent] = index
+        else:
+            predecessor = self._previous_sibling[successor]
+            self._previous_sibling[successor] = index
+        self._previous_sibling[index] = predecessor
+        if predecessor == NONE:
+            self._first_child[parent] = index
+        else:
+            self._next_sibling[predecessor] = index
+        self._child_count[parent] += 1
+
+    def _unlink(self, index):
+        """
+        Unlinks the tag at index from its parent's children.
+        """
+
+        parent = self._parent[index]
+        predecessor = self._previous_sibling[index]
+        successor = self._next_sibling[index]
+        if predecessor == NONE:
+            self._first_child[parent] = successor
+        else:
+            self._next_sibling[predecessor] = successor
+        if successor == NONE:
+            self._last_child[parent] = predecessor
+        else:
+            self._previous_sibling[successor] = predecessor
+        self._parent[index] = NONE
+        self._previous_sibling[index] = NONE
+        self._next_sibling[index] = NONE
+        self._child_count[parent] -= 1
+
+    #Traversal
+    def _children(self, index):
+        child = self._first_child[index]
+        while child != NONE:
+            yield child
+            child = self._next_sibling[child]
+
+    def _walk(self, root, post_order=False, prune=None):
+        """
+        Yields the indices of root's descendants, see Tag.walk.
+        """
+
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        parent = self._parent
+        index = first_child[root]
+        if not post_order:
+            while index != NONE:
+                yield index
+                if first_child[index] != NONE and (prune is None or not prune(index)):
+                    index = first_child[index]
+                    continue
+                while next_sibling[index] == NONE:
+                    index = parent[index]
+                    if index == root:
+                        return
+                index = next_sibling[index]
+            return
+
+        while index != NONE:
+            while first_child[index] != NONE and (prune is None or not prune(index)):
+                index = first_child[index]
+            while True:
+                next_index = next_sibling[index]
+                parent_index = parent[index]
+                yield index
+                if next_index != NONE:
+                    index = next_index
+                    break
+                if parent_index == root:
+                    return
+                index = parent_index
+
+    def _value(self, index):
+        length = self._text_length[index]
+        if length == _NO_TEXT:
+            return None
+        if length == _OTHER_VALUE:
+            return self._other_values[index]
+        return self._texts[self._kind_of(index)[5]].get(self._text_offset[index], length)
+
+class TagHandle(object):
+    """
+    A tag of an ArrayTree.
+
+    Offers the navigation, search and generation API of the Tag class
+    that stored the tag. Generation runs that class's own code with the
+    handle standing in for the tag.
+
+    Handles are created on demand, two handles are equal if they refer to
+    the same tag. The name, type and value of a stored tag can't be
+    changed; its attrs dict and its place in the tree can.
+    """
+
+    __slots__ = ('_tree', '_index')
+
+    #a handle has nowhere to keep the code it generates, see Tag.write
+    _output = None
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self._index = index
+
+    def _handle(self, index):
+        if index == NONE:
+            return None
+        return TagHandle(self._tree, index)
+
+    def _call(self, method, *args):
+        """
+        Calls the stored tag class's method with self as the tag.
+        """
+        return getattr(self._class, method).im_func(self, *args)
+
+    #Data
+    @property
+    def _class(self):
+        return self._tree._kind_of(self._index)[0]
+
+    @property
+    def name(self):
+        return self._tree._interned[self._tree._name[self._index]]
+
+    @property
+    def _type(self):
+        return self._tree._kind_of(self._index)[1]
+
+    @property
+    def _encoder(self):
+        return self._tree._kind_of(self._index)[2]
+
+    encoder = _encoder
+
+    @property
+    def _self_closing(self):
+        return self._tree._kind_of(self._index)[3]
+
+    is_empty_element = _self_closing
+
+    @property
+    def namespace(self):
+        return self._tree._kind_of(self._index)[4]
+
+    @property
+    def value(self):
+        return self._tree._value(self._index)
+
+    @property
+    def _attrs(self):
+        return self._tree._attrs.get(self._index, EMPTY_ATTRS)
+
+    @property
+    def attrs(self):
+        """
+        The dict of the tag's attributes, see Tag.attrs.
+        """
+        attrs = self._tree._attrs.get(self._index)
+        if attrs is None:
+            attrs = self._tree._attrs[self._index] = {}
+        elif type(attrs) is SharedAttrs:
+            #see Tag.attrs
+            attrs = self._tree._attrs[self._index] = dict(attrs.iteritems())
+        return attrs
+
+    def get(self, key, default=None):
+        return self._attrs.get(key, default)
+
+    def has_attr(self, key):
+        return key in self._attrs
+
+    def __getitem__(self, key):
+        return self._attrs[key]
+
+    def __setitem__(self, key, value):
+        self.attrs[key] = value
+
+    #Navigation
+    @property
+    def parent(self):
+        return self._handle(self._tree._parent[self._index])
+
+    _parent = parent
+
+    @property
+    def next(self):
+        return self._handle(self._tree._next_sibling[self._index])
+
+    _next_sibling = next
+
+    @property
+    def previous(self):
+        return self._handle(self._tree._previous_sibling[self._index])
+
+    _previous_sibling = previous
+
+    @property
+    def _first_child(self):
+        return self._handle(self._tree._first_child[self._index])
+
+    @property
+    def _last_child(self):
+        return self._handle(self._tree._last_child[self._index])
+
+    @property
+    def contents(self):
+        """
+        A new list of the handles of the tag's children.
+        """
+        return list(self)
+
+    @property
+    def children(self):
+        return self
+
+    def __iter__(self):
+        for index in self._tree._children(self._index):
+            yield TagHandle(self._tree, index)
+
+    def __len__(self):
+        return self._tree._child_count[self._index]
+
+    def __contains__(self, x):
+        return x in self.contents
+
+    def index(self, element):
+        """
+        Finds the index of a child.
+        """
+
+        if not isinstance(element, TagHandle) or element.parent != self:
+            raise ValueError("element not in subtree")
+        for position, index in enumerate(self._tree._children(self._index)):
+            if index == element._index:
+                return position
+
+    @property
+    def descendants(self):
+        return self.walk()
+
+    def walk(self, post_order=False, prune=None):
+        """
+        Generator that yields the handles of the tag's descendants, see
+        Tag.walk.
+        """
+
+        tree = self._tree
+        if prune is not None:
+            prune_handle = prune
+            prune = lambda index: prune_handle(TagHandle(tree, index))
+        for index in tree._walk(self._index, post_order, prune):
+            yield TagHandle(tree, index)
+
+    @property
+    def parents(self):
+        i = self.parent
+        while i is not None:
+            yield i
+            i = i.parent
+
+    @property
+    def next_siblings(self):
+        i = self.next
+        while i is not None:
+            yield i
+            i = i.next
+
+    @property
+    def previous_siblings(self):
+        i = self.previous
+        while i is not None:
+            yield i
+            i = i.previous
+
+    #Tree manipulation
+    def insert(self, new_child, position=None):
+        """
+        Inserts new_child at position among the tag's children, by
+        default as the last child.
+
+        new_child is either a handle of the same tree, which is moved, or
+        a Tag, whose tree is copied in. Returns the handle of new_child, or
+        the handles of its children if it's a Fragment.
+        """
+
+        if isinstance(new_child, Fragment):
+            return self.splice(position, [new_child])
+        tree = self._tree
+        if isinstance(new_child, TagHandle) and new_child.parent == self and\
+           position is not None and self.index(new_child) < position:
+            position -= 1
+        index = self._adopt(new_child)
+        tree._link(index, self._index, self._successor(position))
+        return TagHandle(tree, index)
+
+    def append(self, tag):
+        return self.insert(tag)
+
+    def extend(self, children):
+        return self.splice(None, children)
+
+    def splice(self, position, children):
+        """
+        Inserts children, in order, at position among the tag's children,
+        by default after the last child. See Tag.splice and insert.
+
+        Returns the handles of children.
+        """
+
+        tree = self._tree
+        children = [child for child in children if child is not None]
+        if any(isinstance(child, Fragment) for child in children):
+            #the children of a fragment are copied in its place
+            children = [tag for child in children
+                        for tag in (child.contents if isinstance(child, Fragment) else [child])]
+        moved = set(child._index for child in children
+                    if isinstance(child, TagHandle) and child._tree is tree)
+        if len(moved) < len([child for child in children if isinstance(child, TagHandle)]):
+            raise ValueError("Cannot insert a tag twice.")
+        successor = self._successor(position)
+        while successor != NONE and successor in moved:
+            successor = tree._next_sibling[successor]
+        indices = [self._adopt(child) for child in children]
+        for index in indices:
+            tree._link(index, self._index, successor)
+        return [TagHandle(tree, index) for index in indices]
+
+    def _adopt(self, new_child):
+        """
+        Returns the index of new_child, taken out of its parent's children
+        if it's a handle or copied in if it's a Tag.
+        """
+
+        tree = self._tree
+        if not isinstance(new_child, TagHandle):
+            return tree.add_tree(new_child)
+        if new_child._tree is not tree:
+            raise ValueError("Cannot insert a tag of another tree.")
+        if new_child == self or new_child in list(self.parents):
+            raise ValueError("Cannot insert a tag into itself.")
+        if new_child.parent is not None:
+            tree._unlink(new_child._index)
+        return new_child._index
+
+    def _successor(self, position):
+        """
+        Returns the index of the child at position, NONE past the last one.
+        """
+
+        tree = self._tree
+        if position is None or position >= len(self):
+            return NONE
+        successor = tree._first_child[self._index]
+        for i in range(max(position, 0)):
+            successor = tree._next_sibling[successor]
+        return successor
+
+    def extract(self):
+        """
+        Takes the tag out of its parent's children.
+        """
+
+        if self._tree._parent[self._index] != NONE:
+            self._tree._unlink(self._index)
+        return self
+
+    def to_tag(self):
+        """
+        Returns a tree of Tag objects copied from the tree rooted at
+        the tag.
+        """
+
+        tree = self._tree
+        root = self._new_tag(self._index)
+        tags = {self._index: root}
+        for index in tree._walk(self._index):
+            tag = self._new_tag(index)
+            tags[index] = tag
+            tags[tree._parent[index]]._link(tag)
+        return root
+
+    def _new_tag(self, index):
+        tree = self._tree
+        tag_class, _type, encoder, self_closing, namespace, is_unicode = tree._kind_of(index)
+        #the data is set directly, tag_class.__init__ may build children
+        tag = tag_class.__new__(tag_class)
+        Tag.__init__(tag)
+        tag._name = tree._interned[tree._name[index]]
+        tag._type = _type
+        tag._encoder = encoder
+        tag._self_closing = self_closing
+        tag.namespace = namespace
+        if index in tree._attrs:
+            tag._attrs = tree._attrs[index]
+        if hasattr(tag_class, 'value'):
+            tag.value = tree._value(index)
+        return tag
+
+    #Search
+    def find_all(self, name=None, attrs={}, recursive=True, text=None, _type=None,
+                 limit=None, **kwargs):
+        """
+        Returns the handles of the tags that match the given criteria,
+        see Tag.find_all.
+        """
+
+        return _limited(self.iter_find(name, attrs, recursive, text, _type), limit)
+
+    def iter_find(self, name=None, attrs={}, recursive=True, text=None, _type=None,
+                  **kwargs):
+        """
+        Generator version of find_all, see Tag.iter_find.
+        """
+
+        tree = self._tree
+        if recursive:
+            indices = tree._walk(self._index)
+        else:
+            indices = tree._children(self._index)
+        #names and types are compared by their interned index
+        if name is not None:
+            name_id = tree._intern_ids.get(name)
+            if name_id is None:
+                return iter([])
+            names = tree._name
+            indices = (index for index in indices if names[index] == name_id)
+        if _type is not None:
+            _type = _type.lower()
+            kinds = set(kind_id for kind_id, kind in enumerate(tree._interned)
+                        if isinstance(kind, tuple) and kind[1] == _type)
+            indices = (index for index in indices if tree._kind[index] in kinds)
+        handles = (TagHandle(tree, index) for index in indices)
+        return _matching(handles, None, attrs, text, None)
+
+    def find(self, name=None, attrs={}, recursive=True, text=None, _type=None,
+             **kwargs):
+        return next(self.iter_find(name, attrs, recursive, text, _type), None)
+
+    def __getattr__(self, tag_name):
+        """
+        Looks tag_name up in the stored tag's class, so the handle has the
+        class's constants, properties and methods like the tag had. Failing
+        that, returns the handles of the descendants named tag_name, see
+        Tag.__getattr__.
+        """
+
+        if tag_name.startswith("_") or tag_name == "contents":
+            raise AttributeError(
+                "'%s' object has no attribute '%s'" % (self.__class__, tag_name))
+
+        for cls in self._class.__mro__:
+            if tag_name in cls.__dict__:
+                attribute = cls.__dict__[tag_name]
+                if hasattr(attribute, '__get__'):
+                    #bind properties and methods to the handle
+                    return attribute.__get__(self, self._class)
+                return attribute
+        return self.find_all(tag_name)
+
+    def __call__(self, *args, **kwargs):
+        return self.find_all(*args, **kwargs)
+
+    #Generation
+    def get_indent(self, indent_level):
+        return self._call('get_indent', indent_level)
+
+    def generate_for_attrs(self):
+        return self._call('generate_for_attrs')
+
+    def generate_from_children(self, indent_level=0, encode=None):
+        return self._call('generate_from_children', indent_level, encode)
+
+    def generate(self, indent_level=0, encode=None):
+        """
+        Generates code for the tree rooted at the tag.
+        """
+        return self._call('generate', indent_level, encode)
+
+    def write_children(self, writer, indent_level=0, encode=None, first_break=True):
+        return self._call('write_children', writer, indent_level, encode, first_break)
+
+    def generate_to(self, sink, chunk_size=CHUNK_SIZE, encoding=DEFAULT_OUTPUT_ENCODING,
+                    indent_level=0):
+        """
+        Generates code for the tree rooted at the tag into sink, see
+        Tag.generate_to.
+        """
+        return self._call('generate_to', sink, chunk_size, encoding, indent_level)
+
+    def generate_bytes(self, buffer=None, encoding=DEFAULT_OUTPUT_ENCODING, indent_level=0):
+        """
+        Generates the encoded code for the tree rooted at the tag into a
+        bytearray, see Tag.generate_bytes.
+        """
+        return self._call('generate_bytes', buffer, encoding, indent_level)
+
+    def write(self, writer, indent_level=0, encode=None):
+        return self._call('write', writer, indent_level, encode)
+
+    #Python fundamentals
+    def __eq__(self, other):
+        return (isinstance(other, TagHandle) and other._tree is self._tree and
+                other._index == self._index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._tree), self._index))
+
+    def __repr__(self):
+        return "<{} {!r} #{}>".format(self._class.__name__, self.name, self._index)
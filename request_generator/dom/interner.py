@@ -0,0 +1,130 @@
+"""
+Hash-consing of the identical subtrees of Tag trees.
+
+A tag has a single place in a tree, so identical subtrees, like the submit
+button or the script of every request of a PoC, stay separate tags.
+Interning keeps a single frozen copy of each repeated subtree instead, and
+puts a Mount of it in every place the subtree was,
+
+    interner = SubtreeInterner()
+    interner.intern(html_dom)
+
+Subtrees are told apart by their digests, see Tag.__hash__. The tags and
+the code of a mounted subtree are kept once, see Mount and write, so they
+scale with the number of distinct subtrees. Repeated leaves, which a Mount
+wouldn't make smaller, share their attrs dicts and text with the first
+such leaf.
+
+Like any mounted tree, an interned subtree is frozen, and searches and
+walks of the tree don't enter it, so interning is meant for trees that are
+done being built and are only to be generated.
+"""
+
+from collections import defaultdict
+
+from .tag import Mount, SharedAttrs
+
+class SubtreeInterner(object):
+    """
+    A pool of the distinct subtrees interned so far.
+
+    Shared attrs are SharedAttrs, so changing the attrs of an interned leaf
+    gives it a copy of its own first, like for the tags without attributes.
+    Text is shared by replacing the value of text tags with the equal value
+    of the first one. The pool keeps the interned subtrees alive, so it
+    should be dropped once the tree is built.
+    """
+
+    def __init__(self):
+        #digest -> the distinct subtrees with that digest, frozen ones for
+        #subtrees with children
+        self._subtrees = {}
+        #number of subtrees found identical to one interned before
+        self.hits = 0
+
+    def __len__(self):
+        """
+        Returns the number of distinct subtrees in the pool.
+        """
+
+        return sum(len(subtrees) for subtrees in self._subtrees.itervalues())
+
+    def intern(self, tag):
+        """
+        Interns the subtrees within the tree rooted at tag, replacing each
+        one that shows up more than once, or was interned before, with a
+        Mount of a frozen copy.
+
+        Returns tag.
+        """
+
+        #the digests of the whole tree are computed once here
+        hash(tag)
+        counts = defaultdict(int)
+        for descendant in tag.walk():
+            counts[descendant._digest] += 1
+
+        repeated = []
+        def is_repeated(descendant):
+            if (descendant._first_child is not None and
+                (counts[descendant._digest] > 1 or descendant._digest in self._subtrees)):
+                repeated.append(descendant)
+                return True
+            return False
+
+        for descendant in tag.walk(prune=is_repeated):
+            #a mount already shares its tree
+            if descendant._first_child is None and type(descendant) is not Mount:
+                self._intern_leaf(descendant)
+        #the walk is done before any subtree is moved, a frozen subtree
+        #still moves out of the tree as a whole
+        for subtree in repeated:
+            subtree.insert_before(Mount(self._shared_subtree(subtree)))
+            subtree.extract()
+        return tag
+
+    def _shared_subtree(self, tag):
+        """
+        Returns the frozen subtree from the pool that is identical to the
+        one rooted at tag, freezing tag to be that subtree if there's none.
+        """
+
+        subtrees = self._subtrees.setdefault(hash(tag), [])
+        for subtree in subtrees:
+            #digests can collide
+            if subtree == tag:
+                self.hits += 1
+                return subtree
+        subtrees.append(tag.freeze())
+        return tag
+
+    def _intern_leaf(self, tag):
+        """
+        Shares the attrs and the text of the leaf tag with an identical one
+        from the pool, or adds tag to the pool if there's none.
+        """
+
+        subtrees = self._subtrees.setdefault(hash(tag), [])
+        for subtree in subtrees:
+            if subtree is tag:
+                return
+            if subtree == tag:
+                self.hits += 1
+                tag._attrs = _shared_attrs(subtree)
+                if tag.text is not None:
+                    tag.value = subtree.value
+                return
+        _shared_attrs(tag)
+        subtrees.append(tag)
+
+def _shared_attrs(tag):
+    """
+    Returns the attrs of tag as a SharedAttrs, turning them into one if
+    they're not.
+    """
+
+    attrs = tag._attrs
+    if type(attrs) is not SharedAttrs:
+        #the digest stays the same
+        attrs = tag._attrs = SharedAttrs(attrs)
+    return attrs
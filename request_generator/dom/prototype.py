@@ -0,0 +1,75 @@
+"""
+Prototypes of the trees that are built the same way again and again.
+
+A function that builds a tree can be wrapped with prototype. The tree it
+builds for some arguments is kept, frozen, and every call with those
+arguments returns a clone of it,
+    @classmethod
+    @prototype
+    def build_template_DOM(cls, title=None):
+        ...
+
+A tree that is never changed once built, like the static script helpers
+of a PoC, needn't even be cloned. A function wrapped with shared returns
+a Mount of the kept tree instead, a single tag that generates it.
+
+The arguments must be hashable and the tree must only depend on them.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+
+from .tag import Mount
+
+#number of trees kept for each prototype function
+CACHE_SIZE = 32
+
+_prototypes = []
+
+def prototype(build):
+    """
+    Returns a function that returns clones of the trees built by build.
+    """
+
+    return _kept(build, lambda tree: tree.clone())
+
+def shared(build):
+    """
+    Returns a function that returns Mounts of the trees built by build.
+    """
+
+    return _kept(build, Mount)
+
+def _kept(build, copy):
+    """
+    Returns a function that returns copy(tree) for the frozen tree build
+    returns for the same arguments, which is built once.
+    """
+
+    trees = OrderedDict()
+    @wraps(build)
+    def kept(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        tree = trees.pop(key, None)
+        if tree is None:
+            tree = build(*args, **kwargs)
+            if tree is None:
+                return None
+            tree.freeze()
+            if len(trees) >= CACHE_SIZE:
+                #drop the least recently used
+                trees.popitem(last=False)
+        trees[key] = tree
+        return copy(tree)
+    #to build without the prototypes
+    kept.build = build
+    _prototypes.append(trees)
+    return kept
+
+def purge():
+    """
+    Drops the trees kept by all the prototype functions.
+    """
+
+    for trees in _prototypes:
+        trees.clear()
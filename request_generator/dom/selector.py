@@ -0,0 +1,373 @@
+"""
+CSS selectors for Tag trees.
+
+A selector is parsed and compiled into a test of a tag once, kept in a
+small cache, and run over the tree in a single pass,
+    html_dom.select('body > form#0 input[type=hidden]')
+
+Supported are the type and universal selectors, #id, .class, attribute
+selectors ([a], [a=v], [a~=v], [a|=v], [a^=v], [a$=v], [a*=v]), the
+:first-child, :last-child, :only-child and :empty pseudo-classes, the
+descendant, child (>), adjacent sibling (+) and general sibling (~)
+combinators, and groups of selectors separated by commas.
+
+Selectors match elements, the tags with a name; text tags are skipped.
+Names and attribute values are compared as they are, case sensitively.
+"""
+
+import re
+from collections import OrderedDict
+from itertools import ifilter, islice
+from operator import attrgetter
+
+#number of compiled selectors kept in the cache
+CACHE_SIZE = 128
+
+_cache = OrderedDict()
+
+#unlike CSS, identifiers can start with a digit, like the 0 in form#0
+_IDENTIFIER = re.compile(r'[-\w]+', re.UNICODE)
+_WHITESPACE = re.compile(r'\s*')
+_ATTRIBUTE = re.compile(r'''\[\s*([-\w]+)\s*(?:([~|^$*]?=)\s*(?:"([^"]*)"|'([^']*)'|([-\w]+))\s*)?\]''',
+                        re.UNICODE)
+_COMBINATOR = re.compile(r'\s*([>+~,])\s*')
+
+def compile_selector(selector):
+    """
+    Returns the compiled Selector for the selector string.
+
+    Compiled selectors are cached, so the same string is parsed only once.
+    Raises ValueError if selector isn't valid.
+    """
+
+    compiled = _cache.pop(selector, None)
+    if compiled is None:
+        compiled = Selector(selector)
+        if len(_cache) >= CACHE_SIZE:
+            #drop the least recently used
+            _cache.popitem(last=False)
+    _cache[selector] = compiled
+    return compiled
+
+def purge():
+    """
+    Empties the cache of compiled selectors.
+    """
+
+    _cache.clear()
+
+class Selector(object):
+    """
+    A compiled group of selectors.
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        #name of the rightmost element if every selector of the group
+        #has the same one, used to look candidates up by name
+        self.name = None
+        groups = _parse(selector)
+        names = set(group[-1][1][0] for group in groups)
+        if len(names) == 1:
+            self.name = names.pop()
+        #the combinators, one slot each in the memo of a search
+        self._slots = []
+        #candidates looked up by name need no test of the name
+        tests = [_compile_group(group, self.name is None, self._slots)
+                 for group in groups]
+        if len(tests) == 1:
+            self._match = tests[0]
+        else:
+            def match_any(tag, memo):
+                for test in tests:
+                    if test(tag, memo):
+                        return True
+                return False
+            self._match = match_any
+
+    def iter_select(self, root):
+        """
+        Returns an iterator over the descendants of root that match, in
+        document order. Like with walk, the tree must not be changed while
+        iterating.
+        """
+
+        if self.name is not None:
+            #a Tag looks the name up in its index
+            candidates = root.iter_find(self.name)
+        else:
+            candidates = root.descendants
+        match = self._match
+        memo = [{} for slot in self._slots]
+        return ifilter(lambda tag: match(tag, memo), candidates)
+
+    def select(self, root, limit=None):
+        """
+        Returns a list of at most limit descendants of root that match, all
+        of them if limit is None.
+        """
+
+        matches = self.iter_select(root)
+        if limit is not None:
+            matches = islice(matches, max(limit, 0))
+        return list(matches)
+
+    def __repr__(self):
+        return "Selector({!r})".format(self.selector)
+
+def _parse(selector):
+    """
+    Parses selector into a list of groups. A group is a list of
+    (combinator, compound) from left to right, the combinator of the first
+    being None. A compound is (name, [(kind, argument...)]) with a name
+    of None for the universal selector.
+    """
+
+    groups = []
+    group = []
+    combinator = None
+    position = _WHITESPACE.match(selector).end()
+    while True:
+        compound, position = _parse_compound(selector, position)
+        group.append((combinator, compound))
+        if position == len(selector):
+            break
+        match = _COMBINATOR.match(selector, position)
+        if match is not None:
+            combinator = match.group(1)
+            position = match.end()
+        else:
+            end = _WHITESPACE.match(selector, position).end()
+            if end == position:
+                _invalid(selector, position)
+            position = end
+            if position == len(selector):
+                break
+            combinator = ' '
+        if combinator == ',':
+            groups.append(group)
+            group = []
+            combinator = None
+    groups.append(group)
+    return groups
+
+def _parse_compound(selector, position):
+    """
+    Parses the compound selector at position.
+
+    Returns the compound and the position that follows it.
+    """
+
+    name = None
+    tests = []
+    start = position
+    if selector.startswith('*', position):
+        position += 1
+    else:
+        match = _IDENTIFIER.match(selector, position)
+        if match is not None:
+            name = match.group()
+            position = match.end()
+    while position < len(selector):
+        char = selector[position]
+        if char in '#.:':
+            match = _IDENTIFIER.match(selector, position + 1)
+            if match is None:
+                _invalid(selector, position)
+            argument = match.group()
+            if char == ':' and argument not in _PSEUDO_CLASSES:
+                _invalid(selector, position)
+            tests.append((char, argument))
+            position = match.end()
+        elif char == '[':
+            match = _ATTRIBUTE.match(selector, position)
+            if match is None:
+                _invalid(selector, position)
+            key, operator = match.group(1, 2)
+            value = [group for group in match.group(3, 4, 5) if group is not None]
+            tests.append(('[', key, operator, value[0] if value else None))
+            position = match.end()
+        else:
+            break
+    if position == start:
+        _invalid(selector, position)
+    return (name, tests), position
+
+def _invalid(selector, position):
+    raise ValueError("Invalid selector {!r} at position {}.".format(selector, position))
+
+#default of the attribute lookups
+_ABSENT = object()
+
+def _string(value):
+    """
+    Returns an attribute value as a string, attribute values like the id
+    of a form can be numbers.
+    """
+
+    if isinstance(value, basestring):
+        return value
+    return str(value)
+
+def _previous_element(tag):
+    tag = tag.previous
+    while tag is not None and not tag.name:
+        tag = tag.previous
+    return tag
+
+def _next_element(tag):
+    tag = tag.next
+    while tag is not None and not tag.name:
+        tag = tag.next
+    return tag
+
+def _is_empty(tag):
+    for child in tag.children:
+        if child.name or child.text:
+            return False
+    return True
+
+_PSEUDO_CLASSES = {
+    'first-child' : lambda tag: _previous_element(tag) is None,
+    'last-child' : lambda tag: _next_element(tag) is None,
+    'only-child' : lambda tag: _previous_element(tag) is None and _next_element(tag) is None,
+    'empty' : _is_empty,
+}
+
+def _compile_attribute(key, operator, value):
+    """
+    Returns a test of the attribute key of a tag.
+    """
+
+    if operator is None:
+        return lambda tag: key in tag._attrs
+    if operator == '=':
+        def test_equal(tag):
+            attr = tag._attrs.get(key, _ABSENT)
+            return attr == value or (attr is not _ABSENT and
+                                     not isinstance(attr, basestring) and str(attr) == value)
+        return test_equal
+    if operator == '~=':
+        compare = lambda attr: value in attr.split()
+    elif operator == '|=':
+        compare = lambda attr: attr == value or attr.startswith(value + '-')
+    elif operator == '^=':
+        compare = lambda attr: bool(value) and attr.startswith(value)
+    elif operator == '$=':
+        compare = lambda attr: bool(value) and attr.endswith(value)
+    else:
+        compare = lambda attr: bool(value) and value in attr
+    def test_attribute(tag):
+        attr = tag._attrs.get(key, _ABSENT)
+        return attr is not _ABSENT and compare(_string(attr))
+    return test_attribute
+
+def _compile_compound(compound, test_name=True):
+    """
+    Compiles a compound selector into a single test of a tag.
+
+    The name isn't tested if test_name is False.
+    """
+
+    name, arguments = compound
+    tests = []
+    if not test_name:
+        pass
+    elif name is None:
+        tests.append(lambda tag: bool(tag.name))
+    else:
+        tests.append(lambda tag: tag.name == name)
+    for argument in arguments:
+        kind = argument[0]
+        if kind == '#':
+            tests.append(_compile_attribute('id', '=', argument[1]))
+        elif kind == '.':
+            tests.append(_compile_attribute('class', '~=', argument[1]))
+        elif kind == ':':
+            tests.append(_PSEUDO_CLASSES[argument[1]])
+        else:
+            tests.append(_compile_attribute(*argument[1:]))
+
+    if not tests:
+        return lambda tag: True
+    if len(tests) == 1:
+        return tests[0]
+    def test_all(tag):
+        for test in tests:
+            if not test(tag):
+                return False
+        return True
+    return test_all
+
+def _compile_group(group, test_name, slots):
+    """
+    Compiles a group, from left to right, into a test of the rightmost
+    tag that checks the tags on its left through the combinators.
+
+    The test is called as test(tag, memo). test_name is passed on for the
+    rightmost compound, and slots is a list that every combinator adds its
+    slot in memo to.
+    """
+
+    first = _compile_compound(group[0][1], test_name or len(group) > 1)
+    match = lambda tag, memo: first(tag)
+    for position, (combinator, compound) in enumerate(group[1:], 2):
+        test = _compile_compound(compound, test_name or position < len(group))
+        slots.append(combinator)
+        match = _combine(combinator, test, match, len(slots) - 1)
+    return match
+
+_parent = attrgetter('parent')
+
+def _combine(combinator, test, left, slot):
+    """
+    Returns a test of a tag that passes test and has a tag related to it
+    by combinator that passes left.
+
+    Tags near each other share their parents and siblings, so the results
+    for those are remembered in memo[slot] by id() for the rest of a
+    search. The tag is kept with its result so its id() isn't reused.
+    """
+
+    if combinator in '>+':
+        step = _parent if combinator == '>' else _previous_element
+        def related(tag, memo):
+            if not test(tag):
+                return False
+            other = step(tag)
+            if other is None:
+                return False
+            known = memo[slot]
+            key = id(other)
+            if key in known:
+                return known[key][1]
+            result = left(other, memo)
+            known[key] = (other, result)
+            return result
+        return related
+
+    #descendant and general sibling combinators look at all the ancestors or
+    #all the previous siblings, remembering for each one if it or one of the
+    #ones after it passes left
+    step = _parent if combinator == ' ' else _previous_element
+    def related_any(tag, memo):
+        if not test(tag):
+            return False
+        known = memo[slot]
+        seen = []
+        result = False
+        other = step(tag)
+        while other is not None:
+            key = id(other)
+            if key in known:
+                result = known[key][1]
+                break
+            seen.append(other)
+            if left(other, memo):
+                result = True
+                break
+            other = step(other)
+        for other in seen:
+            known[id(other)] = (other, result)
+        return result
+    return related_any
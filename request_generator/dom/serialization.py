@@ -0,0 +1,323 @@
+"""
+A compact binary format for Tag trees, to move built DOMs between
+processes or keep them on disk,
+    data = html_dom.dumps()
+    html_dom = Tag.loads(data)
+
+A pickle of a tree holds every tag with all of its links. The format
+instead holds the tags in pre-order with the number of children of each,
+and every distinct value once. It's laid out as,
+    header      - MAGIC, FORMAT_VERSION and the sizes of the sections
+                  that follow, see _HEADER
+    codes       - the type of every distinct value, one byte each, see
+                  _TO_TEXT
+    integers    - little endian 32-bit integers,
+                    the offset and the length in the text of every value
+                    6 values for every kind of tag: class, name, _type,
+                    encoder, _self_closing and namespace
+                    the attribute count and key, value pairs of every
+                    distinct set of attributes
+                    kind, attributes, value and child count of every tag
+    text        - the values, one after another
+
+Values are referred to by their index, attributes by theirs, and -1 is
+for no attributes or no value. Classes are stored by name and imported
+back, so only data from a trusted source should be loaded. The tree a
+Mount shares is stored as a value in the same format, and is loaded
+frozen.
+"""
+
+import struct
+import sys
+from array import array
+from importlib import import_module
+from itertools import chain
+from types import ClassType, NoneType
+
+from .tag import Tag, SharedAttrs
+
+MAGIC = 'RGTT'
+FORMAT_VERSION = 1
+
+#magic, version, number of values, kinds, attribute sets, integers of the
+#attribute sets and tags, and length of the text
+_HEADER = struct.Struct('<4sB6I')
+
+#type -> (code, function that returns a value's text)
+_TO_TEXT = {
+    NoneType:   ('n', lambda value: ''),
+    bool:       ('b', lambda value: '1' if value else ''),
+    int:        ('i', str),
+    long:       ('l', str),
+    float:      ('f', repr),
+    str:        ('s', lambda value: value),
+    unicode:    ('u', lambda value: value.encode('utf-8')),
+}
+
+def dumps(root):
+    """
+    Returns the tree rooted at the Tag root in the binary format.
+
+    Raises TypeError for a value the format can't hold.
+    """
+
+    writer = _Writer()
+    tags = array('i')
+    for tag in chain([root], root.walk()):
+        tags.extend((writer.kind(tag), writer.attrs(tag._attrs),
+                     writer.tag_value(tag), tag._child_count))
+    return writer.data(tags)
+
+def loads(data):
+    """
+    Returns a tree read from data returned by dumps.
+
+    Raises ValueError if data isn't in the format or is of another
+    version of it.
+    """
+
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a serialized tree.")
+    magic, version, value_count, kind_count, attrs_count, attrs_length, tag_count, text_length =\
+        _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a serialized tree.")
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported serialization format version {}.".format(version))
+
+    start = _HEADER.size
+    codes = data[start:start + value_count]
+    start += value_count
+    integer_count = 2 * value_count + 6 * kind_count + attrs_length + 4 * tag_count
+    integers = array('i')
+    integers.fromstring(data[start:start + 4 * integer_count])
+    if sys.byteorder == 'big':
+        integers.byteswap()
+    start += 4 * integer_count
+    text = data[start:start + text_length]
+    if len(codes) != value_count or len(integers) != integer_count or len(text) != text_length:
+        raise ValueError("Truncated serialized tree.")
+
+    values = []
+    for index, code in enumerate(codes):
+        if code not in _FROM_TEXT:
+            raise ValueError("Unknown value type {!r} in serialized tree.".format(code))
+        offset = integers[2 * index]
+        values.append(_FROM_TEXT[code](text[offset:offset + integers[2 * index + 1]]))
+    position = 2 * value_count
+
+    kinds = []
+    for index in range(kind_count):
+        cls, name, _type, encoder, self_closing, namespace = \
+            [values[value] for value in integers[position:position + 6]]
+        position += 6
+        if not isinstance(cls, type) or not issubclass(cls, Tag):
+            raise ValueError("{!r} is not a Tag class.".format(cls))
+        #tags compare _type with is
+        kinds.append((cls, _interned(name), _interned(_type), encoder, self_closing,
+                      _interned(namespace)))
+
+    #the tags with the same attributes share them, like clones do
+    attrs_sets = []
+    for index in range(attrs_count):
+        count = integers[position]
+        pairs = [values[value] for value in integers[position + 1:position + 1 + 2 * count]]
+        position += 1 + 2 * count
+        attrs_sets.append(_shared_attrs(pairs[0::2], pairs[1::2]))
+
+    return _build_tree(integers, position, tag_count, kinds, attrs_sets, values)
+
+def _build_tree(integers, position, tag_count, kinds, attrs_sets, values):
+    """
+    Returns the root of the tree of the tag_count tags described from
+    position on, linking each tag to its parent directly, like clone.
+    """
+
+    root = None
+    #the tags whose children are still to come, and how many they have
+    parents = []
+    counts = []
+    for position in xrange(position, position + 4 * tag_count, 4):
+        cls, name, _type, encoder, self_closing, namespace = kinds[integers[position]]
+        tag = cls.__new__(cls)
+        Tag.__init__(tag)
+        tag._name = name
+        tag._type = _type
+        tag._encoder = encoder
+        tag._self_closing = self_closing
+        tag.namespace = namespace
+        attrs = integers[position + 1]
+        if attrs != -1:
+            tag._attrs = attrs_sets[attrs]
+        value = integers[position + 2]
+        if value != -1:
+            tag.value = values[value]
+
+        if parents:
+            parent = parents[-1]
+            last_child = parent._last_child
+            if last_child is None:
+                parent._first_child = tag
+            else:
+                last_child._next_sibling = tag
+                tag._previous_sibling = last_child
+            parent._last_child = tag
+            parent._child_count += 1
+            tag._parent = parent
+            #the parent's children are all there
+            while parents and parents[-1]._child_count == counts[-1]:
+                parents.pop()
+                counts.pop()
+        elif root is None:
+            root = tag
+        else:
+            raise ValueError("Malformed serialized tree.")
+        child_count = integers[position + 3]
+        if child_count:
+            parents.append(tag)
+            counts.append(child_count)
+    if root is None or parents:
+        raise ValueError("Malformed serialized tree.")
+    return root
+
+class _Writer(object):
+    """
+    Numbers the distinct values, kinds of tags and sets of attributes of
+    a tree as they're met.
+    """
+
+    def __init__(self):
+        #key of a value -> its index, and the values' codes, offsets and
+        #lengths, and text
+        self._values = {}
+        self._codes = []
+        self._value_integers = array('i')
+        self._text = []
+        self._text_length = 0
+        #kind -> its index, and the values of the kinds
+        self._kinds = {}
+        self._kind_integers = array('i')
+        #the value indices of a set of attributes -> its index, and the
+        #attribute sets
+        self._attrs = {}
+        self._attrs_integers = array('i')
+
+    def value(self, value):
+        """
+        Returns the index of value.
+        """
+
+        if isinstance(value, Tag):
+            #the shared tree of a Mount
+            key = ('t', id(value))
+        elif isinstance(value, (type, ClassType)):
+            key = ('c', value)
+        else:
+            key = (type(value), value)
+        try:
+            return self._values[key]
+        except (KeyError, TypeError):
+            pass
+
+        if key[0] == 't':
+            code, text = 't', dumps(value)
+        elif key[0] == 'c':
+            code, text = 'c', "{}:{}".format(value.__module__, value.__name__)
+        elif type(value) in _TO_TEXT:
+            code, to_text = _TO_TEXT[type(value)]
+            text = to_text(value)
+        else:
+            raise TypeError("Cannot serialize a value of type {}.".format(type(value).__name__))
+        index = self._values[key] = len(self._codes)
+        self._codes.append(code)
+        self._value_integers.extend((self._text_length, len(text)))
+        self._text.append(text)
+        self._text_length += len(text)
+        return index
+
+    def kind(self, tag):
+        """
+        Returns the index of the kind of tag.
+        """
+
+        cls = type(tag)
+        key = (cls, tag.name, tag._type, tag._encoder, tag._self_closing, tag.namespace)
+        try:
+            return self._kinds[key]
+        except KeyError:
+            index = self._kinds[key] = len(self._kinds)
+            self._kind_integers.extend(self.value(value) for value in key)
+            return index
+
+    def attrs(self, attrs):
+        """
+        Returns the index of the set of attrs, -1 if there are none.
+        """
+
+        if not attrs:
+            return -1
+        pairs = []
+        for key, value in attrs.iteritems():
+            pairs.extend((self.value(key), self.value(value)))
+        pairs = tuple(pairs)
+        try:
+            return self._attrs[pairs]
+        except KeyError:
+            index = self._attrs[pairs] = len(self._attrs)
+            self._attrs_integers.append(len(attrs))
+            self._attrs_integers.extend(pairs)
+            return index
+
+    def tag_value(self, tag):
+        """
+        Returns the index of the value of tag, -1 if its class has none.
+        """
+
+        if not hasattr(type(tag), 'value'):
+            return -1
+        return self.value(tag.value)
+
+    def data(self, tags):
+        """
+        Returns the serialized tree of the given tags.
+        """
+
+        integers = self._value_integers + self._kind_integers + self._attrs_integers + tags
+        if sys.byteorder == 'big':
+            integers.byteswap()
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(self._codes), len(self._kinds),
+                              len(self._attrs), len(self._attrs_integers), len(tags) // 4,
+                              self._text_length)
+        return ''.join([header, ''.join(self._codes), integers.tostring()] + self._text)
+
+def _import(text):
+    module, name = text.split(':')
+    return getattr(import_module(module), name)
+
+#code -> function that returns a value from its text
+_FROM_TEXT = {
+    'n': lambda text: None,
+    'b': bool,
+    'i': int,
+    'l': long,
+    'f': float,
+    's': lambda text: text,
+    'u': lambda text: text.decode('utf-8'),
+    'c': _import,
+    't': lambda text: loads(text).freeze(),
+}
+
+def _interned(value):
+    if type(value) is str:
+        return intern(value)
+    return value
+
+def _shared_attrs(keys, values):
+    """
+    Returns a SharedAttrs of the given keys and values, in their order.
+    """
+
+    attrs = SharedAttrs.__new__(SharedAttrs)
+    dict.__init__(attrs, zip(keys, values))
+    attrs._keys = tuple(keys)
+    return attrs
@@ -1,11 +1,91 @@
+import codecs
 import re
 import warnings
+from itertools import chain, ifilter, islice, izip
+
+from .selector import compile_selector
 
 DEFAULT_OUTPUT_ENCODING = 'utf-8'
 
 #Tabs or spaces
 SPACES=True
 
+#line break between the code of siblings
+LINE_BREAK = "\r\n"
+
+#characters generate_to writes at a time
+CHUNK_SIZE = 64 * 1024
+
+#every ASCII character, see BytesWriter
+_ASCII = ''.join(chr(code) for code in range(128))
+
+#characters of generated code a tag with children keeps at most, see
+#Tag.write
+MEMO_SIZE = 16 * 1024
+
+class SharedAttrs(dict):
+    """
+    The attributes of tags that share them, like the tags that have none
+    or the identical subtrees of a SubtreeInterner.
+
+    A shared dict can't be changed. Tag.attrs hands out a copy of the
+    tag's own the first time it's asked.
+    """
+
+    __slots__ = ('_keys',)
+
+    def __init__(self, attrs=()):
+        dict.__init__(self, attrs)
+        #a copy of a dict can iterate in another order, and the attributes
+        #are generated in the order of the dict they come from
+        self._keys = tuple(attrs)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared attributes can't be changed.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        for key in self._keys:
+            yield key, dict.__getitem__(self, key)
+
+    def itervalues(self):
+        for key in self._keys:
+            yield dict.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __reduce__(self):
+        #pickle would fill the dict through the read only __setitem__
+        if self is EMPTY_ATTRS:
+            return 'EMPTY_ATTRS'
+        return SharedAttrs, (), self.items()
+
+    def __setstate__(self, items):
+        dict.update(self, items)
+        self._keys = tuple(key for key, value in items)
+
+#the attributes of all the tags that have none
+EMPTY_ATTRS = SharedAttrs()
+
+class FrozenTagException(ValueError):
+    """
+    Raised when a frozen tag, see Tag.freeze, or its children are changed.
+    """
+    pass
+
 class Tag(object):
     """
     A Tag object forms the basic constructive unit of a DOM.
@@ -33,11 +113,21 @@ class Tag(object):
        | name = C|
        -----------
     """
+
+    #A tree holds thousands of tags, most of them leaf text nodes, so tags
+    #keep their data in slots instead of a per instance __dict__. Subclasses
+    #must declare their own __slots__, empty if they add no attributes.
+    __slots__ = ('_name', '_attrs', 'namespace', '_self_closing', '_type',
+                 '_encoder', '_parent', '_next_sibling', '_previous_sibling',
+                 '_first_child', '_last_child', '_child_count', '_contents',
+                 '_position', '_version', '_subtree_index', '_digest', '_frozen',
+                 '_output')
    
     def __init__(self):
         #main meta data
-        self.name = None
-        self.attrs = {}
+        self._name = None
+        #tags without attributes share EMPTY_ATTRS, see attrs
+        self._attrs = EMPTY_ATTRS
         #namespace attribute. Just incase we require it.
         self.namespace = None
         self._self_closing = False
@@ -50,18 +140,363 @@ class Tag(object):
         self._parent = None
         self._next_sibling = None
         self._previous_sibling = None
-        #current list of direct children
-        self.contents = []        
+        #direct children are kept as a chain of siblings
+        #from _first_child to _last_child
+        self._first_child = None
+        self._last_child = None
+        self._child_count = 0
+        #list of direct children built from the chain on demand
+        self._contents = None
+        #index of self in parent's contents when that list is built
+        self._position = 0
+        #bumped whenever the children change
+        self._version = 0
+        #name and _type index of the descendants, built by the first
+        #search for a name or a _type under self
+        self._subtree_index = None
+        #structural hash of the subtree rooted at self, see __hash__
+        self._digest = None
+        #see freeze
+        self._frozen = False
+        #code generated for the tree rooted at self, see write
+        self._output = None
     
     def index(self, element):
         """
         Find the index of a child by identity, not value. Avoids issues with
         tag.contents.index(element) getting the index of equal elements.
+
+        Children are numbered whenever contents is (re)built, so this is
+        O(1) until a child is inserted or removed in the middle of contents.
+        """
+
+        if getattr(element, '_parent', None) is not self:
+            raise ValueError("element not in subtree")
+        if self._contents is None:
+            self._build_contents()
+        return element._position
+
+    @property
+    def contents(self):
+        """
+        A new list of the direct children of self.
+
+        Tree manipulation methods must be used to add or remove children;
+        changing the list has no effect on the tree.
+        """
+
+        return list(self._cached_contents())
+
+    def _cached_contents(self):
+        """
+        Returns the list of self's children that is built from the chain of
+        children on demand and kept until self's children change. It must
+        not be changed or handed out.
+        """
+
+        contents = self._contents
+        if contents is None:
+            if self._first_child is None:
+                #leaves don't keep an empty list around
+                return []
+            contents = self._build_contents()
+        return contents
+
+    @contents.setter
+    def contents(self, children):
+        """
+        Replaces self's children with children.
+        """
+
+        for child in self._children_list():
+            child.extract()
+        for child in list(children):
+            self.insert(child)
+
+    def _build_contents(self):
+        """
+        Builds self._contents from the chain of children and numbers them.
+        """
+
+        contents = []
+        child = self._first_child
+        while child is not None:
+            child._position = len(contents)
+            contents.append(child)
+            child = child._next_sibling
+        self._contents = contents
+        return contents
+
+    def _children_list(self):
+        """
+        Returns a new list of self's children.
+        """
+
+        children = []
+        child = self._first_child
+        while child is not None:
+            children.append(child)
+            child = child._next_sibling
+        return children
+
+    def _link(self, new_child, successor=None):
+        """
+        Links a parentless new_child into self's children just before
+        successor, which must be a child of self. If successor is None,
+        new_child becomes the last child.
+
+        A Fragment's children are linked in its place.
         """
-        for i, child in enumerate(self.children):
-            if child is element:
-                return i
-        raise ValueError("element not in subtree")
+
+        if isinstance(new_child, Fragment):
+            self._splice_children(new_child, successor)
+            return
+        self._changed()
+        new_child._parent = self
+        new_child._next_sibling = successor
+        if successor is None:
+            predecessor = self._last_child
+            self._last_child = new_child
+            contents = self._contents
+            if contents is not None:
+                #appending doesn't renumber any of the other children
+                new_child._position = len(contents)
+                contents.append(new_child)
+        else:
+            predecessor = successor._previous_sibling
+            successor._previous_sibling = new_child
+            self._contents = None
+        new_child._previous_sibling = predecessor
+        if predecessor is None:
+            self._first_child = new_child
+        else:
+            predecessor._next_sibling = new_child
+        self._child_count += 1
+        self._version += 1
+        self._index_linked([new_child], successor is None)
+
+    def _link_children(self, children, successor=None):
+        """
+        Links the parentless children, in order, into self's children just
+        before successor like _link does for one child, in a single pass.
+        """
+
+        self._changed()
+        if successor is None:
+            predecessor = self._last_child
+            contents = self._contents
+        else:
+            predecessor = successor._previous_sibling
+            contents = self._contents = None
+        previous = predecessor
+        for child in children:
+            child._parent = self
+            child._previous_sibling = previous
+            if previous is None:
+                self._first_child = child
+            else:
+                previous._next_sibling = child
+            if contents is not None:
+                child._position = len(contents)
+                contents.append(child)
+            previous = child
+        previous._next_sibling = successor
+        if successor is None:
+            self._last_child = previous
+        else:
+            successor._previous_sibling = previous
+        self._child_count += len(children)
+        self._version += 1
+        self._index_linked(children, successor is None)
+
+    def _unlink(self, child):
+        """
+        Unlinks child from self's children and re-links its siblings.
+        """
+
+        self._changed()
+        self._index_unlinked([child])
+        predecessor = child._previous_sibling
+        successor = child._next_sibling
+        if predecessor is None:
+            self._first_child = successor
+        else:
+            predecessor._next_sibling = successor
+        if successor is None:
+            self._last_child = predecessor
+            if self._contents is not None:
+                #removing the last child doesn't renumber the others
+                self._contents.pop()
+        else:
+            successor._previous_sibling = predecessor
+            self._contents = None
+        child._parent = None
+        child._previous_sibling = None
+        child._next_sibling = None
+        self._child_count -= 1
+        self._version += 1
+
+    def _splice_children(self, source, successor=None, in_place=False):
+        """
+        Moves all of source's children, in order, into self's children
+        just before successor. If successor is None, they are appended.
+
+        Only the parent of each moved child changes, their sibling chain
+        is re-linked at its two ends.
+
+        in_place tells that the children keep their place in the document
+        but for source, which is extracted next, as when source is unwrapped
+        or replaced. The indexes of the common ancestors then stay sorted.
+        """
+
+        first_child = source._first_child
+        if first_child is None:
+            return
+        source._changed()
+        self._changed()
+        last_child = source._last_child
+        count = source._child_count
+        source._first_child = None
+        source._last_child = None
+        source._child_count = 0
+        source._contents = None
+        source._version += 1
+
+        moved = []
+        child = first_child
+        while child is not None:
+            child._parent = self
+            moved.append(child)
+            child = child._next_sibling
+
+        if successor is None:
+            predecessor = self._last_child
+            self._last_child = last_child
+        else:
+            predecessor = successor._previous_sibling
+            successor._previous_sibling = last_child
+        last_child._next_sibling = successor
+        first_child._previous_sibling = predecessor
+        if predecessor is None:
+            self._first_child = first_child
+        else:
+            predecessor._next_sibling = first_child
+        self._child_count += count
+        self._contents = None
+        self._version += 1
+        self._index_spliced(source, moved, successor is None, in_place)
+
+    #Name and _type indexes
+    def _index_linked(self, children, at_end):
+        """
+        Adds the subtrees rooted at children, which were just linked into
+        self, to the indexes of self and its ancestors. at_end tells if the
+        last of them is self's last child.
+        """
+
+        nodes = None
+        tag = self
+        while tag is not None:
+            index = tag._subtree_index
+            if index is not None:
+                if nodes is None:
+                    nodes = _subtree_nodes(children)
+                index.add(nodes, at_end)
+            at_end = at_end and tag._next_sibling is None
+            tag = tag._parent
+
+    def _index_unlinked(self, children):
+        """
+        Removes the subtrees rooted at children, which are about to be
+        unlinked from self, from the indexes of self and its ancestors.
+        """
+
+        nodes = None
+        tag = self
+        while tag is not None:
+            index = tag._subtree_index
+            if index is not None:
+                if nodes is None:
+                    nodes = _subtree_nodes(children)
+                if len(nodes) * 2 >= len(index.members):
+                    #cheaper to build again by the next search
+                    tag._subtree_index = None
+                else:
+                    index.remove(nodes)
+            tag = tag._parent
+
+    def _index_spliced(self, source, children, at_end, in_place):
+        """
+        Updates the indexes after children were moved from source into
+        self. Only the indexes that gained or lost the children change,
+        those of the common ancestors of self and source keep them.
+        """
+
+        nodes = None
+        path = []
+        tag = self
+        while tag is not None:
+            path.append(tag)
+            tag = tag._parent
+        on_path = set(map(id, path))
+
+        #the indexes that lost the children
+        tag = source
+        while tag is not None and id(tag) not in on_path:
+            index = tag._subtree_index
+            if index is not None and tag is source:
+                #source is left without descendants
+                source._subtree_index = None
+            elif index is not None:
+                if nodes is None:
+                    nodes = _subtree_nodes(children)
+                index.remove(nodes)
+            tag = tag._parent
+        common = tag
+
+        #the indexes that gained them
+        for tag in path:
+            if tag is common:
+                break
+            index = tag._subtree_index
+            if index is not None:
+                if nodes is None:
+                    nodes = _subtree_nodes(children)
+                index.add(nodes, at_end)
+            at_end = at_end and tag._next_sibling is None
+
+        #the common ancestors keep them, maybe at another place
+        if in_place:
+            return
+        while common is not None:
+            index = common._subtree_index
+            if index is not None:
+                if nodes is None:
+                    nodes = _subtree_nodes(children)
+                index.moved(nodes)
+            common = common._parent
+
+    def _indexed(self, name, _type):
+        """
+        Returns the descendants of self with the given name or, if name is
+        None, the given _type, in document order.
+
+        The index is built by the first call and then kept up to date by
+        the tree manipulation methods.
+        """
+
+        index = self._subtree_index
+        if index is None:
+            if self._first_child is None:
+                return []
+            #built before it's kept, so that searches of a frozen tree from
+            #other threads never see half of it
+            index = _SubtreeIndex()
+            index.add(list(self.descendants), True)
+            self._subtree_index = index
+        if name is not None:
+            return index.get(_SubtreeIndex.NAME, name, self)
+        return index.get(_SubtreeIndex.TYPE, _type.lower(), self)
 
     #Tree manipulation operations    
     def setup(self, parent=None, child=None,
@@ -82,6 +517,14 @@ class Tag(object):
         if child is not None:
             self.append(child)
         
+        #siblings of an element with a parent are also its parent's children
+        if self._parent is not None:
+            if next_sibling is not None:
+                self.insert_after(next_sibling)
+            if previous_sibling is not None:
+                self.insert_before(previous_sibling)
+            return
+
         if next_sibling is not None and self._next_sibling is not None:
             self._next_sibling._previous_sibling = next_sibling            
             next_sibling._next_sibling = self._next_sibling
@@ -115,15 +558,20 @@ class Tag(object):
         if replacement._previous_sibling or replacement._next_sibling:
             raise ValueError("Replacement cannot have siblings.")
         
-        if replacement.contents:
+        if len(replacement):
             raise ValueError("Replacemenet element must be an individual and not a tree.")
+
+        #self's children move to the replacement, neither may be frozen
+        #once anything has changed
+        if self._frozen or (replacement._frozen and self._first_child is not None):
+            raise FrozenTagException("Cannot change a frozen tag.")
             
-        my_index = self.parent.index(self)
-        #insert at my_index
-        self.parent.insert(replacement, my_index)
+        #insert in place of self
+        replacement.extract()
+        self.parent._link(replacement, self)
 
-        #copy children over
-        replacement.contents = self.contents
+        #move children over
+        replacement._splice_children(self, in_place=True)
         #exatract self
         self.extract()
 
@@ -138,16 +586,12 @@ class Tag(object):
             raise ValueError(
                 "Cannot replace an element with its contents when that"
                 "element is not part of a tree.")
-        my_index = self.parent.index(self)
 
         #the children get promoted to be the parent level siblings
-        for i,child in enumerate(self):
-            my_parent.insert(child, my_index+i)
+        my_parent._splice_children(self, self, in_place=True)
 
-        #extract the subtree rooted at self
+        #extract the now childless self
         self.extract()
-        #unlink children
-        del self.contents[:]
 
         return self
     
@@ -158,13 +602,15 @@ class Tag(object):
         Returns the wrapper.
         """
 
-        my_index = self.parent.index(self)
         my_parent = self.parent
+        my_parent._changed()
 
+        #insert wrapper in place of self
+        if wrapper.parent is not None:
+            wrapper.extract()
+        my_parent._link(wrapper, self)
         #extract self
         self.extract()
-        #insert wrapper at my_index
-        my_parent.insert(wrapper, my_index)
         #self becomes first child of wrapper
         wrapper.insert(self, 0)
         return wrapper
@@ -176,21 +622,14 @@ class Tag(object):
         As a result, there's another sub-tree rooted at self.
         """
 
-        if not self.parent and (self.next or self.previous or len(self.contents)):
+        if not self.parent and (self.next or self.previous or len(self)):
             raise ValueError("Cannot extract the root of a tree.")
         #if I'm an individual Tag, then I'm already "extracted"
-        elif not self.parent and not self.next and not self.previous and not len(self.contents):
+        elif not self.parent and not self.next and not self.previous and not len(self):
             return self
 
-        #re-link our siblings and unlink self from the siblings
-        if self._previous_sibling is not None:
-            self._previous_sibling._next_sibling = self._next_sibling        
-        if self._next_sibling is not None:
-            self._next_sibling._previous_sibling = self._previous_sibling
-
-        self._previous_sibling = None
-        self._next_sibling = None
-        self.parent = None
+        #unlink self from the parent and the siblings
+        self._parent._unlink(self)
 
         return self
     
@@ -207,14 +646,16 @@ class Tag(object):
             return
         if new_child is self:
             raise ValueError("Cannot insert a tag into itself.")
+        #before new_child leaves its parent
+        self._changed()
         
         #if a -ve position then insert at head
         if position is not None and position < 0:
             position = 0
         elif position is None:
-            position = len(self.contents)
+            position = len(self)
 
-        position = min(position, len(self.contents))
+        position = min(position, len(self))
         
         if hasattr(new_child, 'parent') and new_child.parent is not None:
             # We're 'inserting' an element that's already one
@@ -229,43 +670,76 @@ class Tag(object):
                     position -= 1
             new_child.extract()
 
-        new_child._parent = self
-        current_child = None
-
-        #fix the chain of siblings
-        if len(self.contents) > 0:
-
-            #insert new_child after
-            insert_after = False
-
-            #if insert at head
-            if position == 0:
-                current_child = self.contents[position]
-            #if insert at tail
-            elif position == len(self.contents) or\
-                 position == len(self.contents)-1:
-                 current_child = self.contents[len(self.contents)-1]
-                 if position == len(self.contents):
-                     insert_after = True
-            else:
-                current_child = self.contents[position]
-
-            if insert_after:
-                current_child._next_sibling = new_child
-                new_child._previous_sibling = current_child
-            else:
-                new_child._next_sibling = current_child
-                new_child._previous_sibling = current_child._previous_sibling
-                if current_child._previous_sibling is not None:
-                    current_child._previous_sibling._next_sibling = new_child                
-                current_child._previous_sibling = new_child                
-                
-        self.contents.insert(position, new_child)
+        #find the child that new_child goes before
+        if position >= len(self):
+            successor = None
+        elif position == 0:
+            successor = self._first_child
+        else:
+            successor = self._cached_contents()[position]
+        self._link(new_child, successor)
     
     def append(self, tag):
         """Appends the given tag to the contents of this tag."""
         
         self.insert(tag)
+
+    def extend(self, children):
+        """
+        Appends the given tags, in order, to the contents of this tag.
+
+        See splice.
+        """
+
+        self.splice(None, children)
+
+    def splice(self, position, children):
+        """
+        Inserts the given tags, in order, at position among self's
+        children. By default, appends them.
+
+        Like a run of insert calls, children already in a tree are moved,
+        but the whole run is linked into self's children, and into the
+        indexes, in one pass. A Fragment among children stands for its
+        children.
+        """
+
+        children = [child for child in children if child is not None]
+        if any(isinstance(child, Fragment) for child in children):
+            fragments = children
+            children = []
+            for child in fragments:
+                if isinstance(child, Fragment):
+                    children.extend(child._children_list())
+                else:
+                    children.append(child)
+        if not children:
+            return
+        #before the children leave their parents
+        self._changed()
+        moved = set()
+        for child in children:
+            if child is self:
+                raise ValueError("Cannot insert a tag into itself.")
+            if id(child) in moved:
+                raise ValueError("Cannot insert a tag twice.")
+            moved.add(id(child))
+
+        #position counts the current children, as with insert
+        if position is None or position >= len(self):
+            successor = None
+        elif position <= 0:
+            successor = self._first_child
+        else:
+            successor = self._cached_contents()[position]
+        #the children being moved can't be the successor
+        while successor is not None and id(successor) in moved:
+            successor = successor._next_sibling
+
+        for child in children:
+            if child._parent is not None:
+                child._parent._unlink(child)
+        self._link_children(children, successor)
     
     def insert_before(self, predecessor):
         """
@@ -280,13 +754,10 @@ class Tag(object):
         parent = self.parent
         if parent is None:
             raise ValueError("Element has no parent, so 'before' has no meaning.")
+        parent._changed()
         
-        # Extract first so that the index won't be screwed up if they
-        # are siblings.
-        if isinstance(predecessor, Tag):
-            predecessor.extract()
-        index = parent.index(self)
-        parent.insert(predecessor, index)
+        predecessor.extract()
+        parent._link(predecessor, self)
     
     def insert_after(self, successor):
         """Makes the given element the immediate successor of this one.
@@ -300,13 +771,10 @@ class Tag(object):
         parent = self.parent
         if parent is None:
             raise ValueError("Element has no parent, so 'after' has no meaning.")
+        parent._changed()
         
-        # Extract first so that the index won't be screwed up if they
-        # are siblings.
-        if isinstance(successor, Tag):
-            successor.extract()
-        index = parent.index(self)
-        parent.insert(successor, index+1)
+        successor.extract()
+        parent._link(successor, self._next_sibling)
 
     @property
     def parent(self):
@@ -315,15 +783,12 @@ class Tag(object):
     @parent.setter
     def parent(self, my_parent):
         if my_parent is not None:
-            self._parent = my_parent
-            #update the parent's children list
-            self._parent.contents.append(self)
+            #append self to the parent's children
+            my_parent.insert(self)
         #if my_parent is None, then it means we need
         #to remove self from self._parent's children
-        else:
-            my_index = self.parent.index(self)
-            self.parent.contents.pop(my_index)
-            self._parent = None
+        elif self._parent is not None:
+            self._parent._unlink(self)
     
     @property
     def next(self):
@@ -368,17 +833,67 @@ class Tag(object):
     @property
     def descendants(self):
         """
-        Iterator that does a DFS for all descendants recusrsively.
-        """
-
-        #yield first from children
-        for child in self.contents:
-            yield child
-            for grand__child in child.descendants:
-                yield grand__child
+        Iterator that does a DFS for all descendants. See walk.
+        """
+
+        return self.walk()
+
+    def walk(self, post_order=False, prune=None):
+        """
+        Generator that yields all of self's descendants depth first, in
+        document order or, if post_order is True, with every tag after its
+        descendants.
+
+        prune is an optional callable; the descendants of a tag for which
+        prune(tag) is true are skipped, the tag itself is still yielded.
+
+        The walk follows the parent and sibling links, so it takes no
+        recursion and no stack whatever the depth of the tree. The tree must
+        not be changed while walking it, except that in post_order the tag
+        just yielded can be extracted or decomposed.
+        """
+
+        if post_order:
+            return self._walk_post_order(prune)
+        return self._walk_pre_order(prune)
+
+    def _walk_pre_order(self, prune):
+        tag = self._first_child
+        while tag is not None:
+            yield tag
+            if tag._first_child is not None and (prune is None or not prune(tag)):
+                tag = tag._first_child
+                continue
+            #climb up to the closest tag with a next sibling
+            while tag._next_sibling is None:
+                tag = tag._parent
+                if tag is self:
+                    return
+            tag = tag._next_sibling
+
+    def _walk_post_order(self, prune):
+        tag = self._first_child
+        while tag is not None:
+            #go down to the first leaf
+            while tag._first_child is not None and (prune is None or not prune(tag)):
+                tag = tag._first_child
+            #yield it and its ancestors up to the closest with a next sibling
+            while True:
+                next_tag = tag._next_sibling
+                parent = tag._parent
+                yield tag
+                if next_tag is not None:
+                    tag = next_tag
+                    break
+                if parent is self:
+                    return
+                tag = parent
     
     @property
     def children(self):
+        """
+        Iterable over self's children that doesn't copy them. See __iter__.
+        """
         return self
     
     @property
@@ -398,6 +913,40 @@ class Tag(object):
         """
         return self._self_closing
     
+    @property
+    def name(self):
+        """
+        The name of self.
+        """
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._changed()
+        self._name = name
+
+    @property
+    def attrs(self):
+        """
+        The dict of self's attributes.
+        """
+
+        attrs = self._attrs
+        if type(attrs) is SharedAttrs:
+            if self._frozen:
+                #read only, like the rest of self
+                return attrs
+            #the caller may change the dict, so self needs one of its own
+            attrs = self._attrs = dict(attrs.iteritems())
+        #and the digest can't be trusted once it does
+        self._changed()
+        return attrs
+
+    @attrs.setter
+    def attrs(self, attrs):
+        self._changed()
+        self._attrs = attrs
+
     @property    
     def encoder(self):
         """
@@ -410,6 +959,7 @@ class Tag(object):
         """
         Sets the encoder property.
         """
+        self._changed()
         self._encoder = encoder
 
     def last_descendant(self, accept_self=True):
@@ -417,38 +967,117 @@ class Tag(object):
         Finds the last direct child of this element.
         """
 
-        last_child = self.contents[len(self.contents)-1]
-        return last_child    
+        if self._last_child is None:
+            raise IndexError("list index out of range")
+        return self._last_child
 
     def decompose(self):
         """
-        Recursively destroys the contents of tree rooted at self.
+        Destroys the tree rooted at self.
+
+        Self is extracted, and then self and its descendants are cleared in
+        a single walk, without unlinking them one by one.
         """
-        self.extract()
-        i = self
 
-        #decompose children
-        for child in i.children:
-            child.decompose()
-        del i.contents[:]
+        self._check_destroyable()
+        if self._parent is not None:
+            self._parent._unlink(self)
+        self._destroy()
+
+    def _check_destroyable(self):
+        """
+        Raises FrozenTagException if self or one of its descendants is
+        frozen, before any of them changes.
+        """
+
+        self._changed()
+        for tag in self.walk(prune=_is_frozen):
+            if tag._frozen:
+                tag._changed()
+
+    def _destroy(self):
+        """
+        Clears the slots of the parentless self and its descendants.
+        """
+
+        #the walk has moved past a tag by the time it's yielded
+        for tag in self.walk(post_order=True):
+            tag._clear_slots()
+        self._clear_slots()
+
+    def dispose(self):
+        """
+        Tears the tree rooted at self down, so that reference counting frees
+        it without waiting for the cyclic garbage collector.
+
+        Self is extracted, and self and all of its descendants are left
+        without parent, siblings or children; their other properties are
+        kept. The tree is taken apart in a single walk, so it takes no
+        recursion whatever its depth. A frozen tree can be disposed as a
+        whole once nothing uses it anymore; disposing a tag within it raises
+        FrozenTagException, like the other tree manipulation methods, before
+        anything changes.
+        """
+
+        if self._parent is not None:
+            self._parent._unlink(self)
+        for tag in self.walk(post_order=True):
+            #the walk has moved past tag's children and siblings by now
+            tag._parent = tag._next_sibling = tag._previous_sibling = None
+            tag._unlink_children()
+        self._unlink_children()
+
+    def _unlink_children(self):
+        """
+        Forgets self's children and everything built from them, without
+        touching the children.
+        """
+
+        self._first_child = self._last_child = None
+        self._child_count = 0
+        self._contents = None
+        self._subtree_index = None
+        self._digest = None
+        self._output = None
+        self._version += 1
+
+    def _clear_slots(self):
+        """
+        Deletes all of self's attributes, the slotted version of
+        clearing a __dict__.
+        """
 
-        #decompose self
-        i.__dict__.clear()
+        for slot in _slot_names(type(self)):
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                pass
     
     def clear_children(self, decompose=False):
         """
         Extract all children. If decompose is True, decompose instead.
+
+        The children are unlinked together in a single pass.
         """
 
+        children = self._children_list()
+        if not children:
+            return
         if decompose:
-            for element in self.contents[:]:
-                if isinstance(element, Tag):
-                    element.decompose()
-                else:
-                    element.extract()
-        else:
-            for element in self.contents[:]:
-                element.extract()
+            for child in children:
+                child._check_destroyable()
+        self._changed()
+        #only the ancestors' indexes need to drop the children, self's
+        #is left empty
+        self._subtree_index = None
+        if self._parent is not None:
+            self._parent._index_unlinked(children)
+        for child in children:
+            child._parent = child._next_sibling = child._previous_sibling = None
+        self._unlink_children()
+        if decompose:
+            for child in children:
+                child._destroy()
     
     def get(self, key, default=None):
         """
@@ -456,10 +1085,10 @@ class Tag(object):
         the value given for 'default' if it doesn't have that
         attribute.
         """
-        return self.attrs.get(key, default)
+        return self._attrs.get(key, default)
     
     def has_attr(self, key):
-        return key in self.attrs
+        return key in self._attrs
     
     def is_equal(self, other):
         """
@@ -473,10 +1102,10 @@ class Tag(object):
             return False
         #compare only the properties and not the relationship
         if (not hasattr(other, 'name') or
-            not hasattr(other, 'attrs') or
-            not hasattr(other, 'contents') or
+            not hasattr(other, '_attrs') or
+            not hasattr(other, '_first_child') or
             self.name != other.name or
-            self.attrs != other.attrs or
+            self._attrs != other._attrs or
             self.namespace != other.namespace or
             self._self_closing != other._self_closing or
             self._type != other._type):
@@ -499,72 +1128,272 @@ class Tag(object):
         Its contents are a copy of the old Tag's main and sub meta data.
         """
 
-        clone = Tag()
-        setattr(clone, 'name', getattr(self, 'name'))
-        setattr(clone, 'attrs', getattr(self, 'attrs'))
-        setattr(clone, 'namespace', getattr(self, 'namespace'))
-        setattr(clone, '_self_closing', getattr(self, '_self_closing'))
-        setattr(clone, '_type', getattr(self, '_type'))        
-        setattr(clone, '_encoder', getattr(self, '_encoder'))
+        return self.clone(deep=False)
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    def clone(self, deep=True):
+        """
+        Returns a copy of self that isn't part of a tree and, if deep is
+        True, has copies of self's descendants as its children.
+
+        A clone has self's class and properties. Its attrs are a copy of
+        self's that keeps their order, see SharedAttrs, and values are
+        shared. The tree is copied in a single walk, with the digests, so
+        cloning a prebuilt tree is much cheaper than building it again. A
+        clone of a frozen tree isn't frozen.
+        """
+
+        clone = self._clone_tag()
+        if self._first_child is None:
+            return clone
+        if not deep:
+            #the children the digest and the code cover aren't copied
+            clone._digest = None
+            clone._output = None
+            return clone
+        #the clones of the tags with children, by id() of the tag
+        parents = {id(self): clone}
+        for tag in self.walk():
+            copy = tag._clone_tag()
+            if tag._first_child is not None:
+                parents[id(tag)] = copy
+            #append to the cloned parent, the clone has no index to keep
+            parent = parents[id(tag._parent)]
+            copy._parent = parent
+            last_child = parent._last_child
+            if last_child is None:
+                parent._first_child = copy
+            else:
+                last_child._next_sibling = copy
+                copy._previous_sibling = last_child
+            parent._last_child = copy
+            parent._child_count += 1
+        return clone
 
+    def _clone_tag(self):
+        """
+        Returns a childless copy of self, see clone.
+        """
+
+        cls = type(self)
+        clone = cls.__new__(cls)
+        Tag.__init__(clone)
+        for slot in _property_slots(cls):
+            try:
+                setattr(clone, slot, getattr(self, slot))
+            except AttributeError:
+                pass
+        attrs = self._attrs
+        if type(attrs) is not SharedAttrs:
+            attrs = SharedAttrs(attrs)
+        clone._attrs = attrs
+        #the digest and the code cover the properties and the children,
+        #which the clone of a subtree has the same
+        clone._digest = self._digest
+        clone._output = self._output
         return clone
 
+    def dumps(self):
+        """
+        Returns the tree rooted at self in the compact binary format of the
+        serialization module, for Tag.loads.
+        """
+
+        #the module needs Tag
+        from .serialization import dumps
+        return dumps(self)
+
+    @staticmethod
+    def loads(data):
+        """
+        Returns a tree read from the data returned by dumps.
+        """
+
+        from .serialization import loads
+        return loads(data)
+
+    def __getstate__(self):
+        """
+        Returns the values of self's slots for pickle, which finds no
+        __dict__ to keep with protocols 0 and 1. The search index and the
+        kept code are left out, they're built again by the next search and
+        the next write.
+        """
+
+        return dict((name, getattr(self, name)) for name in _slot_names(type(self))
+                    if name not in _UNPICKLED_SLOTS)
+
+    def __setstate__(self, state):
+        for name in _UNPICKLED_SLOTS:
+            setattr(self, name, None)
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
     def __hash__(self):
-        return str(self).__hash__()
+        """
+        Returns the digest of the tree rooted at self, a hash of self's
+        properties, as compared by is_equal, its text and its children's
+        digests.
+
+        Digests are cached on every tag and dropped on self and its
+        ancestors whenever the tree manipulation methods, tag[key], attrs
+        or name change them, so hashing an unchanged tree is O(1). Changing
+        a tag's value is not tracked unless its class tracks it, like
+        SimpleHTMLElement.value.
+        """
+
+        digest = self._digest
+        if digest is None:
+            #the digests of the descendants come first, without recursion
+            for tag in self.walk(post_order=True, prune=_has_digest):
+                if tag._digest is None:
+                    tag._digest = tag._merkle_digest()
+            digest = self._digest = self._merkle_digest()
+        return digest
+
+    def freeze(self):
+        """
+        Makes the tree rooted at self read only and returns self.
+
+        The tree manipulation methods, tag[key] and the name and attrs
+        setters raise FrozenTagException for a frozen tag or its children,
+        and the attrs of a frozen tag can be read but not changed. A frozen
+        tree can still be moved, as a whole, into or out of a tree that
+        isn't frozen. There's no unfreezing; a copy is needed to change it
+        again.
+
+        The digests of the tree are computed here and stay valid. So does
+        the code generate() keeps on the tags, see write, which
+        only ever replaces it whole, so generate() can be called from
+        several threads at once. The name indexes already built are
+        compacted and sorted here, so that searches never change them, and
+        searches only build the missing ones whole, so searching is safe
+        too.
+        """
+
+        hash(self)
+        for tag in chain([self], self.walk()):
+            if type(tag._attrs) is not SharedAttrs:
+                tag._attrs = SharedAttrs(tag._attrs)
+            if tag._subtree_index is not None:
+                tag._subtree_index.settle(tag)
+            tag._frozen = True
+        return self
+
+    @property
+    def frozen(self):
+        """
+        True if self was frozen by freeze.
+        """
+        return self._frozen
+
+    def _merkle_digest(self):
+        """
+        Returns the digest of self from its own properties and the digests
+        of its children, which must be known.
+        """
+
+        digests = []
+        child = self._first_child
+        while child is not None:
+            digests.append(child._digest)
+            child = child._next_sibling
+        return hash((self._own_digest(), tuple(digests)))
+
+    def _own_digest(self):
+        """
+        Returns a hash of the properties of self that is_equal compares and
+        of its text.
+        """
+
+        return hash((self.name, self.namespace, self._self_closing, self._type,
+                     _attrs_digest(self._attrs), self.text))
+
+    def _changed(self):
+        """
+        Called before self or its children change. Raises
+        FrozenTagException if self is frozen, and drops the digests and the
+        generated code of self and its ancestors.
+
+        A tag with a digest only has descendants with digests, and one with
+        generated code only has descendants with code, so this stops at the
+        first ancestor with neither.
+        """
+
+        if self._frozen:
+            raise FrozenTagException("Cannot change a frozen tag.")
+        tag = self
+        while tag is not None and (tag._digest is not None or tag._output is not None):
+            tag._digest = None
+            tag._output = None
+            tag = tag._parent
     
     def __getitem__(self, key):
         """tag[key] returns the value of the 'key' attribute for the tag,
         and throws an exception if it's not there."""
-        return self.attrs[key]
+        return self._attrs[key]
     
     def __iter__(self):
         """
-        Iterating over a tag iterates over (a copy of)its children.
+        Iterating over a tag iterates over its children.
+
+        The iteration follows the chain of children without copying it.
+        Like with a dict, adding or removing children of self while iterating
+        raises RuntimeError; iterate over list(tag) to modify the children
+        in the loop.
         """
 
-        # return iter() to make the purpose of the method clear
-        #also iterate over a copy since there's a legitimate possibility
-        #that the loop that iterates with self.children might also be
-        #modifying self.contents
-        return iter(list(self.contents))
+        version = self._version
+        child = self._first_child
+        while child is not None:
+            yield child
+            if self._version != version:
+                raise RuntimeError("Tag children changed during iteration")
+            child = child._next_sibling
     
     def __len__(self):
         "The length of a tag is the length of its list of contents."
-        return len(self.contents)
+        return self._child_count
     
     def __contains__(self, x):
         """
         Returns True if x is a direct child of self.
         """
-        return x in self.contents
+        return x in self._cached_contents()
     
     def __setitem__(self, key, value):
         """Setting tag[key] sets the value of the 'key' attribute for the
         tag."""
+        self._changed()
         self.attrs[key] = value
     
     def __delitem__(self, key):
         "Deleting tag[key] deletes all 'key' attributes for the tag."
-        self.attrs.pop(key, None)
+        if key in self._attrs:
+            self._changed()
+            del self.attrs[key]
     
     def __eq__(self, other):
         """
         Returns true iff this tag has the same name, the same attributes,
-        and the same contents (recursively) as the given tag.
+        the same text and the same contents (recursively) as the given tag.
+
+        Trees with different digests, see __hash__, are told apart without
+        comparing them.
         """
 
-        if self.is_equal(other):
-            if self is other:
-                return True
-            #if the properties match, compare the
-            #relationship excluding my parents
-            if len(self) != len(other):
-                return False
-        else:
+        if self is other:
+            return True
+        if not isinstance(other, Tag) or hash(self) != hash(other):
             return False
-        
-        for i, my_child in enumerate(self.contents):
-            if my_child != other.contents[i]:
+
+        #the digests may collide, so compare the trees tag by tag. The same
+        #number of children at every step gives the same shape.
+        for mine, theirs in izip(chain([self], self.walk()), chain([other], other.walk())):
+            if (mine._child_count != theirs._child_count or not mine.is_equal(theirs) or
+                mine.text != theirs.text):
                 return False
         return True
     
@@ -617,18 +1446,9 @@ class Tag(object):
         Returns indent_level number of tabs or spaces.
         """
 
-        indents =''
-        indent_char = ''
         if SPACES:
-            indent_char = ' '
-        else:
-            indent_char = '\t'
-        
-        while indent_level > 0:
-            indents += indent_char
-            indent_level -= 1
-        
-        return indents
+            return ' ' * indent_level
+        return '\t' * indent_level
           
     #Search methods    
     def find(self, name=None, attrs={}, recursive=True, text=None, _type=None,
@@ -636,12 +1456,10 @@ class Tag(object):
         """
         Return only the first child of this Tag matching the given
         criteria.
+
+        The search stops at the first match, see iter_find.
         """
-        r = None
-        l = self.find_all(name, attrs, recursive, text, _type, 1, **kwargs)
-        if l:
-            r = l[0]
-        return r
+        return next(self.iter_find(name, attrs, recursive, text, _type, **kwargs), None)
     
     def find_all(self, name=None, attrs={}, recursive=True, text=None, _type=None,
                  limit=None, **kwargs):
@@ -652,20 +1470,43 @@ class Tag(object):
 
         The value of a key-value pair in the 'attrs' map can be a
         string, a list of strings.
+
+        A recursive search by name or _type only looks at the descendants
+        indexed under that name or _type. See _indexed.
+        """
+
+        return _limited(self.iter_find(name, attrs, recursive, text, _type, **kwargs),
+                        limit)
+
+    def iter_find(self, name=None, attrs={}, recursive=True, text=None, _type=None,
+                  **kwargs):
+        """
+        Generator version of find_all.
+
+        The criteria are compiled into a single test once per call and the
+        search goes only as far as the caller consumes the generator. Like
+        with walk, the tree must not be changed while iterating.
         """
 
-        generator = self.descendants
         if not recursive:
             generator = self.children
-        return self._find_all(name, attrs, text, _type, limit, generator, **kwargs)
+        elif name is not None:
+            generator = self._indexed(name, None)
+            #every indexed tag has the name
+            name = None
+        elif _type is not None:
+            generator = self._indexed(None, _type)
+            _type = None
+        else:
+            generator = self.descendants
+        return _matching(generator, name, attrs, text, _type)
     
     def find_next_sibling(self, name=None, attrs={}, text=None, _type=None, **kwargs):
         """
         Returns the closest sibling to this Tag that matches the
         given criteria and appears after this Tag in the document.
         """
-        return self._find_one(self.find_next_siblings, name, attrs, text, _type, 
-                             **kwargs)
+        return next(_matching(self.next_siblings, name, attrs, text, _type), None)
     
     def find_next_siblings(self, name=None, attrs={}, text=None, _type=None, limit=None,
                            **kwargs):
@@ -680,8 +1521,7 @@ class Tag(object):
         Returns the closest sibling to this Tag that matches the
         given criteria and appears before this Tag in the document.
         """
-        return self._find_one(self.find_previous_siblings, name, attrs, text, _type,
-                             **kwargs)
+        return next(_matching(self.previous_siblings, name, attrs, text, _type), None)
     
     def find_previous_siblings(self, name=None, attrs={}, text=None, _type=None,
                                limit=None, **kwargs):
@@ -697,13 +1537,7 @@ class Tag(object):
         Returns the closest parent of this Tag that matches the given
         criteria.
         """
-        # NOTE: We can't use _find_one because findParents takes a different
-        # set of arguments.
-        r = None
-        l = self.find_parents(name, attrs, _type, 1, **kwargs)
-        if l:
-            r = l[0]
-        return r
+        return next(_matching(self.parents, name, attrs, None, _type), None)
     
     def find_parents(self, name=None, attrs={}, _type=None, limit=None, **kwargs):
         """
@@ -712,18 +1546,26 @@ class Tag(object):
         """
         return self._find_all(name, attrs, None, _type, limit, self.parents,
                              **kwargs)
-    
-    def _find_one(self, method, name, attrs, text, _type=None, **kwargs):
+
+    def select(self, selector, limit=None):
+        """
+        Returns the descendants of this Tag that match the CSS selector,
+        like 'body > form#0 input[type=hidden]', in document order.
+
+        The selector is compiled once and cached, and the tree is searched
+        in a single pass, through the name index when the selector names
+        its tags. See the selector module for what is supported.
+        """
+
+        return compile_selector(selector).select(self, limit)
+
+    def select_one(self, selector):
         """
-        Proxy method that calls the 'method' argument and returns the first item from
-        the result list.
+        Returns the first descendant of this Tag that matches the CSS
+        selector, None if there is none.
         """
 
-        r = None
-        l = method(name, attrs, text, _type, 1, **kwargs)
-        if l:
-            r = l[0]
-        return r
+        return next(compile_selector(selector).iter_select(self), None)
 
     #Does the real heavy lifting.
     def _find_all(self, name, attrs, text, _type, limit, generator, **kwargs):
@@ -731,50 +1573,7 @@ class Tag(object):
         Iterates over a generator looking for things that match.
         """
 
-        results = []
-        more_than_one = 0
-        for tag in generator:
-            if limit is not None and len(results) >= limit:
-                break
-            
-            more_than_one += 1
-            result = True
-            tag_name    = tag.name
-            tag_type    = tag._type
-            tag_attrs   = tag.attrs
-            tag_text    = tag.text            
-
-            if name is not None:
-                if not name == tag_name:
-                    result = result and False
-            if _type is not None:
-                _type = _type.lower()
-                result = result and _type == tag_type
-            if text is not None:
-                result_ = True
-                if tag_text is not None:
-                    result_ = text in tag_text                    
-                else:
-                    result_ = False                
-                result = result and result_
-            if attrs is not None and len(attrs) > 0:
-                result_ = None
-                if tag_attrs is not None:
-                    result_ = True
-                    for key, value in attrs.iteritems():
-                        if key in tag_attrs and value in tag_attrs[key]:
-                            result_ = result_ and True
-                        else:
-                            result_ = result_ and False
-                            break
-                else:
-                    result_ = False
-                result = result and result_
-            
-            if result and more_than_one >0:
-                results.append(tag)
-    
-        return results
+        return _limited(_matching(generator, name, attrs, text, _type), limit)
 
     #sub-class specific implementations
     def generate_from_children(self, indent_level=0, encode=None):
@@ -782,14 +1581,20 @@ class Tag(object):
         Returns code generated from children.
         """
 
-        text = ''
-        for child in self.children:
-            child_text = child.generate(indent_level=indent_level,
-                                        encode=encode)
-            if child_text and len(child_text):                
-                text += "\r\n"+child_text
-            child_text = ''
-        return text
+        writer = Writer()
+        self.write_children(writer, indent_level, encode)
+        return writer.getvalue()
+
+    def write_children(self, writer, indent_level=0, encode=None, first_break=True):
+        """
+        Writes the code of each child on a line of its own, see write.
+        Children that generate nothing are left out, and there's no line
+        break before the first child if first_break is False.
+        """
+
+        _write(writer, None, indent_level, encode,
+               [_Frame(self, indent_level, encode, None, None,
+                       (indent_level, encode, first_break))])
 
     def generate_for_attrs(self):
         """
@@ -801,13 +1606,88 @@ class Tag(object):
         """
         Generates code for tree rooted at self.
 
-        Inheriting classes need to implement this.
+        The tree is written into a single Writer that is joined once, see
+        write, so every part of the code is copied once whatever the depth
+        of the tree.
 
         encode = A callable object that is provided by
         the parent to perform encoding of the children.
         """
 
-        return ''
+        writer = Writer()
+        self.write(writer, indent_level, encode)
+        return writer.getvalue()
+
+    def generate_to(self, sink, chunk_size=CHUNK_SIZE, encoding=DEFAULT_OUTPUT_ENCODING,
+                    indent_level=0):
+        """
+        Generates code for the tree rooted at self into sink, a file-like
+        object or a socket, in chunks of about chunk_size characters, see
+        StreamWriter.
+
+        Only a chunk of the code is held at a time, along with the parts
+        bigger than a chunk, like the text of a big file, which the tree
+        holds anyway.
+        """
+
+        writer = StreamWriter(sink, chunk_size, encoding)
+        self.write(writer, indent_level)
+        writer.flush()
+
+    def generate_bytes(self, buffer=None, encoding=DEFAULT_OUTPUT_ENCODING, indent_level=0):
+        """
+        Generates the code for the tree rooted at self encoded with
+        encoding, appended to the bytearray buffer or to a new one, which
+        is returned, see BytesWriter.
+
+        Unlike generate(), no unicode copy of the code is made to be
+        encoded afterwards, and a memoryview of the buffer gives slices of
+        the code without copying them.
+        """
+
+        writer = BytesWriter(buffer, encoding)
+        self.write(writer, indent_level)
+        return writer.buffer
+
+    def write(self, writer, indent_level=0, encode=None):
+        """
+        Appends the code for the tree rooted at self to writer, a Writer.
+
+        Every tag appends the code that comes before its children with
+        write_start and the code that comes after them with write_end, and
+        its children are written in between, see write_children. The tags
+        whose children are being written are kept on a stack instead of
+        recursing, so a tree of any depth can be written.
+
+        The code of the last write into a Writer is kept on each tag, and
+        written as is the next time the tag is written with the same
+        indent_level and encode. It's kept if it's one part, like the text
+        of a leaf, which costs no copy, or if it's at most MEMO_SIZE
+        characters. A StreamWriter doesn't keep the parts it wrote out, so
+        it only reuses code. Changing a tag drops the code of the tag and
+        its ancestors, see _changed, so generating a tree again after a
+        small change writes only the changed tags and their ancestors.
+        """
+
+        _write(writer, self, indent_level, encode, [])
+
+    def write_start(self, writer, indent_level=0, encode=None):
+        """
+        Appends the code that comes before self's children to writer, and
+        returns the indent_level, encode and first_break to write the
+        children with, see write_children, or None if they're not written.
+
+        Inheriting classes need to implement this.
+        """
+        return None
+
+    def write_end(self, writer, indent_level=0, encode=None, children_written=False):
+        """
+        Appends the code that comes after self's children to writer, if
+        write_start had them written. children_written is True if they
+        wrote anything.
+        """
+        pass
     
     @property
     def string(self):
@@ -817,4 +1697,604 @@ class Tag(object):
         Subclasses should reimplement this.
         """
         return ''
-    
\ No newline at end of file
+
+    @property
+    def text(self):
+        """
+        The text held by this tag that find_all(text=...) matches against.
+
+        None if the tag holds no text. Subclasses should reimplement this.
+        """
+        return None
+
+class Fragment(Tag):
+    """
+    A holder of a run of tags that is never part of a tree itself, like a
+    DOM DocumentFragment.
+
+    Inserting a fragment inserts its children in its place, relinking the
+    run in one splice, and leaves the fragment empty. Helpers that build a
+    run of tags return a fragment instead of an element that the caller
+    would have to unwrap.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, children=None):
+        super(Fragment, self).__init__()
+        if children is not None:
+            self.extend(children)
+
+    def extract(self):
+        #a fragment has no parent to be extracted from
+        return self
+
+    def write_start(self, writer, indent_level=0, encode=None):
+        """
+        Has the children written one after another.
+        """
+
+        return indent_level, encode, False
+
+class Mount(Tag):
+    """
+    A leaf that generates a frozen tree shared with other mounts, so the
+    same content can be part of many trees without being copied into
+    each of them.
+
+    The shared tree is held in value and isn't part of the tree the mount
+    is in, searches and walks don't enter it. A mount has no children of
+    its own.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, tree):
+        super(Mount, self).__init__()
+        if not tree.frozen:
+            tree.freeze()
+        self.value = tree
+
+    def is_equal(self, other):
+        return (super(Mount, self).is_equal(other) and type(other) is type(self) and
+                other.value == self.value)
+
+    def _own_digest(self):
+        return hash((super(Mount, self)._own_digest(), hash(self.value)))
+
+    def write_start(self, writer, indent_level=0, encode=None):
+        """
+        Writes the code for the shared tree as if it were in place of self.
+        """
+
+        self.value.write(writer, indent_level, encode)
+
+class Writer(object):
+    """
+    Collects the code written by Tag.write, see Tag.generate.
+
+    Parts are appended in order and joined once. The line breaks between
+    children are only counted in breaks until something else is written,
+    so that the children that write nothing have none. written counts the
+    parts written so far, and size their characters.
+    """
+
+    __slots__ = ('parts', 'breaks', 'written', 'size')
+
+    #whether tags keep the code they write, see Tag.write
+    memoizes = True
+
+    def __init__(self):
+        self.parts = []
+        self.breaks = 0
+        self.written = 0
+        self.size = 0
+
+    def append(self, text):
+        """
+        Writes text after the pending line breaks. Empty text is ignored.
+        """
+
+        if not text:
+            return
+        if self.breaks:
+            self.parts.append(LINE_BREAK * self.breaks)
+            self.breaks = 0
+        self.parts.append(text)
+        self.written += 1
+        self.size += len(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+class BytesWriter(Writer):
+    """
+    A Writer that encodes the code into a bytearray as it's written, see
+    Tag.generate_bytes.
+
+    Each part is encoded on its own, joining the str parts, like the
+    markup and the script templates, with the unicode parts, like the text
+    escaped by Encoder, would decode every str part into a unicode copy of
+    the whole code. With an encoding that encodes ASCII to itself, like
+    UTF-8, the str parts are copied as they are. With any other, like
+    UTF-16, all the parts go through a single incremental encoder, which
+    writes a byte order mark once if the encoding has one.
+    """
+
+    __slots__ = ('buffer', 'encoding', '_encode')
+
+    memoizes = False
+
+    def __init__(self, buffer=None, encoding=DEFAULT_OUTPUT_ENCODING):
+        super(BytesWriter, self).__init__()
+        if buffer is None:
+            buffer = bytearray()
+        self.buffer = buffer
+        self.encoding = encoding
+        if _ASCII.decode('ascii').encode(encoding) == _ASCII:
+            self._encode = None
+        else:
+            self._encode = codecs.getincrementalencoder(encoding)().encode
+
+    def append(self, text):
+        if not text:
+            return
+        if self.breaks:
+            self._extend(LINE_BREAK * self.breaks)
+            self.breaks = 0
+        self.size += self._extend(text)
+        self.written += 1
+
+    def _extend(self, text):
+        """
+        Appends text to the buffer, encoded, and returns its encoded length.
+        """
+
+        if self._encode is not None:
+            if not isinstance(text, unicode):
+                text = text.decode('ascii')
+            text = self._encode(text)
+        elif isinstance(text, unicode):
+            text = text.encode(self.encoding)
+        self.buffer += text
+        return len(text)
+
+    def getvalue(self):
+        return str(self.buffer)
+
+class StreamWriter(Writer):
+    """
+    A Writer that writes the code into a sink, in chunks of about
+    chunk_size characters, see Tag.generate_to.
+
+    The sink is written to with its write method, or its sendall method
+    for a socket. Unicode chunks are encoded with encoding. If encoding is
+    None, all chunks are written as unicode, for text sinks like
+    io.StringIO.
+    """
+
+    __slots__ = ('_write', '_chunk_size', '_encoding', '_size')
+
+    memoizes = False
+
+    def __init__(self, sink, chunk_size=CHUNK_SIZE, encoding=DEFAULT_OUTPUT_ENCODING):
+        super(StreamWriter, self).__init__()
+        self._write = getattr(sink, 'write', None) or sink.sendall
+        self._chunk_size = chunk_size
+        self._encoding = encoding
+        #characters appended since the last flush
+        self._size = 0
+
+    def append(self, text):
+        Writer.append(self, text)
+        self._size += len(text)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the parts appended so far to the sink.
+        """
+
+        parts = self.parts
+        if not parts:
+            return
+        text = parts[0] if len(parts) == 1 else ''.join(parts)
+        del parts[:]
+        self._size = 0
+        #a part bigger than a chunk, like the content of a file, is written
+        #in slices so that it's never encoded whole
+        chunk_size = self._chunk_size
+        for start in xrange(0, len(text), chunk_size):
+            chunk = text[start:start + chunk_size]
+            if self._encoding is None:
+                chunk = unicode(chunk)
+            elif isinstance(chunk, unicode):
+                chunk = chunk.encode(self._encoding)
+            self._write(chunk)
+
+    def getvalue(self):
+        raise ValueError("The code was written to the sink.")
+
+class _Frame(object):
+    """
+    A tag whose children _write is writing.
+    """
+
+    __slots__ = ('tag', 'indent_level', 'encode', 'mark', 'written', 'child',
+                 'child_indent_level', 'child_encode', 'line_break', 'child_written')
+
+    def __init__(self, tag, indent_level, encode, mark, written, children):
+        self.tag = tag
+        self.indent_level = indent_level
+        self.encode = encode
+        #where the code of tag starts, if it's to be kept, see _keep_output
+        self.mark = mark
+        #parts written before the children, None if only the children are
+        #written
+        self.written = written
+        #the next child to write
+        self.child = tag._first_child
+        self.child_indent_level, self.child_encode, self.line_break = children
+        #parts written before the child being written, None before the
+        #first
+        self.child_written = None
+
+def _write(writer, tag, indent_level, encode, stack):
+    """
+    Writes the tree rooted at tag, if it's not None, and then the rest of
+    the children of the tags on stack, see Tag.write.
+    """
+
+    while True:
+        if tag is not None:
+            output = tag._output
+            if output is not None and output[0] == indent_level and output[1] == encode:
+                writer.append(output[2])
+            else:
+                mark = None
+                if writer.memoizes and isinstance(tag, Tag):
+                    mark = (len(writer.parts), writer.breaks, writer.size)
+                children = tag.write_start(writer, indent_level, encode)
+                if children is not None:
+                    stack.append(_Frame(tag, indent_level, encode, mark, writer.written,
+                                        children))
+                elif mark is not None:
+                    _keep_output(tag, writer, indent_level, encode, mark)
+
+        #the next tag to write, ending the tags whose children are all written
+        tag = None
+        while stack:
+            frame = stack[-1]
+            if frame.child_written is not None:
+                if writer.written == frame.child_written:
+                    if frame.line_break:
+                        #the child wrote nothing
+                        writer.breaks -= 1
+                else:
+                    frame.line_break = True
+            tag = frame.child
+            if tag is not None:
+                frame.child = tag._next_sibling
+                frame.child_written = writer.written
+                if frame.line_break:
+                    #written only if the child writes something
+                    writer.breaks += 1
+                indent_level, encode = frame.child_indent_level, frame.child_encode
+                break
+            stack.pop()
+            if frame.written is not None:
+                frame.tag.write_end(writer, frame.indent_level, frame.encode,
+                                    writer.written > frame.written)
+                if frame.mark is not None:
+                    _keep_output(frame.tag, writer, frame.indent_level, frame.encode,
+                                 frame.mark)
+        if tag is None:
+            return
+
+def _keep_output(tag, writer, indent_level, encode, mark):
+    """
+    Keeps the code written into writer since mark on tag, if it's cheap
+    to, see Tag.write.
+    """
+
+    start, breaks, size = mark
+    parts = writer.parts
+    #the line breaks pending before tag may come first, in a part of their
+    #own
+    if len(parts) - start > 2 and writer.size - size > MEMO_SIZE:
+        return
+    parts = parts[start:]
+    if parts and breaks:
+        #they belong to the code before tag
+        parts[0] = parts[0][len(LINE_BREAK) * breaks:]
+        if not parts[0]:
+            del parts[0]
+    if len(parts) == 1:
+        tag._output = (indent_level, encode, parts[0])
+    elif writer.size - size <= MEMO_SIZE:
+        tag._output = (indent_level, encode, ''.join(parts))
+
+def _has_digest(tag):
+    return tag._digest is not None
+
+def _hashable(value):
+    """
+    Returns a hashable stand in for an attribute value that is equal for
+    equal values.
+    """
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return frozenset((key, _hashable(item)) for key, item in value.iteritems())
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_hashable(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        #equal values must hash the same, so only the type is left
+        return type(value).__name__
+    return value
+
+def _attrs_digest(attrs):
+    """
+    Returns a hash of attrs that doesn't depend on the order of the keys.
+    """
+
+    if not attrs:
+        return 0
+    return hash(frozenset((key, _hashable(value)) for key, value in attrs.iteritems()))
+
+def _compile_query(name, attrs, text, _type):
+    """
+    Compiles the find_all criteria into a single test of a tag.
+
+    Returns None if there are no criteria.
+    """
+
+    tests = []
+    if name is not None:
+        tests.append(lambda tag: name == tag.name)
+    if _type is not None:
+        #lower the type once instead of once per tag
+        _type = _type.lower()
+        tests.append(lambda tag: _type == tag._type)
+    if text is not None:
+        def test_text(tag):
+            tag_text = tag.text
+            return tag_text is not None and text in tag_text
+        tests.append(test_text)
+    if attrs:
+        attrs = attrs.items()
+        def test_attrs(tag):
+            tag_attrs = tag._attrs
+            if tag_attrs is None:
+                return False
+            for key, value in attrs:
+                if not (key in tag_attrs and value in tag_attrs[key]):
+                    return False
+            return True
+        tests.append(test_attrs)
+
+    if not tests:
+        return None
+    if len(tests) == 1:
+        return tests[0]
+    def test_all(tag):
+        for test in tests:
+            if not test(tag):
+                return False
+        return True
+    return test_all
+
+def _matching(generator, name, attrs, text, _type):
+    """
+    Returns an iterator over the tags of generator that match the criteria.
+    """
+
+    test = _compile_query(name, attrs, text, _type)
+    if test is None:
+        return iter(generator)
+    return ifilter(test, generator)
+
+def _limited(matches, limit):
+    """
+    Returns a list of at most limit of matches, all of them if limit is None.
+    """
+
+    if limit is not None:
+        matches = islice(matches, max(limit, 0))
+    return list(matches)
+
+def _is_frozen(tag):
+    return tag._frozen
+
+#class -> the names of all its slots
+_SLOT_NAMES = {}
+
+def _slot_names(cls):
+    """
+    Returns the names of the slots declared by cls and its bases.
+    """
+
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = _SLOT_NAMES[cls] = [slot for klass in cls.__mro__
+                                    for slot in klass.__dict__.get('__slots__', ())]
+    return names
+
+#the slots of a Tag that hold its place in a tree or are computed from it
+_TREE_SLOTS = frozenset(['_attrs', '_parent', '_next_sibling', '_previous_sibling',
+                         '_first_child', '_last_child', '_child_count', '_contents',
+                         '_position', '_version', '_subtree_index', '_digest', '_frozen',
+                         '_output'])
+
+#the slots of a Tag that pickle leaves out, the index is keyed by the id()
+#of the tags and the kept code holds the encode function it was written with
+_UNPICKLED_SLOTS = frozenset(['_subtree_index', '_output'])
+
+#class -> the names of the slots that clone copies
+_PROPERTY_SLOTS = {}
+
+def _property_slots(cls):
+    """
+    Returns the names of the slots of cls that hold properties of a tag,
+    those declared by subclasses included.
+    """
+
+    names = _PROPERTY_SLOTS.get(cls)
+    if names is None:
+        names = _PROPERTY_SLOTS[cls] = [slot for slot in _slot_names(cls)
+                                        if slot not in _TREE_SLOTS]
+    return names
+
+def _subtree_nodes(children):
+    """
+    Returns the given children and their descendants in document order.
+    """
+
+    nodes = []
+    for child in children:
+        nodes.append(child)
+        nodes.extend(child.descendants)
+    return nodes
+
+class _SubtreeIndex(object):
+    """
+    Index of the descendants of a Tag by name and by _type.
+
+    Each key maps to a list of the matching descendants in document order.
+    Removed descendants are left in the lists and dropped once they make
+    up half of a list or the list is looked up. Descendants added anywhere
+    but at the end of the subtree mark their keys as unsorted; an unsorted
+    list is sorted when it's looked up.
+
+    Renaming a tag that is in a tree is not tracked.
+    """
+
+    NAME = 'name'
+    TYPE = '_type'
+
+    def __init__(self):
+        self.lists = {self.NAME : {}, self.TYPE : {}}
+        #id() of every indexed descendant
+        self.members = {}
+        #number of removed entries in each (kind, key) list
+        self.stale = {}
+        #(kind, key) of the lists that aren't in document order
+        self.unsorted = set()
+
+    def add(self, nodes, in_order):
+        """
+        Indexes nodes, which are in document order. in_order tells if they
+        all come after the nodes already indexed.
+        """
+
+        members = self.members
+        for node in nodes:
+            members[id(node)] = node
+            for kind in (self.NAME, self.TYPE):
+                key = getattr(node, kind)
+                matches = self.lists[kind].get(key)
+                if matches is None:
+                    self.lists[kind][key] = [node]
+                    continue
+                matches.append(node)
+                if not in_order:
+                    self.unsorted.add((kind, key))
+
+    def remove(self, nodes):
+        """
+        Drops nodes from the index.
+        """
+
+        members = self.members
+        stale = self.stale
+        removed = set()
+        for node in nodes:
+            del members[id(node)]
+            for kind in (self.NAME, self.TYPE):
+                key = (kind, getattr(node, kind))
+                stale[key] = stale.get(key, 0) + 1
+                removed.add(key)
+        #once all are removed, so that a list is compacted at most once
+        for kind, key in removed:
+            if stale[(kind, key)] * 2 >= len(self.lists[kind][key]):
+                self._compact(kind, key)
+
+    def moved(self, nodes):
+        """
+        Marks the lists holding nodes, which were moved within the
+        subtree, as unsorted.
+        """
+
+        for node in nodes:
+            for kind in (self.NAME, self.TYPE):
+                self.unsorted.add((kind, getattr(node, kind)))
+
+    def get(self, kind, key, root):
+        """
+        Returns the list of descendants of root with the given name or
+        _type, in document order. The list must not be changed.
+        """
+
+        matches = self.lists[kind].get(key)
+        if matches is None:
+            return []
+        if (kind, key) in self.stale:
+            matches = self._compact(kind, key)
+        if (kind, key) in self.unsorted:
+            matches.sort(key=lambda node: _document_path(root, node))
+            self.unsorted.discard((kind, key))
+        return matches
+
+    def settle(self, root):
+        """
+        Compacts and sorts all the lists, so that get doesn't change them
+        anymore while the subtree of root doesn't change.
+        """
+
+        for kind, key in list(self.stale):
+            self._compact(kind, key)
+        for kind, key in self.unsorted:
+            self.lists[kind][key].sort(key=lambda node: _document_path(root, node))
+        self.unsorted.clear()
+
+    def _compact(self, kind, key):
+        """
+        Drops the removed entries from a list.
+
+        A node that was removed and added back is in the list twice;
+        the later entry is the current one, see add.
+        """
+
+        members = self.members
+        seen = set()
+        matches = []
+        for node in reversed(self.lists[kind][key]):
+            node_id = id(node)
+            if node_id in members and node_id not in seen:
+                seen.add(node_id)
+                matches.append(node)
+        matches.reverse()
+        del self.stale[(kind, key)]
+        if not matches:
+            del self.lists[kind][key]
+            self.unsorted.discard((kind, key))
+        else:
+            self.lists[kind][key] = matches
+        return matches
+
+def _document_path(root, node):
+    """
+    Returns the list of positions leading from root down to node.
+    """
+
+    path = []
+    while node is not root:
+        parent = node._parent
+        path.append(parent.index(node))
+        node = parent
+    path.reverse()
+    return path
@@ -0,0 +1,176 @@
+import unittest
+from ..array_tree import ArrayTree, TagHandle
+from ..tag import Fragment, Tag
+from ...html.dom import simple_html_elements as HTMLDocument
+
+class ArrayTreeTest(unittest.TestCase):
+    """
+    Tests ArrayTree and TagHandle against the Tag tree they are copied from.
+    """
+
+    def setUp(self):
+        """
+        Sets up an HTML DOM tree and its ArrayTree copy.
+        """
+
+        self.html_tag = HTMLDocument.HTML()
+        head_tag = HTMLDocument.Head(parent=self.html_tag)
+        HTMLDocument.Meta(attrs={'charset':'UTF-8'}, parent=head_tag)
+        HTMLDocument.Title(title=u'Test \xe9 title', parent=head_tag)
+
+        body_tag = HTMLDocument.Body(parent=self.html_tag)
+        HTMLDocument.BR(parent=body_tag)
+        self.form1 = HTMLDocument.Form(attrs={'id':'form1', 'action':'https://a.b/c'},
+                                       parent=body_tag)
+        HTMLDocument.Label(text='Name:', attrs={'for':'name'}, parent=self.form1)
+        HTMLDocument.Input(attrs={'type':'text', 'id':'name'}, parent=self.form1)
+        HTMLDocument.Input(attrs={'type':'submit', 'value':'<Submit>'}, parent=self.form1)
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text='var a = "<b>";'))
+        script.append(HTMLDocument.Text(text='a += 1;'))
+        body_tag.append(script)
+
+        self.html = ArrayTree.from_tag(self.html_tag)
+
+    def test_a_generate(self):
+        """
+        Tests that the copy generates the same code as the tree.
+        """
+
+        self.assertEqual(self.html.generate(), self.html_tag.generate())
+        self.assertEqual(self.html.find('form').generate(2), self.form1.generate(2))
+        self.assertEqual(self.html.find('title').contents[0].value, u'Test \xe9 title')
+        self.assertTrue(isinstance(self.html.find(text='a +=').value, str))
+
+    def test_b_navigation(self):
+        """
+        Tests the navigation properties.
+        """
+
+        self.assertIsNone(self.html.parent)
+        self.assertEqual([child.name for child in self.html], ['head', 'body'])
+        body = self.html.contents[1]
+        self.assertEqual(body.parent, self.html)
+        self.assertEqual(body.previous.name, 'head')
+        self.assertIsNone(body.next)
+        self.assertEqual(len(body), 3)
+        form = body.contents[1]
+        self.assertEqual(body.index(form), 1)
+        self.assertEqual(form.get('id'), 'form1')
+        self.assertEqual(form['action'], 'https://a.b/c')
+        self.assertTrue(form.has_attr('id'))
+        self.assertEqual([tag.name for tag in form.parents], ['body', 'html'])
+        self.assertEqual([tag.name for tag in self.html.descendants],
+                         [tag.name for tag in self.html_tag.descendants])
+        self.assertEqual([tag.name for tag in self.html.walk(post_order=True)],
+                         [tag.name for tag in self.html_tag.walk(post_order=True)])
+        self.assertEqual([tag.name for tag in self.html.walk(prune=lambda tag: tag.name == 'form')],
+                         [tag.name for tag in self.html_tag.walk(prune=lambda tag: tag.name == 'form')])
+
+    def test_c_search(self):
+        """
+        Tests find_all, find and lookups by tag name.
+        """
+
+        self.assertEqual(len(self.html.find_all('input')), 2)
+        self.assertEqual(self.html.body[0].form[0].label[0].contents[0].value, 'Name:')
+        self.assertEqual(self.html.find_all('input', attrs={'type':'submit'})[0]['value'],
+                         '<Submit>')
+        self.assertEqual(len(self.html.find_all(_type='SCRIPT')), 1)
+        self.assertEqual(len(self.html.find_all(_type='html_text')),
+                         len(self.html_tag.find_all(_type='html_text')))
+        self.assertEqual(self.html.find(text='Name').parent.name, 'label')
+        self.assertEqual(self.html.find_all('no_such_tag'), [])
+        self.assertEqual(len(self.html.find_all(recursive=False)), 2)
+        #the properties of the stored class work on the handle
+        self.assertTrue(self.html.find('script').is_script)
+        self.assertEqual(self.html.find(text='Name').text, 'Name:')
+
+    def test_d_insert_extract(self):
+        """
+        Tests changing the copy's tree.
+        """
+
+        form = self.html.find('form')
+        br = form.insert(HTMLDocument.BR(), 1)
+        self.assertTrue(isinstance(br, TagHandle))
+        self.assertEqual([tag.name for tag in form], ['label', 'br', 'input', 'input'])
+
+        #move within the tree
+        label = form.contents[0]
+        form.append(label)
+        self.assertEqual([tag.name for tag in form], ['br', 'input', 'input', 'label'])
+        self.assertEqual(label.previous.name, 'input')
+
+        form.extract()
+        self.assertIsNone(form.parent)
+        self.assertEqual(self.html.find_all('form'), [])
+        body = self.html.find('body')
+        with self.assertRaises(ValueError):
+            body.insert(self.html)
+
+        body.insert(form, 0)
+        self.form1.insert(HTMLDocument.BR(), 1)
+        self.form1.append(self.form1.contents[0])
+        self.html_tag.find('body').insert(self.form1, 0)
+        self.assertEqual(self.html.generate(), self.html_tag.generate())
+
+        #a read after an insert joins only the text that was added
+        texts = self.html._tree._texts[0]
+        self.assertEqual(form.find(text='Name').text, 'Name:')
+        first_chunk = texts._chunks[0]
+        for i in range(3):
+            form.append(HTMLDocument.Label(text='Label {}'.format(i)))
+            self.assertEqual([tag.text for tag in form.find_all(text='Label')],
+                             ['Label {}'.format(j) for j in range(i + 1)])
+            self.assertEqual(form.find(text='Name').text, 'Name:')
+        self.assertIs(texts._chunks[0], first_chunk)
+
+    def test_f_splice(self):
+        """
+        Tests inserting runs of children into the copy.
+        """
+
+        form = self.html.find('form')
+        label = form.contents[0]
+        brs = form.splice(1, [HTMLDocument.BR(), label, HTMLDocument.BR()])
+        self.assertEqual([tag.name for tag in form], ['br', 'label', 'br', 'input', 'input'])
+        self.assertEqual(form.contents[1], label)
+        self.assertEqual(brs[1], label)
+        self.form1.splice(1, [HTMLDocument.BR(), self.form1.contents[0], HTMLDocument.BR()])
+        self.assertEqual(self.html.generate(), self.html_tag.generate())
+
+        form.extend([self.html.find('meta')])
+        self.assertEqual(form.contents[-1].name, 'meta')
+        #a fragment's children are copied in its place
+        brs = form.insert(Fragment([HTMLDocument.BR(), HTMLDocument.BR()]), 0)
+        self.assertEqual([tag.name for tag in form.contents[:3]], ['br', 'br', 'br'])
+        self.assertEqual(brs, form.contents[:2])
+        with self.assertRaises(ValueError):
+            form.extend([label, label])
+
+    def test_e_to_tag(self):
+        """
+        Tests copying back to a Tag tree.
+        """
+
+        html_tag = self.html.to_tag()
+        self.assertTrue(isinstance(html_tag, HTMLDocument.HTML))
+        self.assertEqual(html_tag, self.html_tag)
+        self.assertEqual(html_tag.generate(), self.html_tag.generate())
+        self.assertEqual(html_tag.find('title').contents[0].value, u'Test \xe9 title')
+
+        #tags without a value
+        fragment = Fragment([Tag(), HTMLDocument.BR()])
+        fragment.contents[0].name = 'plain'
+        fragment.contents[0].append(Tag())
+        copy = ArrayTree.from_tag(fragment)
+        self.assertIsNone(copy.contents[0].value)
+        self.assertIsNone(copy._tree._value(copy.contents[0]._index))
+        tag = copy.to_tag()
+        self.assertEqual(tag, fragment)
+        self.assertEqual([type(child) for child in tag.descendants],
+                         [Tag, Tag, HTMLDocument.BR])
+        self.assertEqual(tag.generate(), fragment.generate())
+
+unittest.main()
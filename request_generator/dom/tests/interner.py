@@ -0,0 +1,107 @@
+import unittest
+from ..array_tree import ArrayTree
+from ..interner import SubtreeInterner
+from ..tag import Mount, SharedAttrs, FrozenTagException
+from ...html.dom import simple_html_elements as HTMLDocument
+
+class SubtreeInternerTest(unittest.TestCase):
+    """
+    Tests that SubtreeInterner mounts identical subtrees from a single copy
+    and shares the attributes and text of identical leaves.
+    """
+
+    def setUp(self):
+        """
+        Sets up a body with three forms that differ only in their id.
+        """
+
+        self.body = HTMLDocument.Body()
+        self.forms = []
+        for index in range(3):
+            form = HTMLDocument.Form(attrs={'id':index, 'method':'post'}, parent=self.body)
+            form.append(HTMLDocument.Input(name='param', _type=HTMLDocument.Input.Type.hidden,
+                                           value=u'value'))
+            form.append(HTMLDocument.Label(text=u'label{}'.format(1)))
+            form.append(HTMLDocument.BR())
+            form.append(HTMLDocument.Input(_type=HTMLDocument.Input.Type.submit,
+                                           value='Submit'))
+            self.forms.append(form)
+
+    def test_a_intern(self):
+        """
+        Tests that the repeated subtrees of the forms are mounted from a
+        single frozen copy and their leaves share the first form's
+        attributes and text.
+        """
+
+        generated = self.body.generate()
+        interner = SubtreeInterner()
+        self.assertIs(interner.intern(self.body), self.body)
+        #the hidden input, the label, the br and the submit input
+        self.assertEqual(len(interner), 4)
+        self.assertEqual(interner.hits, 8)
+        self.assertEqual(self.body.generate(), generated)
+
+        labels = [form.contents[1] for form in self.forms]
+        for label in labels:
+            self.assertIsInstance(label, Mount)
+            self.assertIs(label.value, labels[0].value)
+        self.assertTrue(labels[0].value.frozen)
+        self.assertIsNone(labels[0].value.parent)
+        #the code of the label is written once
+        self.assertIs(labels[1]._output[2], labels[0]._output[2])
+
+        first = self.forms[0].contents
+        for form in self.forms[1:]:
+            self.assertIsNot(form._attrs, self.forms[0]._attrs)
+            for mine, theirs in zip(form.contents, first):
+                self.assertIsNot(mine, theirs)
+                self.assertIs(mine._attrs, theirs._attrs)
+                if mine.text is not None:
+                    self.assertIs(mine.value, theirs.value)
+
+        #interning again changes nothing
+        interner.intern(self.body)
+        self.assertEqual(len(interner), 4)
+        self.assertEqual([form.contents[1] for form in self.forms], labels)
+        self.assertEqual(self.body.generate(), generated)
+
+        #a subtree interned before is mounted even if it shows up once
+        form = self.forms[0]
+        form.append(HTMLDocument.Label(text=u'label1'))
+        interner.intern(self.body)
+        self.assertIs(form.contents[-1].value, labels[0].value)
+        self.assertEqual(len(interner), 4)
+
+    def test_b_copy_on_write(self):
+        """
+        Tests that changing an interned leaf doesn't change the ones it
+        shares with.
+        """
+
+        SubtreeInterner().intern(self.body)
+        submits = self.body.find_all('input', attrs={'type':'submit'})
+        self.assertIsInstance(submits[0]._attrs, SharedAttrs)
+        self.assertRaises(TypeError, submits[0]._attrs.update, {})
+
+        submits[1]['value'] = 'Send'
+        del submits[2]['type']
+        self.assertEqual(submits[0]['value'], 'Submit')
+        self.assertEqual(submits[1]['value'], 'Send')
+        self.assertEqual(submits[0]['type'], 'submit')
+        self.assertFalse(submits[2].has_attr('type'))
+        self.assertNotEqual(self.forms[0], self.forms[1])
+
+        #a mounted subtree is frozen
+        self.assertRaises(FrozenTagException, self.forms[1].contents[1].value.append,
+                          HTMLDocument.BR())
+
+        #and through the handles of an ArrayTree
+        body = ArrayTree.from_tag(self.body)
+        self.assertEqual(body.generate(), self.body.generate())
+        hidden = body.find_all('input', attrs={'type':'hidden'})
+        hidden[1]['name'] = 'other'
+        self.assertEqual(hidden[0].get('name'), 'param')
+
+if __name__ == '__main__':
+    unittest.main()
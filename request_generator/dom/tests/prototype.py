@@ -0,0 +1,103 @@
+import unittest
+from .. import prototype
+from ..array_tree import ArrayTree
+from ..tag import Mount, FrozenTagException
+from ...html.dom import simple_html_elements as HTMLDocument
+
+class PrototypeTest(unittest.TestCase):
+    """
+    Tests that prototype functions return clones of the trees they build
+    once.
+    """
+
+    def setUp(self):
+        self.built = []
+        def build_form(id, method='post'):
+            self.built.append(id)
+            form = HTMLDocument.Form(attrs={'id':id, 'method':method})
+            form.append(HTMLDocument.Input(name='param', _type=HTMLDocument.Input.Type.hidden,
+                                           value='value'))
+            HTMLDocument.Label(text='label', parent=form)
+            return form
+        self.build_form = prototype.prototype(build_form)
+
+    def test_a_clones(self):
+        """
+        Tests that the tree is built once for the same arguments and that
+        the clones are independent.
+        """
+
+        form = self.build_form(0)
+        other = self.build_form(0)
+        self.assertEqual(self.built, [0])
+        self.assertIsNot(form, other)
+        self.assertEqual(form, other)
+        self.assertEqual(form.generate(), other.generate())
+        self.assertFalse(form.frozen)
+
+        form['method'] = 'get'
+        form.label[0].extract()
+        form.append(HTMLDocument.BR())
+        self.assertEqual(self.build_form(0), other)
+        self.assertEqual(len(other), 2)
+
+        self.build_form(0, method='get')
+        self.build_form(1)
+        self.assertEqual(self.built, [0, 0, 1])
+
+        #build goes around the prototypes
+        self.assertFalse(self.build_form.build(0).frozen)
+        self.assertEqual(self.built, [0, 0, 1, 0])
+
+    def test_b_cache(self):
+        """
+        Tests that the cache is bounded and can be purged.
+        """
+
+        for id in range(prototype.CACHE_SIZE + 1):
+            self.build_form(id)
+        #0 was dropped, the rest are kept
+        self.build_form(prototype.CACHE_SIZE)
+        self.build_form(0)
+        self.assertEqual(self.built, range(prototype.CACHE_SIZE + 1) + [0])
+
+        prototype.purge()
+        self.build_form(0)
+        self.assertEqual(self.built[-2:], [0, 0])
+
+    def test_c_shared(self):
+        """
+        Tests that shared functions return mounts of a tree built once and
+        that a mount generates the tree in its place.
+        """
+
+        build_form = prototype.shared(self.build_form.build)
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text='var a;'))
+        mount = build_form(0)
+        script.append(mount)
+        other = build_form(0)
+        self.assertEqual(self.built, [0])
+        self.assertIsInstance(mount, Mount)
+        self.assertIs(mount.value, other.value)
+        self.assertTrue(mount.value.frozen)
+        self.assertEqual(mount, other)
+        self.assertNotEqual(mount, build_form(1))
+        self.assertEqual(len(mount), 0)
+        self.assertIsNone(script.find('form'))
+
+        #generated as if the tree were in place of the mount
+        expected = HTMLDocument.Script()
+        expected.append(HTMLDocument.Text(text='var a;'))
+        expected.append(self.build_form.build(0))
+        generated = script.generate(indent_level=1)
+        self.assertEqual(generated, expected.generate(indent_level=1))
+        self.assertEqual(ArrayTree.from_tag(script).generate(indent_level=1), generated)
+        self.assertEqual(script.clone().generate(indent_level=1), generated)
+
+        #the shared tree can't be changed through a mount
+        self.assertRaises(FrozenTagException, mount.value.append, HTMLDocument.BR())
+        self.assertRaises(FrozenTagException, mount.value.clear_children)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from .. import selector
+from ..array_tree import ArrayTree
+from ...html.dom import simple_html_elements as HTMLDocument
+
+class SelectorTest(unittest.TestCase):
+    """
+    Tests the CSS selectors of Tag.select and Tag.select_one.
+    """
+
+    def setUp(self):
+        """
+        Sets up an HTML DOM tree with two forms in the body.
+        """
+
+        self.html = HTMLDocument.HTML()
+        head = HTMLDocument.Head(parent=self.html)
+        HTMLDocument.Meta(attrs={'charset':'UTF-8'}, parent=head)
+
+        self.body = HTMLDocument.Body(parent=self.html)
+        self.form0 = HTMLDocument.Form(attrs={'id':0, 'class':'request post'},
+                                       parent=self.body)
+        self.hidden = []
+        for index in range(3):
+            self.hidden.append(HTMLDocument.Input(name='param{}'.format(index),
+                                                  _type=HTMLDocument.Input.Type.hidden,
+                                                  value='value{}'.format(index)))
+            self.form0.append(self.hidden[-1])
+            self.form0.append(HTMLDocument.Label(text='label{}'.format(index)))
+        self.submit = HTMLDocument.Input(attrs={'type':'submit', 'lang':'en-US'},
+                                         parent=self.form0)
+
+        self.div = HTMLDocument.Element('div', parent=self.body)
+        self.form1 = HTMLDocument.Form(attrs={'id':'form1', 'class':'request'},
+                                       parent=self.div)
+        self.text = HTMLDocument.Input(attrs={'type':'text', 'name':'q'},
+                                       parent=self.form1)
+
+    def test_a_simple(self):
+        """
+        Tests type, universal, id, class and attribute selectors.
+        """
+
+        inputs = self.hidden + [self.submit, self.text]
+        self.assertEqual(self.html.select('input'), inputs)
+        self.assertEqual(self.html.select('form#0'), [self.form0])
+        self.assertEqual(self.html.select('#form1'), [self.form1])
+        self.assertEqual(self.html.select('.request'), [self.form0, self.form1])
+        self.assertEqual(self.html.select('form.post.request'), [self.form0])
+        self.assertEqual(self.html.select('[type=hidden]'), self.hidden)
+        self.assertEqual(self.html.select('input[type="submit"]'), [self.submit])
+        self.assertEqual(self.html.select("[name^='param']"), self.hidden)
+        self.assertEqual(self.html.select('[name$=m1]'), [self.hidden[1]])
+        self.assertEqual(self.html.select('[name*=ara]'), self.hidden)
+        self.assertEqual(self.html.select('[class~=post]'), [self.form0])
+        self.assertEqual(self.html.select('[lang|=en]'), [self.submit])
+        self.assertEqual(self.html.select('[charset]'), self.html.meta)
+        #unlike find_all, attribute values aren't matched as substrings
+        self.assertEqual(self.html.select('[type=hid]'), [])
+        #text tags are not elements
+        self.assertEqual(len(self.form0.select('*')), 7)
+        self.assertEqual(self.html.select('label:empty'), [])
+
+    def test_b_combinators(self):
+        """
+        Tests the descendant, child and sibling combinators and groups.
+        """
+
+        self.assertEqual(self.html.select('body > form#0 input[type=hidden]'), self.hidden)
+        self.assertEqual(self.html.select('body > form input'),
+                         self.hidden + [self.submit])
+        self.assertEqual(self.html.select('body form > input[type=text]'), [self.text])
+        self.assertEqual(self.html.select('html div input'), [self.text])
+        self.assertEqual(self.html.select('input + label'), self.form0.find_all('label'))
+        self.assertEqual(self.html.select('label ~ input'), self.hidden[1:] + [self.submit])
+        self.assertEqual(self.html.select('form + div'), [self.div])
+        self.assertEqual(self.html.select('input:first-child'), [self.hidden[0], self.text])
+        self.assertEqual(self.html.select('form > :last-child'), [self.submit, self.text])
+        self.assertEqual(self.html.select('div > :only-child'), [self.form1])
+        #groups are returned in document order
+        self.assertEqual(self.html.select('#form1, meta,form#0'),
+                         [self.html.meta[0], self.form0, self.form1])
+        #a descendant combinator that needs backtracking
+        self.assertEqual(self.html.select('html > body input'),
+                         self.hidden + [self.submit, self.text])
+
+    def test_c_select_one(self):
+        """
+        Tests select_one, limit and selecting within a subtree.
+        """
+
+        self.assertIs(self.html.select_one('input'), self.hidden[0])
+        self.assertIs(self.html.select_one('iframe'), None)
+        self.assertEqual(self.html.select('input', limit=2), self.hidden[:2])
+        self.assertEqual(self.form1.select('input'), [self.text])
+        #the selector is matched against the whole tree
+        self.assertEqual(self.form1.select('body input'), [self.text])
+        #but only the descendants are returned
+        self.assertEqual(self.form1.select('form'), [])
+
+        #matches follow changes to the tree
+        self.form1.append(self.hidden[0])
+        self.assertEqual(self.html.select('#form1 > [type=hidden]'), [self.hidden[0]])
+
+    def test_d_cache(self):
+        """
+        Tests that compiled selectors are cached and the cache is bounded.
+        """
+
+        selector.purge()
+        compiled = selector.compile_selector('form input')
+        self.assertIs(selector.compile_selector('form input'), compiled)
+        for index in range(selector.CACHE_SIZE):
+            selector.compile_selector('form#{}'.format(index))
+        self.assertEqual(len(selector._cache), selector.CACHE_SIZE)
+        self.assertIsNot(selector.compile_selector('form input'), compiled)
+
+        for invalid in ['', 'form >', 'form,', '#', 'input[type=', 'a:hover', 'a!b']:
+            self.assertRaises(ValueError, self.html.select, invalid)
+
+    def test_e_array_tree(self):
+        """
+        Tests select on the TagHandles of an ArrayTree.
+        """
+
+        html = ArrayTree.from_tag(self.html)
+        self.assertEqual([tag['name'] for tag in html.select('form#0 > [type=hidden]')],
+                         ['param0', 'param1', 'param2'])
+        self.assertEqual(html.select_one('div form')['id'], 'form1')
+
+if __name__ == '__main__':
+    unittest.main()
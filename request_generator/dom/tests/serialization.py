@@ -0,0 +1,90 @@
+import unittest
+from .. import serialization
+from ..tag import Tag, Mount, SharedAttrs
+from ...html.dom import simple_html_elements as HTMLDocument
+
+class SerializationTest(unittest.TestCase):
+    """
+    Tests that trees are loaded back from Tag.dumps() as they were.
+    """
+
+    def setUp(self):
+        """
+        Sets up a body with a form, a script with a Mount, and values of
+        every type the format holds.
+        """
+
+        self.body = HTMLDocument.Body()
+        self.form = HTMLDocument.Form(attrs={'id':1, 'method':'post', 'data-x':None,
+                                             'data-y':2.5, 'data-z':True}, parent=self.body)
+        for index in range(3):
+            self.form.append(HTMLDocument.Input(name=u'param', _type=HTMLDocument.Input.Type.hidden,
+                                                value=u'value<{}>'.format(index)))
+        HTMLDocument.Label(text=u'label\xe9', attrs={'for':'param'}, parent=self.form)
+        self.form.append(HTMLDocument.BR())
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text='var a = 1;'))
+        self.shared = HTMLDocument.Fragment([HTMLDocument.Text(text='function f() {'),
+                                             HTMLDocument.Text(text='}')])
+        script.append(Mount(self.shared))
+        script.append(Mount(self.shared))
+        self.body.append(script)
+
+    def test_a_round_trip(self):
+        """
+        Tests that the loaded tree is equal to the dumped one and
+        generates the same.
+        """
+
+        data = self.body.dumps()
+        self.assertIsInstance(data, str)
+        body = Tag.loads(data)
+        self.assertEqual(body, self.body)
+        self.assertEqual(body.generate(), self.body.generate())
+        self.assertEqual(body.dumps(), data)
+        self.assertFalse(body.frozen)
+
+        #properties, types and order
+        form = body.form[0]
+        self.assertIs(type(form), HTMLDocument.Form)
+        self.assertEqual(form._attrs.keys(), self.form._attrs.keys())
+        self.assertIs(form['data-z'], True)
+        self.assertIsNone(form['data-x'])
+        inputs = form.find_all('input')
+        self.assertEqual(inputs[2]['value'], u'value<2>')
+        self.assertIs(inputs[0]._attrs['type'], inputs[1]._attrs['type'])
+        self.assertIs(inputs[0]._encoder, self.form.contents[0]._encoder)
+        label = body.find('label')
+        self.assertIs(label.contents[0]._type, HTMLDocument.Text.type.text)
+        self.assertEqual(label.contents[0].text, u'label\xe9')
+
+        #tags with the same attributes share them until changed
+        self.assertIsInstance(form._attrs, SharedAttrs)
+        form['id'] = 2
+        self.assertEqual(self.form['id'], 1)
+        self.assertNotEqual(body, self.body)
+
+        #the mounts share a frozen copy of the tree
+        first, second = body.script[0].contents[1:]
+        self.assertIs(first.value, second.value)
+        self.assertTrue(first.value.frozen)
+        self.assertEqual(first.value, self.shared)
+
+    def test_b_errors(self):
+        """
+        Tests that data that isn't a serialized tree, and values the format
+        can't hold, are refused.
+        """
+
+        data = self.body.dumps()
+        self.assertRaises(ValueError, Tag.loads, '')
+        self.assertRaises(ValueError, Tag.loads, 'X' + data[1:])
+        self.assertRaises(ValueError, Tag.loads, data[:4] + chr(serialization.FORMAT_VERSION + 1) +
+                          data[5:])
+        self.assertRaises(ValueError, Tag.loads, data[:-1])
+
+        self.form['data-list'] = [1]
+        self.assertRaises(TypeError, self.body.dumps)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from ...dom.tag import Tag
+from ...dom.tag import Tag, EMPTY_ATTRS
 from Encoder import Encoder
 
 class SimpleHTMLElement(Tag):
@@ -23,6 +23,8 @@ class SimpleHTMLElement(Tag):
         text    = "html_text"
         cdata   = "cdata"
 
+    __slots__ = ('_value',)
+
     def __init__(self, name=None, attrs=None, text=None, cdata=None, # primary data of an element
                        self_closing=False,                           # whether <tag/> or <tag></tag>
                        parent=None, child=None,                      # realtionships
@@ -34,18 +36,18 @@ class SimpleHTMLElement(Tag):
 
         #set 'text'
         if text is not None:
-            self.value = text
+            self._value = text
             self.name = ''
             self._type = self.type.text
         else:
-            self.value = ''
+            self._value = ''
 
         #attributes
         if not attrs:
-            #init with empty dict
-            self.attrs = {}
+            #share the empty attributes until some are set
+            self._attrs = EMPTY_ATTRS
         elif isinstance(attrs, dict):
-            self.attrs = attrs
+            self._attrs = attrs
         else:
             raise TypeError("provided attrs is not a dict type")
 
@@ -107,6 +109,31 @@ class SimpleHTMLElement(Tag):
         
         return string
 
+    @property
+    def value(self):
+        """
+        The text of a type.text element or the content of a type.cdata
+        element.
+        """
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        #an equal value, like the one SubtreeInterner shares, changes nothing
+        if value != getattr(self, '_value', value):
+            self._changed()
+        self._value = value
+
+    @property
+    def text(self):
+        """
+        The value of a type.text or type.cdata element. None otherwise.
+        """
+
+        if self._type == self.type.text or self._type == self.type.cdata:
+            return self.value
+        return None
+
     def generate_for_attrs(self):
         """
         Generates code for attributes.
@@ -116,7 +143,7 @@ class SimpleHTMLElement(Tag):
         """
 
         attr_text = ''
-        for attr, attr_value in self.attrs.iteritems():
+        for attr, attr_value in self._attrs.iteritems():
             attr_text += ' '
             attr_name_text = attr
             attr_value_text = attr_value
@@ -129,9 +156,10 @@ class SimpleHTMLElement(Tag):
             attr_text += "{}=\"{}\"".format(attr_name_text, attr_value_text)        
         return attr_text
 
-    def generate(self, indent_level=0, encode=None):
+    def write_start(self, writer, indent_level=0, encode=None):
         """
-        Generates code for tree rooted at self.
+        Writes the code that comes before self's children, see
+        Tag.write_start.
 
         This is a generic implementation. Subclassing elements
         can override whenever required.
@@ -141,20 +169,17 @@ class SimpleHTMLElement(Tag):
         SimpleHTMLElement.type.text children.
         """
 
-        text = ''
         indent = self.get_indent(indent_level)
         #inspect self to see what type of tag were
         my_type = self._type
         if my_type == SimpleHTMLElement.type.cdata:
-            text = indent+"<![CDATA[{}]]>".format(self.value)
+            writer.append(indent+"<![CDATA[{}]]>".format(self.value))
         elif my_type == SimpleHTMLElement.type.text:
             text = self.value
             if encode is not None and text is not None and len(text)>0:
                     text = encode(text)
-            children_text = self.generate_from_children(indent_level+1)
-            text = indent + text
-            if children_text is not None and len(children_text) > 0:
-                text += children_text
+            writer.append(indent + text)
+            return indent_level+1, None, True
         elif my_type == SimpleHTMLElement.type.html or\
              my_type == SimpleHTMLElement.type.script:
             attr_text = self.generate_for_attrs()
@@ -165,16 +190,23 @@ class SimpleHTMLElement(Tag):
             if my_type == SimpleHTMLElement.type.html:
                 encode_function = Encoder.encode_for_HTML_content
             #self-closing tags do not contain text
-            if self.self_closing:
-                text = indent+"<{}{}/>".format(self.name, attr_text)
+            if self._self_closing:
+                writer.append(indent+"<{}{}/>".format(self.name, attr_text))
             else:
-                text = indent+"<{}{}>".format(self.name, attr_text)
-                children_text = self.generate_from_children(indent_level+1,
-                                                        encode=encode_function)                
-                if children_text and len(children_text):
-                    text += children_text+"\r\n"
-                    text += indent+"</{}>".format(self.name)
-                else:
-                    text += "</{}>".format(self.name)
-                
-        return text
+                writer.append(indent+"<{}{}>".format(self.name, attr_text))
+                return indent_level+1, encode_function, True
+        return None
+
+    def write_end(self, writer, indent_level=0, encode=None, children_written=False):
+        """
+        Writes the closing tag of an html or script element, on a line of
+        its own after the children if they wrote anything.
+        """
+
+        if self._type == SimpleHTMLElement.type.text:
+            return
+        if children_written:
+            writer.append("\r\n")
+            writer.append(self.get_indent(indent_level)+"</{}>".format(self.name))
+        else:
+            writer.append("</{}>".format(self.name))
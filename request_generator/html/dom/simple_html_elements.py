@@ -1,10 +1,16 @@
+from itertools import chain
+
 from simple_html_element import SimpleHTMLElement as Element
+from Encoder import Encoder
+from ...dom.tag import Tag, Fragment, Mount, EMPTY_ATTRS
 
 """
 Class that houses the various HTML Tags/Elements like form, iframe, input, label etc.
 """
 
 class Font(Element):
+    __slots__ = ()
+
     class Color:
         red     = 'red'
         blue    = 'blue'
@@ -23,10 +29,12 @@ class Font(Element):
         if 'color' not in attrs:
             attrs['style'] = 'color:'+color
         
-        text_child = Text(text=text)
+        text_child = TEXT_POOL.text(text)
         super(Font, self).__init__('font', attrs=attrs, parent=parent, child=text_child)
 
 class Button(Element):
+    __slots__ = ()
+
     def __init__(self,text='Click Me!', onclick='', attrs=None, parent=None):
         """
         text    - text that goes on the button.
@@ -39,7 +47,7 @@ class Button(Element):
         if 'onclick' not in attrs and len(onclick) > 0:
             attrs['onclick'] = onclick
         
-        text_child = Text(text=text)
+        text_child = TEXT_POOL.text(text)
         super(Button, self).__init__('button', attrs=attrs, parent=parent, child=text_child)
 
 class Script(Element):
@@ -51,6 +59,8 @@ class Script(Element):
     elements
     """
 
+    __slots__ = ()
+
     class Type:
         javascript = "text/javascript"
         vbscript = "text/vbscript"
@@ -66,10 +76,91 @@ class Script(Element):
         super(Script, self).__init__('script', attrs=attrs, encoder=None)        
 
 class Text(Element):
+    __slots__ = ()
+
     def __init__(self,text='', parent=None, child=None):
         super(Text, self).__init__(text=text, parent=parent, child=child)
 
+#number of Text tags a TextPool keeps for reuse
+POOL_SIZE = 4096
+
+class TextPool(object):
+    """
+    A free list of Text tags, for the builders that create hundreds of
+    them for every DOM.
+
+    text() returns a Text tag without going through the constructors,
+    reusing one that was put back by recycle() if there's any. The
+    counters tell how many tags were created and how many reused.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._free = []
+        #Text tags created by text(), taken back from the pool by it, and
+        #put back into the pool by recycle()
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def __len__(self):
+        """
+        Returns the number of Text tags ready for reuse.
+        """
+        return len(self._free)
+
+    def text(self, text=''):
+        """
+        Returns a Text tag for text, the same as Text(text=text).
+        """
+
+        try:
+            tag = self._free.pop()
+            self.reused += 1
+        except IndexError:
+            tag = Text.__new__(Text)
+            Tag.__init__(tag)
+            self.created += 1
+        tag._name = ''
+        tag._value = text
+        tag._type = Element.type.text
+        tag._attrs = EMPTY_ATTRS
+        tag._encoder = Encoder
+        tag.namespace = None
+        tag._self_closing = False
+        return tag
+
+    def recycle(self, tag):
+        """
+        Disposes of the tree rooted at tag, see Tag.dispose, and keeps its
+        Text tags for reuse, as many as there's room for.
+
+        Nothing may use the tree or any of its tags afterwards. Frozen tags
+        are left alone, they may be shared.
+        """
+
+        room = max(self.size - len(self._free), 0)
+        texts = [node for node in chain([tag], tag.walk())
+                 if type(node) is Text and not node._frozen][:room]
+        tag.dispose()
+        for text in texts:
+            #don't keep the text alive
+            text._value = ''
+        self._free.extend(texts)
+        self.recycled += len(texts)
+
+    def clear(self):
+        """
+        Drops the Text tags kept for reuse.
+        """
+        del self._free[:]
+
+#the pool the builders create their Text tags with
+TEXT_POOL = TextPool()
+
 class Form(Element):
+    __slots__ = ()
+
     def __init__(self,action='', method='GET', attrs=None, parent=None, child=None):
         #the action and method if present in attrs, overrides the one provided/default
         if attrs is None or len(attrs) == 0:
@@ -84,6 +175,8 @@ class Form(Element):
         super(Form, self).__init__('form', attrs=attrs, parent=parent, child=child)
 
 class IFrame(Element):
+    __slots__ = ()
+
     def __init__(self, src='', width="500", height="500", attrs=None, parent=None, child=None):
         #attrs in attrs take precedence
         if attrs is None:
@@ -98,6 +191,8 @@ class IFrame(Element):
         super(IFrame, self).__init__('iframe', attrs=attrs, parent=parent, child=child)
 
 class Input(Element):
+    __slots__ = ()
+
     class Type:
         text = "text"
         password = "password"
@@ -125,6 +220,8 @@ class Input(Element):
         super(Input, self).__init__('input', attrs=attrs, parent=parent, child=child)
 
 class AHref(Element):
+    __slots__ = ()
+
     def __init__(self, href='', text='', attrs=None, parent=None):
         #attrs in attrs take precedence
         if attrs is None or len(attrs) == 0:
@@ -135,11 +232,13 @@ class AHref(Element):
 
         if text is None:
             text=''
-        text_child = Text(text=text)
+        text_child = TEXT_POOL.text(text)
                     
         super(AHref, self).__init__('a', attrs=attrs, parent=parent, child=text_child)        
 
 class Img(Element):
+    __slots__ = ()
+
     def __init__(self, src='', width='20', height='20', attrs=None, parent=None, child=None):
         #attrs in attrs take precedence
         if attrs is None:
@@ -155,15 +254,19 @@ class Img(Element):
         super(Img, self).__init__('img', attrs=attrs, parent=parent, child=child)
 
 class Label(Element):
+    __slots__ = ()
+
     def __init__(self, text='', attrs=None, parent=None, child=None):
         #child element takes precedence over 'text' arg
         text_child = child
         if text_child is None:
-            text_child = Text(text=text)
+            text_child = TEXT_POOL.text(text)
 
         super(Label, self).__init__('label', attrs=attrs, parent=parent, child=text_child)        
 
 class Heading(Element):
+    __slots__ = ()
+
     class size:
         level1 = 1
         level2 = 2
@@ -186,11 +289,13 @@ class Heading(Element):
         #is provided
         if text is None or len(text) == 0:
             text = 'empty_heading_value'
-        text_child = Text(text=text)
+        text_child = TEXT_POOL.text(text)
 
         super(Heading, self).__init__(_name, parent=parent, child=text_child)
 
 class Meta(Element):
+    __slots__ = ()
+
     def __init__(self, name='', content='', attrs=None, parent=None, child=None):
         #attrs in attrs take precedence
         if attrs is None or len(attrs) == 0:
@@ -205,32 +310,42 @@ class Meta(Element):
         super(Meta, self).__init__('meta', attrs=attrs, self_closing=True, parent=parent, child=child)        
 
 class Title(Element):
+    __slots__ = ()
+
     def __init__(self, title='', parent=None, child=None):
         #child element takes precedence over 'title' arg
         text_child = child
         if text_child is None:
-            text_child = Text(text=title)
+            text_child = TEXT_POOL.text(title)
         
         super(Title, self).__init__('title', parent=parent, child=text_child)        
 
 class Head(Element):
+    __slots__ = ()
+
     def __init__(self, text='',parent=None, child=None):
         if child is None and len(text)>0:
-            child = Text(text=text)
+            child = TEXT_POOL.text(text)
         super(Head, self).__init__('head', parent=parent, child=child)
 
 class Body(Element):
+    __slots__ = ()
+
     def __init__(self, parent=None, child=None):
         super(Body, self).__init__('body', parent=parent, child=child)        
 
 class HTML(Element):
+    __slots__ = ()
+
     def __init__(self, child=None):
         super(HTML, self).__init__('html', child=child)        
 
 class BR(Element):
+    __slots__ = ()
+
     def __init__(self,parent=None, child=None):
         super(BR, self).__init__('br', parent=parent, child=child)        
     
-    def generate(self, indent_level=0, encode=None):
+    def write_start(self, writer, indent_level=0, encode=None):
         indent = self.get_indent(indent_level)
-        return indent+'<{}>'.format(self.name)
\ No newline at end of file
+        writer.append(indent+'<{}>'.format(self.name))
\ No newline at end of file
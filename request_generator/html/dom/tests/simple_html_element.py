@@ -1,5 +1,13 @@
+import gc
+import gzip
+import io
+import pickle
+import sys
+import threading
 import unittest
+from StringIO import StringIO
 from ..simple_html_element import SimpleHTMLElement
+from ....dom.tag import Fragment, FrozenTagException, Writer
 
 class SimpleHTMLElementTest(unittest.TestCase):
     """
@@ -154,6 +162,24 @@ class SimpleHTMLElementTest(unittest.TestCase):
         #print self.html_tag.generate()
 
         get_form = SimpleHTMLElement(name="form", attrs=get_form_attrs)
+
+        #a replacement that fails changes nothing
+        code = self.html_tag.generate()
+        html_hash = hash(self.html_tag)
+        frozen_form = SimpleHTMLElement(name="form").freeze()
+        with self.assertRaises(ValueError):
+            self.form1.replace_with(self.body_tag)
+        with self.assertRaises(ValueError):
+            self.form1.replace_with(self.iframe1)
+        with self.assertRaises(FrozenTagException):
+            self.form1.replace_with(frozen_form)
+        self.assertIsNone(frozen_form.parent)
+        for tag in [self.form1, self.body_tag, self.html_tag]:
+            self.assertIsNotNone(tag._digest)
+            self.assertIsNotNone(tag._output)
+        self.assertEqual(hash(self.html_tag), html_hash)
+        self.assertEqual(self.html_tag.generate(), code)
+
         self.form1.replace_with(get_form)
 
         #print "test_b_replace_with_after"
@@ -326,7 +352,7 @@ class SimpleHTMLElementTest(unittest.TestCase):
     def test_j_misc(self):
         """
         Tests,
-             __contains__, __len__.
+             __contains__, __len__, write, generate_to.
         """
 
         #__contains__
@@ -336,7 +362,51 @@ class SimpleHTMLElementTest(unittest.TestCase):
         #__len__
         self.assertEqual(3, len(self.body_tag))
         self.assertNotEqual(2, len(self.head_tag))
-    
+
+        #write, the parts of generate. Big text is written as is, and
+        #children that generate nothing are left out.
+        big_text = u'x' * 100000
+        script = SimpleHTMLElement(name='script')
+        script.extend([SimpleHTMLElement(text=''), SimpleHTMLElement(text='a;')])
+        fragment = Fragment([SimpleHTMLElement(text=''), SimpleHTMLElement(text=big_text), script])
+        writer = Writer()
+        fragment.write(writer)
+        self.assertTrue(any(part is big_text for part in writer.parts))
+        self.assertTrue(all(writer.parts))
+        self.assertEqual(writer.getvalue(), fragment.generate())
+        #an empty text still has its indent
+        self.assertEqual(fragment.generate()[len(big_text):],
+                         '\r\n<script>\r\n \r\n a;\r\n</script>')
+        self.assertEqual(SimpleHTMLElement(name='p').generate(indent_level=1), ' <p></p>')
+        #empty texts in a row
+        fragment = Fragment([SimpleHTMLElement(text='') for index in range(3)])
+        fragment.append(SimpleHTMLElement(text='a'))
+        fragment.contents[0].append(SimpleHTMLElement(text=''))
+        self.assertEqual(fragment.generate(), '\r\n \r\na')
+
+        #generate_to, in chunks
+        chunks = []
+        class Sink(object):
+            write = chunks.append
+        script.append(SimpleHTMLElement(text=big_text))
+        self.html_tag.append(script)
+        self.html_tag.generate_to(Sink(), chunk_size=100)
+        self.assertEqual(''.join(chunks), self.html_tag.generate().encode('utf-8'))
+        self.assertTrue(all(isinstance(chunk, str) for chunk in chunks))
+        #even the big text is written in slices
+        self.assertTrue(all(len(chunk.decode('utf-8')) <= 100 for chunk in chunks))
+        self.assertGreater(len(chunks), len(big_text) // 100)
+
+        #into a gzip file and unencoded
+        stream = StringIO()
+        with gzip.GzipFile(fileobj=stream, mode='wb') as gzip_file:
+            self.html_tag.generate_to(gzip_file)
+        unzipped = gzip.GzipFile(fileobj=StringIO(stream.getvalue())).read()
+        self.assertEqual(unzipped, self.html_tag.generate().encode('utf-8'))
+        stream = io.StringIO()
+        self.html_tag.generate_to(stream, encoding=None)
+        self.assertEqual(stream.getvalue(), self.html_tag.generate())
+
     def test_k_decompose(self):
 
         my_index = self.form1.parent.index(self.form1)
@@ -350,6 +420,30 @@ class SimpleHTMLElementTest(unittest.TestCase):
         #assert that body doesn't have a child at this location
         with self.assertRaises(IndexError):
             self.body_tag.contents[my_index]
+
+        #clear_children keeps the indexes of the ancestors up to date
+        self.assertEqual(self.html_tag.find_all('a'), [self.ahref1])
+        children = self.body_tag.contents[:]
+        self.body_tag.clear_children()
+        self.assertEqual(len(self.body_tag), 0)
+        self.assertEqual(self.html_tag.find_all('a'), [])
+        self.assertEqual(self.body_tag.find_all('a'), [])
+        self.assertIsNone(self.ahref1.parent)
+        self.assertIsNone(self.ahref1.previous)
+        self.assertIs(self.a1_text.parent, self.ahref1)
+        self.body_tag.extend(children)
+        self.assertEqual(self.html_tag.find_all('a'), [self.ahref1])
+        self.body_tag.clear_children(decompose=True)
+        self.assertFalse(hasattr(self.a1_text, '_parent'))
+        self.assertEqual(self.html_tag.find_all('a'), [])
+
+        #deep trees are decomposed without recursion
+        deep = SimpleHTMLElement(name='div')
+        for index in range(3000):
+            deep = SimpleHTMLElement(name='div', child=deep)
+        leaf = deep.find_all('div')[-1]
+        deep.decompose()
+        self.assertFalse(hasattr(leaf, '_parent'))
     
     def test_l_copy(self):
         """
@@ -360,6 +454,29 @@ class SimpleHTMLElementTest(unittest.TestCase):
 
         name_input_copy = self.name_input.copy()
         self.assertTrue(self.name_input.is_equal(name_input_copy))
+        self.assertIsInstance(form1_copy, SimpleHTMLElement)
+        self.assertEqual(len(form1_copy), 0)
+        self.assertNotEqual(hash(form1_copy), hash(self.form1))
+
+        #deep clones
+        html_clone = self.html_tag.clone()
+        self.assertIsNone(html_clone.parent)
+        self.assertEqual(html_clone, self.html_tag)
+        self.assertEqual(html_clone.generate(), self.html_tag.generate())
+        for tag, clone in zip(self.html_tag.descendants, html_clone.descendants):
+            self.assertIsNot(tag, clone)
+            self.assertIs(type(tag), type(clone))
+            self.assertEqual(list(tag._attrs), list(clone._attrs))
+        self.assertEqual(html_clone.find_all('input')[0]['id'], 'name')
+
+        #that are independent of the original
+        form1_clone = html_clone.form[0]
+        form1_clone['method'] = 'get'
+        form1_clone.append(SimpleHTMLElement(name='br'))
+        self.assertEqual(self.form1['method'], 'post')
+        self.assertEqual(len(self.form1), 5)
+        self.assertNotEqual(html_clone, self.html_tag)
+        self.assertEqual(self.form1.clone(deep=False).attrs, self.form1.attrs)
 
     def test_m_search(self):
         """
@@ -408,6 +525,509 @@ class SimpleHTMLElementTest(unittest.TestCase):
         test_array = [self.a1_text, self.label1_text, self.label2_text]
         self.assertEqual(self.body_tag.find_all(_type=SimpleHTMLElement.type.text), test_array)
 
+    def test_n_search_text(self):
+        """
+        Test searching by text.
+        """
+
+        #only text elements have text
+        self.assertEqual(self.label1_text.text, 'Name:')
+        self.assertIsNone(self.form1.text)
+
+        self.assertEqual(self.html_tag.find_all(text='Name'), [self.label1_text])
+        self.assertEqual(self.html_tag.find_all(text='mail'), [self.label2_text])
+        self.assertEqual(self.body_tag.find_all(text='W3Schools', _type='HTML_TEXT'),
+                         [self.a1_text])
+        self.assertEqual(self.html_tag.find_all(text='No such text'), [])
+
+        #in a copy, whose _types are equal but not the same strings
+        copy = pickle.loads(pickle.dumps(self.html_tag, pickle.HIGHEST_PROTOCOL))
+        copy_text = copy.find_all(text='Name')
+        self.assertEqual(copy_text, [self.label1_text])
+        self.assertIsNot(copy_text[0]._type, self.label1_text._type)
+        self.assertEqual(copy, self.html_tag)
+        self.assertEqual(hash(copy), hash(self.html_tag))
+
+        #every protocol keeps the whole tree, but not the search index
+        code = copy.generate()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(self.html_tag, protocol))
+            self.assertEqual(copy, self.html_tag)
+            self.assertIsNone(copy._subtree_index)
+            self.assertEqual(copy.find_all(text='mail'), [self.label2_text])
+            self.assertTrue(copy.find_all(text='mail')[0].parent.parent.parent is copy.body[0])
+            self.assertEqual(copy.generate(), code)
+
+    def test_o_index(self):
+        """
+        Tests index after inserts and removals in the middle of contents.
+        """
+
+        #insert at the head of body and move form1 to the front
+        div_tag = SimpleHTMLElement(name="div")
+        self.body_tag.insert(div_tag, 0)
+        self.body_tag.insert(self.form1, 0)
+        for i, child in enumerate(self.body_tag.contents):
+            self.assertEqual(i, self.body_tag.index(child))
+        self.assertEqual(self.body_tag.contents, [self.form1, div_tag, self.iframe1, self.ahref1])
+
+        #remove from the middle
+        div_tag.extract()
+        self.assertEqual(1, self.body_tag.index(self.iframe1))
+        self.assertEqual(2, self.body_tag.index(self.ahref1))
+        with self.assertRaises(ValueError):
+            self.body_tag.index(div_tag)
+
+        #setting the parent links the siblings as well
+        br_tag = SimpleHTMLElement(name="br")
+        br_tag.setup(parent=self.body_tag)
+        self.assertEqual(self.ahref1.next, br_tag)
+        self.assertEqual(br_tag.previous, self.ahref1)
+        self.assertEqual(3, self.body_tag.index(br_tag))
+
+        #changing contents doesn't change the children
+        stray_tag = SimpleHTMLElement(name="p")
+        contents = self.body_tag.contents
+        contents.append(stray_tag)
+        del contents[0]
+        self.assertEqual(self.body_tag.contents, [self.form1, self.iframe1, self.ahref1, br_tag])
+        self.assertEqual(len(self.body_tag), 4)
+        self.assertEqual(0, self.body_tag.index(self.form1))
+        self.assertNotIn(stray_tag, self.body_tag)
+        with self.assertRaises(ValueError):
+            self.body_tag.index(stray_tag)
+
+    def test_p_unwrap_into_middle(self):
+        """
+        Tests that unwrap promotes children in order into the middle of
+        the parent's contents.
+        """
+
+        holder = SimpleHTMLElement(name="div")
+        children = [SimpleHTMLElement(name="p") for i in range(5)]
+        for child in children:
+            holder.append(child)
+        self.body_tag.insert(holder, 2)
+        holder.unwrap()
+
+        self.assertEqual(self.body_tag.contents,
+                         [self.iframe1, self.ahref1] + children + [self.form1])
+        for i, child in enumerate(self.body_tag.contents):
+            self.assertEqual(i, self.body_tag.index(child))
+            self.assertTrue(child.parent is self.body_tag)
+        self.assertTrue(self.ahref1.next is children[0])
+        self.assertTrue(children[0].previous is self.ahref1)
+        self.assertTrue(children[-1].next is self.form1)
+        self.assertTrue(self.form1.previous is children[-1])
+
+    def test_q_iteration(self):
+        """
+        Tests iterating over children.
+        """
+
+        self.assertEqual(list(self.form1.children), [self.label1, self.name_input,
+                         self.label2, self.email_input, self.submit_button])
+        self.assertEqual(len(self.form1.children), 5)
+
+        #changing the children while iterating over them raises
+        with self.assertRaises(RuntimeError):
+            for child in self.form1:
+                child.extract()
+        #but not when iterating over a copy
+        for child in list(self.form1):
+            child.extract()
+        self.assertEqual(0, len(self.form1))
+
+    def test_r_search_index(self):
+        """
+        Tests that searches by name and _type stay correct while the
+        tree changes after the first search.
+        """
+
+        def assert_found(tag, name=None, _type=None):
+            expected = [t for t in tag.descendants
+                        if (name is None or t.name == name) and
+                           (_type is None or t._type == _type)]
+            found = tag.find_all(name, _type=_type)
+            self.assertEqual([id(t) for t in found], [id(t) for t in expected])
+
+        def assert_all_found():
+            for tag in (self.html_tag, self.body_tag, self.form1):
+                for name in ('input', 'label', 'p', 'div', ''):
+                    assert_found(tag, name=name)
+                for _type in ('html', 'html_text'):
+                    assert_found(tag, _type=_type)
+
+        #build the indexes
+        assert_all_found()
+
+        #insert ahead of existing tags
+        p_tag = SimpleHTMLElement(name='p')
+        SimpleHTMLElement(text='first').setup(parent=p_tag)
+        self.body_tag.insert(p_tag, 0)
+        self.form1.insert(SimpleHTMLElement(name='input'), 1)
+        assert_all_found()
+
+        #move within the tree
+        self.body_tag.insert(self.form1, 0)
+        self.label1.insert_after(self.submit_button)
+        self.html_tag.append(self.name_input)
+        assert_all_found()
+
+        #unwrap, wrap and replace
+        #the moved children keep their place, the indexes stay sorted
+        indexes = [tag._subtree_index
+                   for tag in (self.html_tag, self.body_tag, self.form1)]
+        self.label2.unwrap()
+        for index in indexes:
+            self.assertEqual(index.unsorted, set())
+        self.label1.replace_with(SimpleHTMLElement(name='p'))
+        for index in indexes:
+            self.assertNotIn(('name', ''), index.unsorted)
+            self.assertNotIn(('_type', 'html_text'), index.unsorted)
+        div_tag = SimpleHTMLElement(name='div')
+        self.email_input.wrap_with(div_tag)
+        assert_all_found()
+
+        #remove
+        self.body_tag.find_all('p')[0].extract()
+        div_tag.decompose()
+        self.form1.clear_children()
+        assert_all_found()
+        self.assertEqual(self.form1.find_all('input'), [])
+
+    def test_s_walk(self):
+        """
+        Tests pre-order, pruned and post-order walks.
+        """
+
+        def names(tags):
+            return [tag.name for tag in tags]
+
+        self.assertEqual(names(self.body_tag.walk()),
+                         ['iframe', 'a', '', 'form', 'label', '', 'input',
+                          'label', '', 'input', 'input'])
+        self.assertEqual(names(self.body_tag.walk(prune=lambda tag: tag.name == 'form')),
+                         ['iframe', 'a', '', 'form'])
+        self.assertEqual(names(self.body_tag.walk(post_order=True)),
+                         ['iframe', '', 'a', '', 'label', 'input', '', 'label',
+                          'input', 'input', 'form'])
+        self.assertEqual(names(self.form1.walk(post_order=True,
+                                               prune=lambda tag: tag.name == 'label')),
+                         ['label', 'input', 'label', 'input', 'input'])
+        self.assertEqual(list(self.label1_text.walk()), [])
+        self.assertEqual(list(self.label1_text.walk(post_order=True)), [])
+
+        #the tag just yielded in post-order can be extracted
+        for tag in self.form1.walk(post_order=True):
+            tag.extract()
+        self.assertEqual(0, len(self.form1))
+        self.assertEqual(0, len(self.label1))
+
+        #deep trees don't need recursion
+        root = leaf = SimpleHTMLElement(name='div')
+        for i in range(5000):
+            root = SimpleHTMLElement(name='div', child=root)
+        self.assertEqual(5000, len(list(root.descendants)))
+        self.assertTrue(list(root.walk(post_order=True))[0] is leaf)
+
+    def test_t_slots(self):
+        """
+        Tests the slotted layout and the shared empty attributes.
+        """
+
+        self.assertFalse(hasattr(self.label1_text, '__dict__'))
+        with self.assertRaises(AttributeError):
+            self.label1_text.some_attribute = 1
+
+        #text nodes share the empty attributes until they get some
+        self.assertTrue(self.label1_text._attrs is self.a1_text._attrs)
+        self.assertFalse(self.label1_text.has_attr('id'))
+        self.label1_text['id'] = 'name_text'
+        self.assertEqual(self.label1_text.attrs, {'id': 'name_text'})
+        self.assertEqual(self.a1_text.attrs, {})
+        self.assertFalse(self.a1_text._attrs is self.head_text._attrs)
+        del self.a1_text['id']
+
+        #leaves don't keep a list of children
+        self.assertEqual(self.label1_text.contents, [])
+        self.assertIsNone(self.label1_text._contents)
+
+    def test_u_iter_find(self):
+        """
+        Tests the lazy searches and the searches built on them.
+        """
+
+        matches = self.html_tag.iter_find(_type='html_text')
+        self.assertTrue(next(matches) is self.head_text)
+        self.assertTrue(next(matches) is self.title_text)
+        self.assertEqual(len(list(matches)), 3)
+
+        inputs = self.form1.iter_find('input', attrs={'type':'mai', 'name':'user'})
+        self.assertEqual([id(tag) for tag in inputs], [id(self.email_input)])
+        self.assertEqual(list(self.form1.iter_find('label', recursive=False, text='Name')), [])
+        self.assertEqual(list(self.form1.iter_find(text='Name')), [self.label1_text])
+
+        self.assertTrue(self.html_tag.find(attrs={'type':'submit'}) is self.submit_button)
+        self.assertIsNone(self.html_tag.find('textarea'))
+        self.assertTrue(self.label1.find_next_sibling('label') is self.label2)
+        self.assertTrue(self.submit_button.find_previous_sibling(_type='HTML') is self.email_input)
+        self.assertIsNone(self.label1.find_previous_sibling())
+        self.assertTrue(self.label1_text.find_parent(attrs={'method':'post'}) is self.form1)
+        self.assertIsNone(self.label1_text.find_parent('head'))
+
+        self.assertEqual(len(self.form1.find_all('input', limit=2)), 2)
+        self.assertEqual(self.form1.find_all('input', limit=0), [])
+
+    def test_v_splice(self):
+        """
+        Tests inserting runs of children with extend and splice.
+        """
+
+        #same as a run of appends
+        body = SimpleHTMLElement(name="body")
+        appended = SimpleHTMLElement(name="body")
+        for index in range(5):
+            appended.append(SimpleHTMLElement(text='statement{};'.format(index)))
+        body.extend(SimpleHTMLElement(text='statement{};'.format(index)) for index in range(5))
+        self.assertEqual(body.generate(), appended.generate())
+        self.assertEqual([body.index(child) for child in body], range(5))
+        self.assertEqual(len(body), 5)
+        body.extend([])
+        body.extend([None])
+        self.assertEqual(len(body), 5)
+
+        #moves children, including ones of self, counting positions like insert
+        children = self.form1.contents[:]
+        self.form1.splice(1, [children[3], children[0]])
+        self.assertEqual(self.form1.contents, [children[3], children[0], children[1],
+                                              children[2]] + children[4:])
+        self.assertTrue(children[1].previous is children[0])
+        self.form1.splice(-1, [self.html_tag.find('title')])
+        self.assertEqual(self.form1.contents[0].name, 'title')
+        self.assertEqual(self.html_tag.find('head').find_all('title'), [])
+        self.assertEqual(self.html_tag.find_all('title')[0].parent, self.form1)
+        self.form1.splice(100, [self.label1])
+        self.assertTrue(self.form1._last_child is self.label1)
+        self.assertEqual(self.form1.find_all(text='Name')[0].parent, self.label1)
+
+        with self.assertRaises(ValueError):
+            self.form1.extend([self.form1])
+        with self.assertRaises(ValueError):
+            self.form1.extend([self.label2, self.label2])
+
+    def test_w_fragment(self):
+        """
+        Tests that inserting a Fragment inserts its children.
+        """
+
+        fragment = Fragment([SimpleHTMLElement(text='statement{};'.format(index))
+                             for index in range(3)])
+        statements = fragment.contents[:]
+        self.assertEqual(fragment.generate(), '\r\n'.join(['statement0;', 'statement1;',
+                                                            'statement2;']))
+
+        self.form1.insert(fragment, 1)
+        self.assertEqual(len(fragment), 0)
+        self.assertIsNone(fragment.parent)
+        self.assertEqual(self.form1.contents[1:4], statements)
+        self.assertTrue(statements[0].previous is self.label1)
+        self.assertTrue(statements[0].parent is self.form1)
+        self.assertEqual(self.form1.find_all(text='statement'), statements)
+
+        #a fragment can be reused and stands for its children in a run
+        fragment.append(statements[2])
+        self.label2.insert_before(fragment)
+        self.assertTrue(self.label2.previous is statements[2])
+        nested = Fragment([statements[0]])
+        fragment.extend([statements[1], nested])
+        self.assertEqual(fragment.contents, statements[1:2] + statements[0:1])
+        self.html_tag.extend([self.label1, fragment])
+        self.assertEqual(self.html_tag.contents[-3:], [self.label1] + statements[1:2] + statements[0:1])
+        self.assertEqual(self.form1.find_all(text='statement'), statements[2:])
+
+    def test_x_digest(self):
+        """
+        Tests that hashes follow changes to the tree and that equality
+        compares whole trees without recursion.
+        """
+
+        def build_form():
+            form = SimpleHTMLElement(name='form', attrs={'method':'post'})
+            label = SimpleHTMLElement(name='label', attrs={'for':'name'}, parent=form)
+            SimpleHTMLElement(text='Name:', parent=label)
+            SimpleHTMLElement(name='input', attrs={'id':'name', 'class':['a', 'b']}, parent=form)
+            return form
+
+        form, other = build_form(), build_form()
+        self.assertEqual(hash(form), hash(other))
+        self.assertEqual(form, other)
+        self.assertEqual(len(set([form, other])), 1)
+
+        #the hashes of the ancestors change with the tree
+        self.body_tag.append(form)
+        body_hash = hash(self.body_tag)
+        html_hash = hash(self.html_tag)
+        form_input = form.contents[1]
+        form_input['id'] = 'other'
+        self.assertNotEqual(hash(form), hash(other))
+        self.assertNotEqual(form, other)
+        self.assertNotEqual(hash(self.body_tag), body_hash)
+        self.assertNotEqual(hash(self.html_tag), html_hash)
+        form_input.attrs['id'] = 'name'
+        self.assertEqual(form, other)
+        self.assertEqual(hash(self.html_tag), html_hash)
+
+        form_input.extract()
+        self.assertNotEqual(form, other)
+        self.assertNotEqual(hash(self.html_tag), html_hash)
+        form.append(form_input)
+        self.assertEqual(form, other)
+        self.assertEqual(hash(self.html_tag), html_hash)
+        form_input.name = 'textarea'
+        self.assertNotEqual(hash(self.html_tag), html_hash)
+        form_input.name = 'input'
+        self.assertEqual(hash(self.html_tag), html_hash)
+        #unlike is_equal, the text counts
+        other.find(text='Name:').extract()
+        other.contents[0].append(SimpleHTMLElement(text='E-mail:'))
+        self.assertTrue(form.contents[0].is_equal(other.contents[0]))
+        self.assertNotEqual(form, other)
+
+        #deep trees compare without recursion
+        deep, other_deep = SimpleHTMLElement(name='div'), SimpleHTMLElement(name='div')
+        for index in range(3000):
+            deep = SimpleHTMLElement(name='div', child=deep)
+            other_deep = SimpleHTMLElement(name='div', child=other_deep)
+        self.assertEqual(deep, other_deep)
+        other_deep.find('div').attrs['id'] = 0
+        self.assertNotEqual(deep, other_deep)
+
+    def test_y_freeze(self):
+        """
+        Tests that a frozen tree can't be changed and can be generated from
+        several threads.
+        """
+
+        generated = self.html_tag.generate()
+        form1_hash = hash(self.form1)
+        self.assertIs(self.body_tag.freeze(), self.body_tag)
+        self.assertTrue(self.form1.frozen)
+        self.assertFalse(self.html_tag.frozen)
+
+        br = SimpleHTMLElement(name='br', parent=self.html_tag)
+        changes = [lambda: self.form1.append(br),
+                   lambda: self.form1.extend([br]),
+                   lambda: self.label1.extract(),
+                   lambda: self.label1.insert_after(br),
+                   lambda: self.label1.wrap_with(br),
+                   lambda: self.label1.unwrap(),
+                   lambda: self.label1.decompose(),
+                   lambda: self.form1.clear_children(),
+                   lambda: self.name_input.__setitem__('id', 'other'),
+                   lambda: self.name_input.__delitem__('id'),
+                   lambda: setattr(self.name_input, 'attrs', {}),
+                   lambda: setattr(self.name_input, 'name', 'textarea'),
+                   lambda: self.label1.dispose(),
+                   lambda: self.label1.replace_with(SimpleHTMLElement(name='p'))]
+        for change in changes:
+            self.assertRaises(FrozenTagException, change)
+        self.assertIs(br.parent, self.html_tag)
+        self.assertEqual(self.name_input.name, 'input')
+        self.assertIs(self.label1.parent, self.form1)
+        self.assertEqual(self.form1.find_all('input'),
+                         [self.name_input, self.email_input, self.submit_button])
+        br.extract()
+        self.assertRaises(TypeError, self.name_input.attrs.update, {})
+        self.assertEqual(self.name_input.attrs['id'], 'name')
+        self.assertEqual(hash(self.form1), form1_hash)
+        self.assertEqual(self.html_tag.generate(), generated)
+
+        #the frozen tree moves as a whole
+        self.body_tag.extract()
+        self.html_tag.insert(self.body_tag, 0)
+        self.assertIs(self.html_tag.contents[0], self.body_tag)
+
+        expected = self.body_tag.generate()
+        results = []
+        def generate():
+            for index in range(20):
+                results.append(self.body_tag.generate() == expected and
+                               self.body_tag.find_all('input') == [self.name_input, self.email_input,
+                                                                   self.submit_button])
+        threads = [threading.Thread(target=generate) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 160)
+
+        #an index with removed and unsorted entries is settled when frozen,
+        #searches from several threads don't change it
+        form = SimpleHTMLElement(name='form')
+        inputs = [SimpleHTMLElement(name='input', parent=form) for index in range(2000)]
+        self.assertEqual(len(form.find_all('input')), 2000)
+        for form_input in inputs[1::3]:
+            form_input.extract()
+        form.insert(SimpleHTMLElement(name='input'), 0)
+        expected = [id(tag) for tag in form.walk() if tag.name == 'input']
+        index = form._subtree_index
+        self.assertTrue(index.stale and index.unsorted)
+        form.freeze()
+        self.assertEqual((index.stale, index.unsorted), ({}, set()))
+        results = []
+        def search():
+            for count in range(5):
+                results.append([id(tag) for tag in form.find_all('input')] == expected)
+        threads = [threading.Thread(target=search) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 20)
+
+    def test_z_dispose(self):
+        """
+        Tests that dispose takes the tree apart and leaves no reference
+        cycles.
+        """
+
+        tags = list(self.body_tag.descendants)
+        self.body_tag.find_all('input')
+        self.body_tag.dispose()
+        self.assertEqual(self.html_tag.contents, [self.head_tag])
+        for tag in [self.body_tag] + tags:
+            self.assertIsNone(tag.parent)
+            self.assertIsNone(tag.next)
+            self.assertIsNone(tag.previous)
+            self.assertEqual(len(tag), 0)
+            self.assertEqual(tag.contents, [])
+        self.assertEqual(self.form1['method'], 'post')
+        self.assertEqual(self.body_tag.find_all('input'), [])
+
+        #a frozen tree is disposed as a whole
+        frozen = SimpleHTMLElement(name='div', child=SimpleHTMLElement(name='p'))
+        self.html_tag.append(frozen.freeze())
+        frozen.dispose()
+        self.assertEqual(self.html_tag.contents, [self.head_tag])
+        self.assertEqual(len(frozen), 0)
+
+        if not sys.platform.startswith('java'):
+            #reference counting frees a disposed tree
+            gc.collect()
+            gc.disable()
+            try:
+                deep = SimpleHTMLElement(name='div')
+                for index in range(3000):
+                    deep = SimpleHTMLElement(name='div', child=deep)
+                    SimpleHTMLElement(text='text', parent=deep)
+                deep.find_all('div')
+                deep.dispose()
+                del deep
+                self.assertEqual(gc.collect(), 0)
+            finally:
+                gc.enable()
+
     def pretty_print(self):
         pretty_code = self.html_tag.generate()
         print pretty_code
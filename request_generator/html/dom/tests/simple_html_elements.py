@@ -1,5 +1,11 @@
+import pickle
+import sys
 import unittest
+from StringIO import StringIO
+
 from .. import simple_html_elements as HTMLDocument
+from request_generator.dom.array_tree import ArrayTree
+from request_generator.dom.tag import Tag, Mount
 
 class SimpleHTMLTest(unittest.TestCase):
     """
@@ -151,6 +157,164 @@ class SimpleHTMLTest(unittest.TestCase):
         file_input_html = u'<input type="file" name="file1" value="1"></input>'
         self.assertEqual(file_input_html, file_input.generate())
 
+    def test_c_text_pool(self):
+        """
+        Tests that the Text tags of a TextPool are like those of Text()
+        and are reused once recycled.
+        """
+
+        pool = HTMLDocument.TextPool(size=3)
+        script = HTMLDocument.Script()
+        texts = [pool.text(u'var a = "<b>";'), pool.text(''), pool.text('x')]
+        texts[0].append(texts[1])
+        script.extend([texts[0], texts[2]])
+        expected = HTMLDocument.Script()
+        expected.append(HTMLDocument.Text(text=u'var a = "<b>";'))
+        expected.contents[0].append(HTMLDocument.Text(text=''))
+        expected.append(HTMLDocument.Text(text='x'))
+        self.assertEqual(script, expected)
+        self.assertEqual(script.generate(), expected.generate())
+        self.assertEqual(pool.created, 3)
+
+        #the script itself isn't kept, and only as many texts as fit
+        pool.recycle(script)
+        self.assertEqual((len(pool), pool.recycled), (3, 3))
+        self.assertIsNone(texts[1].parent)
+        pool.recycle(HTMLDocument.Label(text='label'))
+        self.assertEqual(len(pool), 3)
+
+        fragment = HTMLDocument.Fragment([pool.text('again')])
+        self.assertIs(fragment.contents[0], texts[2])
+        self.assertEqual(fragment.generate(), 'again')
+        self.assertEqual((pool.created, pool.reused, len(pool)), (3, 1, 2))
+        pool.clear()
+        self.assertEqual(len(pool), 0)
+
+    def test_d_memoized_output(self):
+        """
+        Tests that the code generated for a tree is kept on its tags and
+        dropped on the tags that change and their ancestors.
+        """
+
+        def fresh():
+            #a copy without any kept code
+            return Tag.loads(self.html_tag.dumps()).generate()
+
+        code = self.html_tag.generate()
+        self.assertIsNotNone(self.label1._output)
+        self.assertEqual(self.html_tag.generate(), code)
+        #the kept code is written, a change that isn't tracked isn't seen
+        label_text = self.label1.contents[0]
+        label_text._value = 'Untracked:'
+        self.assertEqual(self.html_tag.generate(), code)
+
+        #only the changed tag and its ancestors are written again
+        label_text.value = 'Full name:'
+        for tag in [label_text, self.label1, self.form1, self.body_tag, self.html_tag]:
+            self.assertIsNone(tag._output)
+        self.assertIsNotNone(self.label2._output)
+        self.assertIsNotNone(self.head_tag._output)
+        self.assertEqual(self.html_tag.generate(), fresh())
+        self.assertIn('Full name:', self.html_tag.generate())
+
+        self.name_input['name'] = 'full_name'
+        self.assertIsNone(self.form1._output)
+        self.assertEqual(self.html_tag.generate(), fresh())
+        self.form1.append(HTMLDocument.BR())
+        self.assertEqual(self.html_tag.generate(), fresh())
+        self.ahref1.extract()
+        self.assertEqual(self.html_tag.generate(), fresh())
+        #an equal value changes nothing
+        self.label2.contents[0].value = 'E-mail:'
+        self.assertIsNotNone(self.label2._output)
+
+        #in another context
+        self.assertEqual(self.body_tag.generate(indent_level=2),
+                         Tag.loads(self.body_tag.dumps()).generate(indent_level=2))
+        self.assertEqual(self.html_tag.generate(), fresh())
+
+        #the code of a shared tree is kept once for all its mounts
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text='var a = 1;'))
+        expected = Tag.loads(script.dumps()).generate()
+        mounts = HTMLDocument.Fragment([Mount(script), Mount(script)])
+        self.assertEqual(mounts.generate(), expected + '\r\n' + expected)
+        self.assertIs(mounts.contents[1]._output[2], script._output[2])
+
+        #the kept code isn't pickled
+        self.html_tag.generate()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(self.html_tag, protocol))
+            self.assertIsNone(copy._output)
+            self.assertIsNone(copy.find_all('label')[0]._output)
+            self.assertEqual(copy, self.html_tag)
+            self.assertEqual(copy.generate(), Tag.loads(copy.dumps()).generate())
+
+        #a stream only reuses the kept code
+        html_tag = Tag.loads(self.html_tag.dumps())
+        html_tag.generate_to(StringIO())
+        self.assertIsNone(html_tag._output)
+        stream = StringIO()
+        self.html_tag.generate_to(stream)
+        self.assertEqual(stream.getvalue(), fresh().encode('utf-8'))
+
+    def test_e_deep_tree(self):
+        """
+        Tests generating a tree nested deeper than the recursion limit.
+        """
+
+        depth = sys.getrecursionlimit() + 100
+        script = HTMLDocument.Script()
+        block = script
+        for level in range(depth):
+            text = HTMLDocument.Text(text='{')
+            block.append(text)
+            block = text
+        expected = ''.join('\r\n' + ' ' * (level + 1) + '{' for level in range(depth))
+        expected = '<script type="text/javascript">' + expected + '\r\n</script>'
+        self.assertEqual(script.generate(), expected)
+        self.assertEqual(script.generate(), expected)
+        self.assertEqual(ArrayTree.from_tag(script).generate(), expected)
+        stream = StringIO()
+        script.generate_to(stream, chunk_size=1024)
+        self.assertEqual(stream.getvalue(), expected)
+
+        #a round-tripped tree, whose _types are equal but not the same strings
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text='var a;'))
+        copy = pickle.loads(pickle.dumps(script, pickle.HIGHEST_PROTOCOL))
+        self.assertIsNot(copy.contents[0]._type, script.contents[0]._type)
+        self.assertEqual(copy.generate(), script.generate())
+
+    def test_f_generate_bytes(self):
+        """
+        Tests that generate_bytes encodes the code generate() returns.
+        """
+
+        self.body_tag.append(HTMLDocument.Label(text=u'Caf\xe9 <\u2603>'))
+        script = HTMLDocument.Script()
+        script.append(HTMLDocument.Text(text=u'var s = "\u2603";'))
+        self.body_tag.append(script)
+        code = Tag.loads(self.html_tag.dumps()).generate()
+        self.assertIsInstance(code, unicode)
+        self.assertEqual(self.html_tag.generate_bytes(), code.encode('utf-8'))
+        self.assertIsInstance(self.html_tag.generate_bytes(), bytearray)
+        #with the kept code, into a buffer that has some already
+        self.assertEqual(self.html_tag.generate(), code)
+        buffer = bytearray('<!DOCTYPE html>')
+        self.assertIs(self.html_tag.generate_bytes(buffer, encoding='utf-16-le'), buffer)
+        self.assertEqual(buffer, '<!DOCTYPE html>' + code.encode('utf-16-le'))
+        self.assertEqual(ArrayTree.from_tag(self.html_tag).generate_bytes(),
+                         code.encode('utf-8'))
+
+        #encodings that don't encode ASCII to itself, without kept code
+        copy = Tag.loads(self.html_tag.dumps())
+        for encoding in ['utf-16', 'utf-16-le', 'utf-32-be']:
+            encoded = copy.generate_bytes(encoding=encoding)
+            self.assertEqual(str(encoded).decode(encoding), code)
+            self.assertIsNone(copy._output)
+        self.assertEqual(copy.generate_bytes(encoding='utf-16'), code.encode('utf-16'))
+
     def test_z_generate(self):
         print "\nSave the below HTML as a .html file and open in any browser."
         print "If any scripts/alert pops, then this case is a fail."
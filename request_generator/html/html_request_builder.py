@@ -9,6 +9,10 @@ from js_statements_template import *
 from xhr_js_template import *
 import dom.simple_html_elements as HTMLDocument
 from request_generator.request_builder import RequestBuilder
+from request_generator.dom.tag import Tag, CHUNK_SIZE, DEFAULT_OUTPUT_ENCODING
+from request_generator.dom.array_tree import ArrayTree
+from request_generator.dom.interner import SubtreeInterner
+from request_generator.dom.prototype import prototype, shared
 from request_generator.builders import *
 
 class UnsupportedFormMethodException(Exception):
@@ -39,13 +43,34 @@ class HtmlRequestBuilder(RequestBuilder):
         super(HtmlRequestBuilder, self).__init__(requests=requests)
     
     def build(self, type=Type.form_request, target_type=TargetType.iframe,
-              auto_submit=False):
+              auto_submit=False, compact=False, intern_subtrees=False):
+        """
+        Builds the DOM for self.requests.
+
+        If compact is True, the DOM is kept in an ArrayTree, which takes far
+        less memory for PoCs of many requests. The DOM is still built out of
+        tags and copied into the ArrayTree at the end, so only the memory
+        kept once the build is done goes down, not its peak.
+
+        If intern_subtrees is True, each subtree that shows up more than
+        once is kept once, frozen, and mounted in its places, and identical
+        leaves share their attributes and text, see SubtreeInterner. The
+        mounted subtrees can't be changed or searched afterwards.
+        """
+
         html_dom = None
         if type == Type.form_request:
             html_dom = self.build_form_request(target_type=target_type, auto_submit=auto_submit)
         elif type == Type.xhr_request:
             html_dom = self.build_XHR_request(target_type=target_type, auto_submit=auto_submit)
         
+        if intern_subtrees and html_dom is not None:
+            SubtreeInterner().intern(html_dom)
+        if compact and html_dom is not None:
+            tag_dom = html_dom
+            html_dom = ArrayTree.from_tag(tag_dom)
+            #the tags were copied, their Text tags can be reused
+            HTMLDocument.TEXT_POOL.recycle(tag_dom)
         self.request_dom = html_dom
 
     def generate(self):
@@ -58,6 +83,42 @@ class HtmlRequestBuilder(RequestBuilder):
         
         return self.request_dom.generate()
 
+    def generate_to(self, sink, chunk_size=CHUNK_SIZE, encoding=DEFAULT_OUTPUT_ENCODING):
+        """
+        Writes the generated code for self.request_html to sink in chunks
+        of about chunk_size, see Tag.generate_to.
+        """
+
+        if self.request_dom is None:
+            return
+
+        self.request_dom.generate_to(sink, chunk_size, encoding)
+
+    def generate_bytes(self, buffer=None, encoding=DEFAULT_OUTPUT_ENCODING):
+        """
+        Returns the generated code for self.request_html encoded with
+        encoding, in the bytearray buffer or a new one, see
+        Tag.generate_bytes.
+        """
+
+        if buffer is None:
+            buffer = bytearray()
+        if self.request_dom is None:
+            return buffer
+
+        return self.request_dom.generate_bytes(buffer, encoding)
+
+    def release(self):
+        """
+        Drops the DOM built for the requests, see RequestBuilder.release,
+        and keeps its Text tags for building the next DOMs, see TextPool.
+        """
+
+        request_dom = self.request_dom
+        self.request_dom = None
+        if isinstance(request_dom, Tag):
+            HTMLDocument.TEXT_POOL.recycle(request_dom)
+
     def build_form_request(self, target_type=TargetType.iframe, auto_submit=False):
         """
         Builds an HTML DOM for form based request.
@@ -138,7 +199,6 @@ class HtmlRequestBuilder(RequestBuilder):
         elif target_type == TargetType.new_tab:
             load_in_new_tab_function_script = self._build_XHR_load_in_new_tab_function()
             xhr_script.append(load_in_new_tab_function_script)
-            load_in_new_tab_function_script.unwrap()
             #print xhr_script.generate()
         #nothing to do if it's the same page for an XHR
         elif target_type == TargetType.same_page:
@@ -152,16 +212,14 @@ class HtmlRequestBuilder(RequestBuilder):
 
         #add the crateCORrequest function
         xhr_script.append(create_xhr_function_script)
-        create_xhr_function_script.unwrap()
 
         #add a new line
-        xhr_script.append(HTMLDocument.Text(text=" "))
+        xhr_script.append(HTMLDocument.TEXT_POOL.text(" "))
         xhr_script.append(create_onreadystatechange_script)
-        create_onreadystatechange_script.unwrap()
 
         #create header for sendXHR() function
-        send_XHR_function_header_snippet = HTMLDocument.Text(text=SEND_XHR_FUNCTION_HEADER_TEXT)
-        send_XHR_function_footer_snippet = HTMLDocument.Text(text=SEND_XHR_FUNCTION_FOOTER_TEXT)
+        send_XHR_function_header_snippet = HTMLDocument.TEXT_POOL.text(SEND_XHR_FUNCTION_HEADER_TEXT)
+        send_XHR_function_footer_snippet = HTMLDocument.TEXT_POOL.text(SEND_XHR_FUNCTION_FOOTER_TEXT)
         xhr_script.append(send_XHR_function_footer_snippet)
 
         #for each request, build XHR for them
@@ -177,7 +235,6 @@ class HtmlRequestBuilder(RequestBuilder):
         if auto_submit:
             script_holder = self._build_XHR_auto_submit_JS_snippet()
             xhr_script.append(script_holder)
-            script_holder.unwrap()
 
         #add a click Button
         send_xhr_function_name = SEND_XHR_FUNCTION_NAME+"();"
@@ -187,9 +244,12 @@ class HtmlRequestBuilder(RequestBuilder):
         return html_dom
     
     @classmethod
+    @prototype
     def build_template_DOM(cls, title=None):
         """
         Builds a simple HTML DOM to be used in CSRF.
+
+        The DOM for a title is built once and cloned after that.
         """
         
         title_text = ''
@@ -235,7 +295,7 @@ class HtmlRequestBuilder(RequestBuilder):
         # if the content-type is multipart/form-data
         if req_content_type == "multipart/form-data":
             form_data_obj_text = FORM_DATA_API_TEXT.format(index)
-            form_data_obj = HTMLDocument.Text(text=form_data_obj_text)
+            form_data_obj = HTMLDocument.TEXT_POOL.text(form_data_obj_text)
             send_xhr.append(form_data_obj)
 
             #build JS statements for files
@@ -244,38 +304,37 @@ class HtmlRequestBuilder(RequestBuilder):
                 if file_index == 0:
                     get_file_js = self._build_get_file_JS_function()
                     parent_script.append(get_file_js)
-                    get_file_js.unwrap()
                     #add a line break
-                    parent_script.append(HTMLDocument.Text(text=' '))
+                    parent_script.append(HTMLDocument.TEXT_POOL.text(' '))
 
-                #get a script elemetn that contains the JS statements
+                #get a fragment that contains the JS statements
                 file_JS_element = self._build_multipart_file_js_snippet(file_index=file_index,
                                         multipart_file=files[param_name],xhr=True)
-                #add the received element
+                #add the received statements
                 send_xhr.append(file_JS_element)
-                #and unwrap it
-                if file_JS_element is not None:
-                    file_JS_element.unwrap()
 
                 #build the statement to add file{} object to the
                 #formData object
                 form_data_file_append_text = FORM_DATA_FILE_APPEND_TEXT.format(index, param_name, file_index)
-                form_data_file_append = HTMLDocument.Text(text=form_data_file_append_text)
+                form_data_file_append = HTMLDocument.TEXT_POOL.text(form_data_file_append_text)
                 send_xhr.append(form_data_file_append)               
             
             #build JS statements to add POST params to
             #the formdata object
+            form_data_param_appends = []
             for param_name, value in post_parameters.items():
                 if req_content_type == "multipart/form-data":
                     value = value['data']
                 form_data_param_append_text = FORM_DATA_PARAM_APPEND_TEXT.format(index,
                                                     Encoder.encode_for_JS_data_values(param_name),
                                                     Encoder.encode_for_JS_data_values(value))
-                form_data_param_append = HTMLDocument.Text(text=form_data_param_append_text)
-                send_xhr.append(form_data_param_append)
+                form_data_param_append = HTMLDocument.TEXT_POOL.text(form_data_param_append_text)
+                form_data_param_appends.append(form_data_param_append)
+            #and add them all at once
+            send_xhr.extend(form_data_param_appends)
             
             #add an empty line
-            send_xhr.append(HTMLDocument.Text(text=' '))
+            send_xhr.append(HTMLDocument.TEXT_POOL.text(' '))
         elif req_content_type == "text/plain":
             post_data = request.body()
         # if the content-type is something else
@@ -291,10 +350,10 @@ class HtmlRequestBuilder(RequestBuilder):
         create_xhr_text_4 = CREATE_XHR_STMT_TEXT_4.format(index, index)
         
         #create text elements out of it
-        create_xhr_1 = HTMLDocument.Text(text=create_xhr_text_1)
-        create_xhr_2 = HTMLDocument.Text(text=create_xhr_text_2)
-        create_xhr_3 = HTMLDocument.Text(text=create_xhr_text_3)
-        create_xhr_4 = HTMLDocument.Text(text=create_xhr_text_4)
+        create_xhr_1 = HTMLDocument.TEXT_POOL.text(create_xhr_text_1)
+        create_xhr_2 = HTMLDocument.TEXT_POOL.text(create_xhr_text_2)
+        create_xhr_3 = HTMLDocument.TEXT_POOL.text(create_xhr_text_3)
+        create_xhr_4 = HTMLDocument.TEXT_POOL.text(create_xhr_text_4)
         create_xhr_2.append(create_xhr_3)
         
         #build the xhr.send() statement
@@ -308,7 +367,7 @@ class HtmlRequestBuilder(RequestBuilder):
             else:
                 xhr_send_text = XHR_SEND.format(index, '')
         timeout_function_text = XHR_SEND_TIMEOUT.format(xhr_send_text, XHR_TIMEOUT * (index))
-        timeout_function = HTMLDocument.Text(text=timeout_function_text)
+        timeout_function = HTMLDocument.TEXT_POOL.text(timeout_function_text)
 
         #append to send_xhr
         send_xhr.append(create_xhr_1)
@@ -317,7 +376,7 @@ class HtmlRequestBuilder(RequestBuilder):
 
         #set credentials required to true
         xhr_creds_text = XHR_WITH_CREDS_TEXT.format(index)
-        xhr_creds = HTMLDocument.Text(text=xhr_creds_text)
+        xhr_creds = HTMLDocument.TEXT_POOL.text(xhr_creds_text)
         send_xhr.append(xhr_creds)
     
         #then set the content-type header and other
@@ -326,17 +385,16 @@ class HtmlRequestBuilder(RequestBuilder):
             xhr_content_type_hdr_text = XHR_HDR_STMT_TEXT.format(index,
                                             'Content-Type',
                                             Encoder.encode_for_JS_data_values(req_content_type))
-            xhr_content_type_hdr = HTMLDocument.Text(text=xhr_content_type_hdr_text)
+            xhr_content_type_hdr = HTMLDocument.TEXT_POOL.text(xhr_content_type_hdr_text)
             send_xhr.append(xhr_content_type_hdr)
         
-        for header_statements in self._build_XHR_header_JS_snippets(xhr_index=index,
-                                                                request=request):
-            send_xhr.append(header_statements)
+        send_xhr.extend(self._build_XHR_header_JS_snippets(xhr_index=index,
+                                                           request=request))
         
         #append to send_xhr        
         send_xhr.append(timeout_function)
         #add an empty line
-        send_xhr.append(HTMLDocument.Text(text=' '))
+        send_xhr.append(HTMLDocument.TEXT_POOL.text(' '))
 
     def _build_form(self, id=1, request=None):
         """
@@ -374,20 +432,26 @@ class HtmlRequestBuilder(RequestBuilder):
         #post_parameters = QueryDict(settings=Settings.default)
         #Add post params and other files as part of the multipart request
         #add all the post_parameters as input elements
+        input_elements = []
         for param, value in post_parameters.items():
             if req_content_type == "multipart/form-data":
                 value = value['data']
             input_element = HTMLDocument.Input(name=param, _type=HTMLDocument.Input.Type.hidden, value=value)
-            form.append(input_element)
+            input_elements.append(input_element)
+        #and add them all at once
+        form.extend(input_elements)
 
         #build the multipart/form-data part of the request
         files = request.FILES
         
         #build the file input elements
+        file_input_elements = []
         for index, param_name in enumerate(files):
             #add the getFile function during the first iteration
             if index == 0:
-                form.append(self._build_get_file_JS_function())
+                get_file_script = HTMLDocument.Script()
+                get_file_script.append(self._build_get_file_JS_function())
+                file_input_elements.append(get_file_script)
 
             #create file input element and append to form
             file_input_attrs = {
@@ -395,8 +459,9 @@ class HtmlRequestBuilder(RequestBuilder):
             }
             file_input_element = HTMLDocument.Input(name=param_name,
                 _type=HTMLDocument.Input.Type.file, attrs=file_input_attrs)
-            form.append(file_input_element)
-            form.append(HTMLDocument.BR())
+            file_input_elements.append(file_input_element)
+            file_input_elements.append(HTMLDocument.BR())
+        form.extend(file_input_elements)
         
         #handle text/plain content
         if req_content_type == 'text/plain':
@@ -411,11 +476,16 @@ class HtmlRequestBuilder(RequestBuilder):
             form.append(text_plain_input_element)
 
         #construct JS statements to assign files to their input elements
+        file_JS_elements = []
         for index, param_name in enumerate(files):
             file_object = files[param_name]
             file_JS_element = self._build_multipart_file_js_snippet(file_index=index, multipart_file=file_object)
-            #append to the form
-            form.append(file_JS_element)
+            if file_JS_element is not None:
+                file_script = HTMLDocument.Script()
+                file_script.append(file_JS_element)
+                file_JS_elements.append(file_script)
+        #append to the form
+        form.extend(file_JS_elements)
 
         #add the submit button
         form.append(HTMLDocument.BR())
@@ -447,7 +517,8 @@ class HtmlRequestBuilder(RequestBuilder):
 
     def _build_multipart_file_js_snippet(self, file_index = 0, multipart_file=None, xhr=False):
         """
-        Builds multipart JS snippet statements.
+        Builds multipart JS snippet statements and returns them in a
+        fragment.
 
         Builds statements like,
         var filex_encoded = 'b64encoded_file_content';
@@ -466,7 +537,7 @@ class HtmlRequestBuilder(RequestBuilder):
         content_type = multipart_file.content_type
 
         #generate JS statements for files
-        file_JS_element = HTMLDocument.Script()
+        file_JS_element = HTMLDocument.Fragment()
         encoded_file_name = MULTI_PART_ENCODED_FILE_NAME.format(file_index)
         decoded_file_name = MULTI_PART_DECODED_FILE_NAME.format(file_index)
         encoded_assignment_text = MULTI_PART_FILE_JS_ENCODED_STMT.format(encoded_file_name, base64_file_content)
@@ -491,38 +562,43 @@ class HtmlRequestBuilder(RequestBuilder):
                                         decoded_file_name, Encoder.encode_for_JS_data_values(file_name))
         
         #create text elements
-        encoded_assignment_stmt = HTMLDocument.Text(text=encoded_assignment_text)
-        decoded_assignment_stmt = HTMLDocument.Text(text=decoded_assignment_text)
-        file_input_assignment_stmt = HTMLDocument.Text(text=file_input_assignment_text)
+        encoded_assignment_stmt = HTMLDocument.TEXT_POOL.text(encoded_assignment_text)
+        decoded_assignment_stmt = HTMLDocument.TEXT_POOL.text(decoded_assignment_text)
+        file_input_assignment_stmt = HTMLDocument.TEXT_POOL.text(file_input_assignment_text)
 
-        #add it to the script element
+        #add it to the fragment
         file_JS_element.append(encoded_assignment_stmt)
         file_JS_element.append(decoded_assignment_stmt)
         file_JS_element.append(file_input_assignment_stmt)
 
         return file_JS_element
     
-    def _build_get_file_JS_function(self):
+    @classmethod
+    @shared
+    def _build_get_file_JS_function(cls):
         """
         Builds the getFile JS function that returns
         DataTransfer.files created for the file.
+
+        Returns a Mount of a fragment with the function's statements,
+        which is built once and shared by all the DOMs.
         """
-        get_file_script_element = HTMLDocument.Script()
+        get_file_script_element = HTMLDocument.Fragment()
         #create text elements for the JS statements
-        func_hdr = HTMLDocument.Text(text=GET_FILES_FUNCTION_HEADER)
-        func_stmt1 = HTMLDocument.Text(text=JS_COMMENT)
-        func_stmt2 = HTMLDocument.Text(text=DATA_TRANSFER_JS_CLIPBOARD_STMT)
-        func_stmt3 = HTMLDocument.Text(text=DATA_TRANSFER_JS_STMT)
-        func_if_condn = HTMLDocument.Text(text=IF_CONDN)
-        func_if_true = HTMLDocument.Text(text=IF_TRUE)
+        func_hdr = HTMLDocument.TEXT_POOL.text(GET_FILES_FUNCTION_HEADER)
+        func_stmt1 = HTMLDocument.TEXT_POOL.text(JS_COMMENT)
+        func_stmt2 = HTMLDocument.TEXT_POOL.text(DATA_TRANSFER_JS_CLIPBOARD_STMT)
+        func_stmt3 = HTMLDocument.TEXT_POOL.text(DATA_TRANSFER_JS_STMT)
+        func_if_condn = HTMLDocument.TEXT_POOL.text(IF_CONDN)
+        func_if_true = HTMLDocument.TEXT_POOL.text(IF_TRUE)
         func_if_true.setup(parent=func_if_condn)
-        func_else = HTMLDocument.Text(text=ELSE_STMT)
-        func_if_false = HTMLDocument.Text(text=IF_FALSE)
+        func_else = HTMLDocument.TEXT_POOL.text(ELSE_STMT)
+        func_if_false = HTMLDocument.TEXT_POOL.text(IF_FALSE)
         func_if_false.setup(parent=func_else)
-        func_return = HTMLDocument.Text(text=RETURN_STMT)
-        func_footer = HTMLDocument.Text(text=GET_FILES_FUNCTION_FOOTER)
+        func_return = HTMLDocument.TEXT_POOL.text(RETURN_STMT)
+        func_footer = HTMLDocument.TEXT_POOL.text(GET_FILES_FUNCTION_FOOTER)
 
-        #add them to the script element
+        #add them to the fragment
         get_file_script_element.append(func_hdr)
         get_file_script_element.append(func_stmt1)
         get_file_script_element.append(func_stmt2)
@@ -549,7 +625,7 @@ class HtmlRequestBuilder(RequestBuilder):
             snippet = AUTO_SUBMIT_JS_STMT_TEMPLATE.format(Encoder.encode_for_JS_data_values(form_ref),
                                                             timeout * 1000)
             # create a Text element for each snippet so that it's easy to format them
-            snippet_element = HTMLDocument.Text(text=snippet)
+            snippet_element = HTMLDocument.TEXT_POOL.text(snippet)
             #timeout is a cumulative value
             timeout += 3
             script_snippet.append(snippet_element)
@@ -595,7 +671,7 @@ class HtmlRequestBuilder(RequestBuilder):
             xhr_header_text = XHR_HDR_STMT_TEXT.format(xhr_index,
                                         Encoder.encode_for_JS_data_values(header),
                                         Encoder.encode_for_JS_data_values(value))
-            xhr_header = HTMLDocument.Text(text=xhr_header_text)
+            xhr_header = HTMLDocument.TEXT_POOL.text(xhr_header_text)
             xhr_header_statements.append(xhr_header)
 
         return xhr_header_statements
@@ -617,73 +693,80 @@ class HtmlRequestBuilder(RequestBuilder):
         
         return post_data
 
-    def _build_create_XHR_function(self):
+    @classmethod
+    @shared
+    def _build_create_XHR_function(cls):
         """
         Create XHR function, createCORSRequest().
+
+        Returns a Mount of the function, which is built once and shared.
         """
-        script_holder_element = HTMLDocument.Script()
+        script_holder_element = HTMLDocument.Fragment()
 
-        create_cors_req = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_HDR)
+        create_cors_req = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_HDR)
 
         #statemt 1
-        create_cors_req_stmt_1 = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_STMT_1)
+        create_cors_req_stmt_1 = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_STMT_1)
 
         #if stmt 1
-        create_cors_req_if_1 = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_1)
-        create_cors_req_if_1.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_1_STMT_1))
-        create_cors_req_if_1.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_1_STMT_2))
-        create_cors_req_if_1.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_1_STMT_3))
+        create_cors_req_if_1 = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_1)
+        create_cors_req_if_1.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_1_STMT_1))
+        create_cors_req_if_1.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_1_STMT_2))
+        create_cors_req_if_1.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_1_STMT_3))
 
         #if stmt 2
-        script_holder_element_temp = HTMLDocument.Script()
-        create_cors_req_if_2 = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2)
-        create_cors_req_if_2.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2_STMT_1))
-        create_cors_req_if_2.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2_STMT_2))
-        create_cors_req_if_2.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2_STMT_3))
-        create_cors_req_if_2.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2_STMT_4))
+        script_holder_element_temp = HTMLDocument.Fragment()
+        create_cors_req_if_2 = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2)
+        create_cors_req_if_2.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2_STMT_1))
+        create_cors_req_if_2.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2_STMT_2))
+        create_cors_req_if_2.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2_STMT_3))
+        create_cors_req_if_2.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2_STMT_4))
         script_holder_element_temp.append(create_cors_req_if_2)
-        script_holder_element_temp.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_2_STMT_5))
+        script_holder_element_temp.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_2_STMT_5))
 
         #if stmt 3
-        create_cors_req_if_3 = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_3)
-        create_cors_req_if_3.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_3_STMT_1))
-        create_cors_req_if_3.append(HTMLDocument.Text(text=CREATE_XHR_FUNCTION_IF_3_STMT_2))
+        create_cors_req_if_3 = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_3)
+        create_cors_req_if_3.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_3_STMT_1))
+        create_cors_req_if_3.append(HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_IF_3_STMT_2))
 
         #return stmt
-        create_cors_req_return_stmt = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_RETURN_STMT)
+        create_cors_req_return_stmt = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_RETURN_STMT)
 
         #footer
-        create_cors_req_footer = HTMLDocument.Text(text=CREATE_XHR_FUNCTION_FOOTER)
+        create_cors_req_footer = HTMLDocument.TEXT_POOL.text(CREATE_XHR_FUNCTION_FOOTER)
 
         #add the statements to create_cors_req
         create_cors_req.append(create_cors_req_stmt_1)
         create_cors_req.append(create_cors_req_if_1)
         create_cors_req.append(script_holder_element_temp)
-        script_holder_element_temp.unwrap()
         create_cors_req.append(create_cors_req_if_3)
         create_cors_req.append(create_cors_req_return_stmt)
 
-        #add it to script element
+        #add it to the fragment
         script_holder_element.append(create_cors_req)
         script_holder_element.append(create_cors_req_footer)
 
         return script_holder_element
 
-    def _build_XHR_load_in_new_tab_function(self):
+    @classmethod
+    @shared
+    def _build_XHR_load_in_new_tab_function(cls):
         """
         Build function loadInNewTab(data) function.
+
+        Returns a Mount of the function, which is built once and shared.
         """
 
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
 
         #create Text elements
-        load_in_new_tab_function = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_HDR)
-        load_in_new_tab_stmt_1 = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_1)
-        load_in_new_tab_stmt_2 = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_2)
-        load_in_new_tab_stmt_3 = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_3)
-        load_in_new_tab_stmt_4 = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_4)
-        load_in_new_tab_stmt_5 = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_5)
-        load_in_new_tab_function_footer = HTMLDocument.Text(text=FUNCTION_LOAD_IN_NEW_TAB_FOOTER)
+        load_in_new_tab_function = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_HDR)
+        load_in_new_tab_stmt_1 = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_1)
+        load_in_new_tab_stmt_2 = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_2)
+        load_in_new_tab_stmt_3 = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_3)
+        load_in_new_tab_stmt_4 = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_4)
+        load_in_new_tab_stmt_5 = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_5)
+        load_in_new_tab_function_footer = HTMLDocument.TEXT_POOL.text(FUNCTION_LOAD_IN_NEW_TAB_FOOTER)
 
         #add statements to load_in_new_tab_function
         load_in_new_tab_function.append(load_in_new_tab_stmt_1)
@@ -692,40 +775,45 @@ class HtmlRequestBuilder(RequestBuilder):
         load_in_new_tab_function.append(load_in_new_tab_stmt_4)
         load_in_new_tab_function.append(load_in_new_tab_stmt_5)
 
-        #add to holder script
+        #add to holder fragment
         holder_script.append(load_in_new_tab_function)
         holder_script.append(load_in_new_tab_function_footer)
 
         #print holder_script.generate()
 
-        #return the holder script
+        #return the holder fragment
         return holder_script
 
-    def _build_create_onreadystatechange_function(self, target_type=None):
+    @classmethod
+    @shared
+    def _build_create_onreadystatechange_function(cls, target_type=None):
         """
         Create the onreadystatechangeTrigger() function.
+
+        Returns a Mount of the function, which is built once for each
+        target_type and shared.
         """
 
-        script_holder_element = HTMLDocument.Script()
+        script_holder_element = HTMLDocument.Fragment()
 
         #onreadystatechange trigger
-        onreadystatechangetrigger_function = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_HDR)
+        onreadystatechangetrigger_function = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_HDR)
 
         #set the data statement
-        onreadystatechangetrigger_function.append(HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_STMT_1))
+        onreadystatechangetrigger_function.append(HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_STMT_1))
 
         #if_1
-        onreadystatechangetrigger_if_start = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_START)
-        onreadystatechangetrigger_if_end = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_END)
+        onreadystatechangetrigger_if_start = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_START)
+        onreadystatechangetrigger_if_end = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_END)
 
         #if_if_1
-        onreadystatechangetrigger_if_if_1 = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_1)
-        onreadystatechangetrigger_if_if_1_stmt = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_1_STMT)
+        onreadystatechangetrigger_if_if_1 = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_1)
+        onreadystatechangetrigger_if_if_1_stmt = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_1_STMT)
         onreadystatechangetrigger_if_if_1.append(onreadystatechangetrigger_if_if_1_stmt)
 
         #if_if_2
-        onreadystatechangetrigger_if_if_2 = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_2)
-        onreadystatechangetrigger_if_if_2_stmt = HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_2_STMT)
+        onreadystatechangetrigger_if_if_2 = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_2)
+        onreadystatechangetrigger_if_if_2_stmt = HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_IF_1_IF_2_STMT)
         onreadystatechangetrigger_if_if_2.append(onreadystatechangetrigger_if_if_2_stmt)
 
         #add sub if's to main if
@@ -735,29 +823,29 @@ class HtmlRequestBuilder(RequestBuilder):
         #set whether iframe or new tab
         if target_type == TargetType.iframe:
             #iframe reference code
-            iframe_reference_snippet = HTMLDocument.Text(text=IFRAME_REF_STMT_TEXT)
+            iframe_reference_snippet = HTMLDocument.TEXT_POOL.text(IFRAME_REF_STMT_TEXT)
             onreadystatechangetrigger_function.append(iframe_reference_snippet)
-            onreadystatechangetrigger_if_start.append(HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_IFRAME))
+            onreadystatechangetrigger_if_start.append(HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_IFRAME))
         elif target_type == TargetType.new_tab:
-            onreadystatechangetrigger_if_start.append(HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_NEW_TAB))
+            onreadystatechangetrigger_if_start.append(HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_NEW_TAB))
         elif target_type == TargetType.same_page:
-            onreadystatechangetrigger_if_start.append(HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_SAME_PAGE))
+            onreadystatechangetrigger_if_start.append(HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_TARGET_STMT_SAME_PAGE))
         
         #add main if to function
         onreadystatechangetrigger_function.append(onreadystatechangetrigger_if_start)
         onreadystatechangetrigger_function.append(onreadystatechangetrigger_if_end)
 
-        #add function to script holder
+        #add function to holder fragment
         script_holder_element.append(onreadystatechangetrigger_function)
-        script_holder_element.append(HTMLDocument.Text(text=XHR_ONREADYSTATECHANGE_FUNCTION_FOOTER))
+        script_holder_element.append(HTMLDocument.TEXT_POOL.text(XHR_ONREADYSTATECHANGE_FUNCTION_FOOTER))
 
         return script_holder_element
 
     def _build_XHR_auto_submit_JS_snippet(self):
-        script_holder_element = HTMLDocument.Script()
+        script_holder_element = HTMLDocument.Fragment()
 
         auto_submit_text = XHR_SEND_TIMEOUT.format(SEND_XHR_FUNCTION_NAME+"()", 2000)
-        auto_submit = HTMLDocument.Text(text=auto_submit_text)
+        auto_submit = HTMLDocument.TEXT_POOL.text(auto_submit_text)
         script_holder_element.append(auto_submit)
 
         return script_holder_element
\ No newline at end of file
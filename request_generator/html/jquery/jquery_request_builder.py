@@ -4,6 +4,9 @@ from ..js_statements_template import MULTI_PART_ENCODED_FILE_NAME, MULTI_PART_DE
 from ..xhr_js_template import FORM_DATA_API_TEXT, XHR_FILE_ASSIGNMENT_STMT_1, XHR_FILE_ASSIGNMENT_STMT_2, FORM_DATA_FILE_APPEND_TEXT, FORM_DATA_PARAM_APPEND_TEXT
 
 from ..html_request_builder import HtmlRequestBuilder, TargetType
+from request_generator.dom.array_tree import ArrayTree
+from request_generator.dom.interner import SubtreeInterner
+from request_generator.dom.prototype import shared
 from request_parser.http.request import HttpRequest
 
 from jquery_js_template import *
@@ -16,9 +19,18 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
     def __init__(self, requests=[]):
         super(JQueryRequestBuilder, self).__init__(requests=requests)
 
-    def build(self, type=2, target_type=TargetType.iframe, auto_submit=False):
-        self.request_dom = self.build_ajax_requests(target_type=target_type,
-                                                    auto_submit=auto_submit)
+    def build(self, type=2, target_type=TargetType.iframe, auto_submit=False,
+              compact=False, intern_subtrees=False):
+        html_dom = self.build_ajax_requests(target_type=target_type,
+                                            auto_submit=auto_submit)
+        if intern_subtrees and html_dom is not None:
+            SubtreeInterner().intern(html_dom)
+        if compact and html_dom is not None:
+            tag_dom = html_dom
+            html_dom = ArrayTree.from_tag(tag_dom)
+            #the tags were copied, their Text tags can be reused
+            HTMLDocument.TEXT_POOL.recycle(tag_dom)
+        self.request_dom = html_dom
 
     def generate(self):
         if self.request_dom is None:
@@ -51,8 +63,8 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         #Build jQuery template
         #build jQuery on ready block
         jquery_main_block_script = HTMLDocument.Script()
-        jquery_main_block = HTMLDocument.Text(text=JQUERY_DOCUMENT_ONREADY_HDR)
-        jquery_main_block_footer = HTMLDocument.Text(text=JQUERY_DOCUMENT_ONREADY_FOOTER)
+        jquery_main_block = HTMLDocument.TEXT_POOL.text(JQUERY_DOCUMENT_ONREADY_HDR)
+        jquery_main_block_footer = HTMLDocument.TEXT_POOL.text(JQUERY_DOCUMENT_ONREADY_FOOTER)
         
         #setup the target
         jquery_success_function = None
@@ -68,13 +80,12 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         else:
             load_in_new_tab_function = self._build_XHR_load_in_new_tab_function()
             jquery_main_block_script.append(load_in_new_tab_function)
-            load_in_new_tab_function.unwrap()
             jquery_success_function = self._build_success_function()
 
         if auto_submit:
             holder_script = HTMLDocument.Script()
             click_button_txt = JQUERY_CLICK_BUTTON.format(submit_button['id'])
-            timeout_text = HTMLDocument.Text(text=AJAX_REQUEST_TIMEOUT.format(click_button_txt, 500))
+            timeout_text = HTMLDocument.TEXT_POOL.text(AJAX_REQUEST_TIMEOUT.format(click_button_txt, 500))
             holder_script.append(timeout_text)
             html_dom.body[0].append(holder_script)
 
@@ -83,21 +94,19 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
 
         #add the success function to the main block
         jquery_main_block.append(jquery_success_function)
-        jquery_success_function.unwrap()
 
         #build the submitAjaxRequest function
         submit_ajax_request = self._build_submit_ajax_request_function()
         
         #add the submitAjaxRequest element to the main block
         jquery_main_block.append(submit_ajax_request)
-        submit_ajax_request.unwrap()
 
         #create the event binding snippet and add to the main jQuery block
-        jquery_submit_bind_block = HTMLDocument.Script()
+        jquery_submit_bind_block = HTMLDocument.Fragment()
         jquery_submit_bind_function_text = AJAX_SUBMIT_BUTTON_BIND_HDR.format(submit_button['id'])
-        jquery_submit_bind_function = HTMLDocument.Text(text=jquery_submit_bind_function_text)
+        jquery_submit_bind_function = HTMLDocument.TEXT_POOL.text(jquery_submit_bind_function_text)
         jquery_submit_bind_block.append(jquery_submit_bind_function)
-        jquery_submit_bind_function_footer = HTMLDocument.Text(text=AJAX_SUBMIT_BUTTON_BIND_FOOTER)
+        jquery_submit_bind_function_footer = HTMLDocument.TEXT_POOL.text(AJAX_SUBMIT_BUTTON_BIND_FOOTER)
 
         #create jQuery statements/snippet blocks for each request
         get_file_script_added = False
@@ -112,10 +121,9 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
 
             #append the block to the submit bind block
             jquery_submit_bind_function.append(jquery_request_block)
-            jquery_request_block.unwrap()
 
             #add an empty line
-            jquery_submit_bind_function.append(HTMLDocument.Text())
+            jquery_submit_bind_function.append(HTMLDocument.TEXT_POOL.text())
 
         #add the jQuery source snippet to the head
         html_dom.head[0].append(jquery_src_script)
@@ -123,7 +131,6 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         #add the submit button binding block to the main jquery block
         jquery_submit_bind_block.append(jquery_submit_bind_function_footer)
         jquery_main_block.append(jquery_submit_bind_block)
-        jquery_submit_bind_block.unwrap()
 
         #complete the main block
         jquery_main_block_script.append(jquery_main_block)
@@ -156,44 +163,45 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
 
         post_data = None
         get_file_script = None
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
         # if the content-type is multipart/form-data
         if req_content_type == "multipart/form-data":
             form_data_obj_text = FORM_DATA_API_TEXT.format(index)
-            form_data_obj = HTMLDocument.Text(text=form_data_obj_text)
+            form_data_obj = HTMLDocument.TEXT_POOL.text(form_data_obj_text)
             holder_script.append(form_data_obj)
 
             #build JS statements for files
             for file_index, param_name in enumerate(files):
                 #add the getFile function during the first iteration
                 if file_index == 0:
-                    get_file_script = self._build_get_file_JS_function()
+                    get_file_script = HTMLDocument.Script()
+                    get_file_script.append(self._build_get_file_JS_function())
 
-                #get a script element that contains the JS statements
+                #get a fragment that contains the JS statements
                 file_JS_element = self._build_multipart_file_js_snippet(file_index=file_index,
                                         multipart_file=files[param_name],xhr=True)
-                #add the received element
+                #add the received statements
                 holder_script.append(file_JS_element)
-                #and unwrap it
-                if file_JS_element is not None:
-                    file_JS_element.unwrap()
 
                 #build the statement to add file{} object to the
                 #formData object
                 form_data_file_append_text = FORM_DATA_FILE_APPEND_TEXT.format(index, param_name, file_index)
-                form_data_file_append = HTMLDocument.Text(text=form_data_file_append_text)
+                form_data_file_append = HTMLDocument.TEXT_POOL.text(form_data_file_append_text)
                 holder_script.append(form_data_file_append)
             
             #build JS statements to add POST params to
             #the formdata object
+            form_data_param_appends = []
             for param_name, value in post_parameters.items():
                 if req_content_type == "multipart/form-data":
                     value = value['data']
                 form_data_param_append_text = FORM_DATA_PARAM_APPEND_TEXT.format(index,
                                                     Encoder.encode_for_JS_data_values(param_name),
                                                     Encoder.encode_for_JS_data_values(value))
-                form_data_param_append = HTMLDocument.Text(text=form_data_param_append_text)
-                holder_script.append(form_data_param_append)
+                form_data_param_append = HTMLDocument.TEXT_POOL.text(form_data_param_append_text)
+                form_data_param_appends.append(form_data_param_append)
+            #and add them all at once
+            holder_script.extend(form_data_param_appends)
         elif req_content_type == "text/plain":
             post_data = request.body()
         # if the content-type is something else
@@ -219,61 +227,64 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         
         #append to holder_script
         holder_script.append(request_submit_statements)
-        request_submit_statements.unwrap()
 
         return holder_script, get_file_script
 
-    def _build_submit_ajax_request_function(self):
+    @classmethod
+    @shared
+    def _build_submit_ajax_request_function(cls):
         """
         Build the const submitAjaxRequest = .... block.
+
+        Returns a Mount of the block, which is built once and shared.
         """
 
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
 
-        submit_ajax_req_hdr = HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_HDR)
-        submit_ajax_req_1 = HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_IF_1_START)
-        submit_ajax_req_1_1 = HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_IF_1_STMT_1)
-        submit_ajax_req_1_2 = HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_IF_1_STMT_2)
+        submit_ajax_req_hdr = HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_HDR)
+        submit_ajax_req_1 = HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_IF_1_START)
+        submit_ajax_req_1_1 = HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_IF_1_STMT_1)
+        submit_ajax_req_1_2 = HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_IF_1_STMT_2)
         submit_ajax_req_1.append(submit_ajax_req_1_1)
         submit_ajax_req_1.append(submit_ajax_req_1_2)
 
         submit_ajax_req_hdr.append(submit_ajax_req_1)
-        submit_ajax_req_hdr.append(HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_IF_1_END))
+        submit_ajax_req_hdr.append(HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_IF_1_END))
 
         #add the ajax block
-        ajax_block = self._build_ajax_block()
+        ajax_block = cls._build_ajax_block()
         submit_ajax_req_hdr.append(ajax_block)
-        ajax_block.unwrap()
 
         holder_script.append(submit_ajax_req_hdr)
-        holder_script.append(HTMLDocument.Text(text=SUBMIT_AJAX_REQUEST_FOOTER))
+        holder_script.append(HTMLDocument.TEXT_POOL.text(SUBMIT_AJAX_REQUEST_FOOTER))
 
         return holder_script
 
-    def _build_ajax_block(self):
+    @classmethod
+    def _build_ajax_block(cls):
         """
-        Builds and returns a holder script
+        Builds and returns a holder fragment
         containing the $.ajax({}) block.                
         """
 
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
 
-        ajax_block_hdr = HTMLDocument.Text(text=AJAX_BLOCK_HDR)
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_URL))
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_TYPE))
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_DATA))
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_CONTENT_TYPE))
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_PROCESS_DATA))
-        ajax_block_hdr.append(HTMLDocument.Text(text=AJAX_BLOCK_SUCCESS))
+        ajax_block_hdr = HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_HDR)
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_URL))
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_TYPE))
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_DATA))
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_CONTENT_TYPE))
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_PROCESS_DATA))
+        ajax_block_hdr.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_SUCCESS))
         
         holder_script.append(ajax_block_hdr)
-        holder_script.append(HTMLDocument.Text(text=AJAX_BLOCK_FOOTER))
+        holder_script.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_FOOTER))
 
         return holder_script
 
     def _build_success_function(self, iframe=None):
         """
-        Builds and returns a holder script
+        Builds and returns a holder fragment
         containing the successFunction for the ajax
         request.
 
@@ -281,21 +292,21 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         response.
         """
 
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
 
-        success_function_hdr = HTMLDocument.Text(text=AJAX_BLOCK_SUCCESS_FUNCTION_HDR)
+        success_function_hdr = HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_SUCCESS_FUNCTION_HDR)
         success_function_stmt_txt = ''
         if iframe is not None:
             success_function_stmt_txt = AJAX_BLOCK_SUCCESS_FUNCTION_IFRAME_SRC_SET.format(iframe)
         else:
             success_function_stmt_txt = AJAX_BLOCK_SUCCESS_FUNCTION_NEW_TAB_CALL
-        success_function_stmt = HTMLDocument.Text(text=success_function_stmt_txt)
+        success_function_stmt = HTMLDocument.TEXT_POOL.text(success_function_stmt_txt)
         #append statement
         success_function_hdr.append(success_function_stmt)
 
         #append to holder script
         holder_script.append(success_function_hdr)
-        holder_script.append(HTMLDocument.Text(text=AJAX_BLOCK_SUCCESS_FUNCTION_FOOTER))
+        holder_script.append(HTMLDocument.TEXT_POOL.text(AJAX_BLOCK_SUCCESS_FUNCTION_FOOTER))
 
         return holder_script
 
@@ -305,10 +316,10 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         Builds and returns the jQuery JS statements that construct a request and call
         submitAjaxRequest.
 
-        Returns a holder script with these.
+        Returns a holder fragment with these.
         """
 
-        holder_script = HTMLDocument.Script()
+        holder_script = HTMLDocument.Fragment()
         
         url_text = AJAX_REQUEST_URL_STMT.format(index, url)
         method_text = AJAX_REQUEST_METHOD_STMT.format(index, method)
@@ -322,10 +333,10 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
             data_text = AJAX_REQUEST_DATA_STMT_OBJ.format(index, data)
         
         #build the text elements
-        url_stmt = HTMLDocument.Text(text=url_text)
-        method_stmt = HTMLDocument.Text(text=method_text)
-        content_type_stmt = HTMLDocument.Text(text=content_type_text)
-        data_stmt  = HTMLDocument.Text(text=data_text)
+        url_stmt = HTMLDocument.TEXT_POOL.text(url_text)
+        method_stmt = HTMLDocument.TEXT_POOL.text(method_text)
+        content_type_stmt = HTMLDocument.TEXT_POOL.text(content_type_text)
+        data_stmt  = HTMLDocument.TEXT_POOL.text(data_text)
 
         #add to holder script
         holder_script.append(url_stmt)
@@ -338,10 +349,10 @@ class JQueryRequestBuilder(HtmlRequestBuilder):
         if time_out is not None:
             timeout_text = AJAX_REQUEST_TIMEOUT.format(submit_request_function_call_text,
                             time_out)
-            timeout_stmt = HTMLDocument.Text(text=timeout_text)
+            timeout_stmt = HTMLDocument.TEXT_POOL.text(timeout_text)
             holder_script.append(timeout_stmt)
         else:
-            submit_request_function_call = HTMLDocument.Text(text=submit_request_function_call_text)
+            submit_request_function_call = HTMLDocument.TEXT_POOL.text(submit_request_function_call_text)
             holder_script.append(submit_request_function_call)
                 
         return holder_script
@@ -1,6 +1,7 @@
 import unittest
 from os import path
 from os import mkdir
+from StringIO import StringIO
 
 from request_generator.utils.utils import get_abs_path
 from request_parser.http.request import HttpRequest
@@ -295,6 +296,11 @@ class HtmlRequestBuilderTest(unittest.TestCase):
                                 auto_submit=True)
         #generate DOM code
         csrf_POC_code = dom.generate()
+        #streamed in small chunks
+        stream = StringIO()
+        dom.generate_to(stream, chunk_size=256)
+        self.assertEqual(stream.getvalue(), csrf_POC_code.encode('utf-8'))
+        self.assertEqual(dom.generate_bytes(), csrf_POC_code.encode('utf-8'))
         #generate file name
         file_name = request_file_name+"_iframe.html"
         self.generate_and_write(dom=dom, file_name=file_name)
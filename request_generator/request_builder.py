@@ -1,4 +1,5 @@
 from request_parser.http.request import HttpRequest
+from .dom.tag import Tag
 
 class RequestBuilder(object):
     """
@@ -34,4 +35,29 @@ class RequestBuilder(object):
         """
         Code generation trigger method.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def generate_to(self, *args, **kwargs):
+        """
+        Code generation trigger method that writes the code to a sink
+        instead of returning it.
+        """
+        pass
+
+    def generate_bytes(self, *args, **kwargs):
+        """
+        Code generation trigger method that returns the encoded code.
+        """
+        pass
+
+    def release(self):
+        """
+        Drops the DOM built for the requests, tearing it down so that it's
+        freed right away instead of by the cyclic garbage collector.
+        """
+
+        request_dom = self.request_dom
+        self.request_dom = None
+        #an ArrayTree holds no reference cycles
+        if isinstance(request_dom, Tag):
+            request_dom.dispose()
\ No newline at end of file